@@ -3,12 +3,16 @@ Create DynamoDB Tables for Furnish Fusion
 Run this script to create all required DynamoDB tables in us-east-1
 """
 
+import os
+import time
 import boto3
 from botocore.exceptions import ClientError
 
 # Region
 REGION = 'us-east-1'
-dynamodb = boto3.client('dynamodb', region_name=REGION)
+# Optional endpoint for a local DynamoDB stand-in (e.g. DynamoDB Local or moto_server)
+ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL')
+dynamodb = boto3.client('dynamodb', region_name=REGION, endpoint_url=ENDPOINT_URL)
 
 # Table definitions
 TABLES = [
@@ -18,7 +22,17 @@ TABLES = [
             {'AttributeName': 'user_id', 'KeyType': 'HASH'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'user_id', 'AttributeType': 'S'}
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'email', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'email-index',
+                'KeySchema': [
+                    {'AttributeName': 'email', 'KeyType': 'HASH'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
         ],
         'BillingMode': 'PAY_PER_REQUEST'
     },
@@ -28,17 +42,31 @@ TABLES = [
             {'AttributeName': 'product_id', 'KeyType': 'HASH'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'product_id', 'AttributeType': 'S'}
+            {'AttributeName': 'product_id', 'AttributeType': 'S'},
+            {'AttributeName': 'category', 'AttributeType': 'S'},
+            {'AttributeName': 'price', 'AttributeType': 'N'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'category-price-index',
+                'KeySchema': [
+                    {'AttributeName': 'category', 'KeyType': 'HASH'},
+                    {'AttributeName': 'price', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
         ],
         'BillingMode': 'PAY_PER_REQUEST'
     },
     {
-        'TableName': 'FF_Cart',
+        'TableName': 'FF_Cart_Items',
         'KeySchema': [
-            {'AttributeName': 'cart_id', 'KeyType': 'HASH'}
+            {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'product_id', 'KeyType': 'RANGE'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'cart_id', 'AttributeType': 'S'}
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'product_id', 'AttributeType': 'S'}
         ],
         'BillingMode': 'PAY_PER_REQUEST'
     },
@@ -48,7 +76,28 @@ TABLES = [
             {'AttributeName': 'order_id', 'KeyType': 'HASH'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'order_id', 'AttributeType': 'S'}
+            {'AttributeName': 'order_id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'status', 'AttributeType': 'S'},
+            {'AttributeName': 'created_at', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'user_id-created_at-index',
+                'KeySchema': [
+                    {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'status-created_at-index',
+                'KeySchema': [
+                    {'AttributeName': 'status', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
         ],
         'BillingMode': 'PAY_PER_REQUEST'
     },
@@ -58,7 +107,60 @@ TABLES = [
             {'AttributeName': 'order_item_id', 'KeyType': 'HASH'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'order_item_id', 'AttributeType': 'S'}
+            {'AttributeName': 'order_item_id', 'AttributeType': 'S'},
+            {'AttributeName': 'order_id', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'order_id-index',
+                'KeySchema': [
+                    {'AttributeName': 'order_id', 'KeyType': 'HASH'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        'BillingMode': 'PAY_PER_REQUEST'
+    },
+    {
+        'TableName': 'FF_Notification_Outbox',
+        'KeySchema': [
+            {'AttributeName': 'notification_id', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'notification_id', 'AttributeType': 'S'}
+        ],
+        'BillingMode': 'PAY_PER_REQUEST'
+    },
+    {
+        'TableName': 'FF_Sales_Stats',
+        'KeySchema': [
+            {'AttributeName': 'kind', 'KeyType': 'HASH'},
+            {'AttributeName': 'bucket', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'kind', 'AttributeType': 'S'},
+            {'AttributeName': 'bucket', 'AttributeType': 'S'},
+            {'AttributeName': 'revenue', 'AttributeType': 'N'}
+        ],
+        'LocalSecondaryIndexes': [
+            {
+                'IndexName': 'kind-revenue-index',
+                'KeySchema': [
+                    {'AttributeName': 'kind', 'KeyType': 'HASH'},
+                    {'AttributeName': 'revenue', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        'BillingMode': 'PAY_PER_REQUEST'
+    },
+    {
+        'TableName': 'FF_Meta',
+        'KeySchema': [
+            {'AttributeName': 'meta_key', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'meta_key', 'AttributeType': 'S'}
         ],
         'BillingMode': 'PAY_PER_REQUEST'
     }
@@ -76,12 +178,148 @@ def create_table(table_def):
         return True
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceInUseException':
-            print(f"⚠️  Table {table_name} already exists. Skipping...")
-            return True
+            print(f"⚠️  Table {table_name} already exists. Checking indexes...")
+            return ensure_indexes(table_def)
         else:
             print(f"❌ Error creating table {table_name}: {e}")
             return False
 
+def ensure_indexes(table_def):
+    """Add any global secondary indexes missing from an existing table"""
+    table_name = table_def['TableName']
+    wanted = table_def.get('GlobalSecondaryIndexes', [])
+    if not wanted:
+        return True
+    
+    try:
+        description = dynamodb.describe_table(TableName=table_name)['Table']
+        existing = {gsi['IndexName'] for gsi in description.get('GlobalSecondaryIndexes', [])}
+        
+        for gsi in wanted:
+            if gsi['IndexName'] in existing:
+                continue
+            
+            # Only the attributes used by this index need to be declared
+            key_names = {key['AttributeName'] for key in gsi['KeySchema']}
+            attribute_definitions = [
+                attr for attr in table_def['AttributeDefinitions']
+                if attr['AttributeName'] in key_names
+            ]
+            
+            print(f"   Adding index {gsi['IndexName']} to {table_name}...")
+            dynamodb.update_table(
+                TableName=table_name,
+                AttributeDefinitions=attribute_definitions,
+                GlobalSecondaryIndexUpdates=[{'Create': gsi}]
+            )
+            # DynamoDB only allows one index to be created at a time
+            wait_for_indexes(table_name)
+            print(f"✅ Index {gsi['IndexName']} is active")
+        return True
+    except ClientError as e:
+        print(f"❌ Error updating indexes on {table_name}: {e}")
+        return False
+
+def wait_for_indexes(table_name, delay=5):
+    """Block until every index on the table has finished building"""
+    while True:
+        description = dynamodb.describe_table(TableName=table_name)['Table']
+        statuses = [gsi['IndexStatus'] for gsi in description.get('GlobalSecondaryIndexes', [])]
+        if all(status == 'ACTIVE' for status in statuses):
+            return
+        time.sleep(delay)
+
+def backfill_email_reservations():
+    """Reserve the email of every existing user so create_user can enforce uniqueness"""
+    table = boto3.resource('dynamodb', region_name=REGION, endpoint_url=ENDPOINT_URL).Table('FF_Users')
+    reserved = 0
+    scan_kwargs = {'ProjectionExpression': 'user_id, email'}
+    
+    while True:
+        response = table.scan(**scan_kwargs)
+        for user in response.get('Items', []):
+            if 'email' not in user:
+                continue
+            try:
+                table.put_item(
+                    Item={'user_id': f"EMAIL#{user['email']}", 'owner_id': user['user_id']},
+                    ConditionExpression='attribute_not_exists(user_id)'
+                )
+                reserved += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    print(f"✅ Reserved {reserved} existing user email(s)")
+
+# The original cart table was keyed by a random cart_id only
+LEGACY_CART_TABLE = 'FF_Cart'
+CART_TABLE = 'FF_Cart_Items'
+CART_SUMMARY_ID = '#summary'
+# FF_Meta item recording that the legacy cart was migrated
+LEGACY_CART_MIGRATED_KEY = 'legacy_cart_migrated'
+
+def migrate_legacy_cart():
+    """Copy rows from the cart_id keyed FF_Cart table into FF_Cart_Items, once.
+    Rows for the same user and product are merged by adding their quantities. A line
+    the new application already wrote is left alone, so items removed, checked out or
+    changed since are never brought back. Every user who gets lines has their cart
+    summary marked for re-pricing, so the badge and subtotal count the new lines."""
+    try:
+        dynamodb.describe_table(TableName=LEGACY_CART_TABLE)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return
+        raise
+    
+    resource = boto3.resource('dynamodb', region_name=REGION, endpoint_url=ENDPOINT_URL)
+    meta_table = resource.Table('FF_Meta')
+    if meta_table.get_item(Key={'meta_key': LEGACY_CART_MIGRATED_KEY}, ConsistentRead=True).get('Item'):
+        print(f"✅ {LEGACY_CART_TABLE} was already migrated")
+        return
+    legacy_table = resource.Table(LEGACY_CART_TABLE)
+    
+    quantities = {}
+    scan_kwargs = {}
+    while True:
+        response = legacy_table.scan(**scan_kwargs)
+        for row in response.get('Items', []):
+            key = (row['user_id'], row['product_id'])
+            quantities[key] = quantities.get(key, 0) + row.get('quantity', 0)
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    migrated = 0
+    for (user_id, product_id), quantity in quantities.items():
+        try:
+            # Same summary change as the application makes when it cannot price a cart change
+            dynamodb.transact_write_items(TransactItems=[
+                {'Put': {
+                    'TableName': CART_TABLE,
+                    'Item': {'user_id': {'S': user_id}, 'product_id': {'S': product_id}, 'quantity': {'N': str(quantity)}},
+                    'ConditionExpression': 'attribute_not_exists(product_id)'
+                }},
+                {'Update': {
+                    'TableName': CART_TABLE,
+                    'Key': {'user_id': {'S': user_id}, 'product_id': {'S': CART_SUMMARY_ID}},
+                    'UpdateExpression': 'ADD revision :one REMOVE catalog_version',
+                    'ExpressionAttributeValues': {':one': {'N': '1'}}
+                }}
+            ])
+            migrated += 1
+        except ClientError as e:
+            reasons = e.response.get('CancellationReasons', [])
+            if not (reasons and reasons[0].get('Code') == 'ConditionalCheckFailed'):
+                raise
+    
+    meta_table.put_item(Item={'meta_key': LEGACY_CART_MIGRATED_KEY, 'lines': migrated})
+    print(f"✅ Migrated {migrated} of {len(quantities)} cart line(s) from {LEGACY_CART_TABLE} to {CART_TABLE}")
+    print(f"   Once the new application is deployed, {LEGACY_CART_TABLE} can be deleted.")
+
 def main():
     """Create all tables"""
     print("=" * 60)
@@ -101,6 +339,8 @@ def main():
     print("=" * 60)
     
     if success_count == len(TABLES):
+        backfill_email_reservations()
+        migrate_legacy_cart()
         print("\n🎉 All tables are ready!")
         print("\nNext steps:")
         print("1. Create SNS topic: aws sns create-topic --name furnish-fusion-orders --region us-east-1")
@@ -33,7 +33,12 @@ Environment="SECRET_KEY=CHANGE_THIS_IN_PRODUCTION"
 Environment="AWS_REGION=us-east-1"
 Environment="SNS_TOPIC_ARN=YOUR_SNS_TOPIC_ARN"
 Environment="DEBUG=False"
-ExecStart=/usr/local/bin/gunicorn --bind 0.0.0.0:8000 --workers 4 aws_app:app
+# Per-worker metric snapshots for /metrics; systemd empties /run/furnish-fusion on every restart
+RuntimeDirectory=furnish-fusion
+Environment="METRICS_DIR=/run/furnish-fusion/metrics"
+# Bind address and workers come from gunicorn.conf.py; SERVING_MODE=async switches to gevent workers
+Environment="SERVING_MODE=sync"
+ExecStart=/usr/local/bin/gunicorn aws_app:app
 Restart=always
 
 [Install]
@@ -0,0 +1,267 @@
+"""
+Schema Migrations for Furnish Fusion
+Brings the FF_* tables up to the latest schema version while the app keeps running.
+
+Every migration has a version number and runs once; the highest applied version
+is recorded in FF_Meta under 'schema_version'. A migration may create tables, add
+global secondary indexes (waiting until they are ACTIVE) and copy or reshape items
+with throttled parallel scans and batch writes. Copies save a checkpoint in FF_Meta
+after every page, so an interrupted run continues where it stopped.
+    python migrate.py                    # apply every pending migration
+    python migrate.py --status           # show the applied and pending migrations
+    python migrate.py --read-capacity 100 --write-capacity 50
+
+Set DYNAMODB_ENDPOINT_URL to migrate a local stand-in (DynamoDB Local or moto_server).
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.exceptions import ClientError
+
+from create_dynamodb_tables import TABLES, backfill_email_reservations, migrate_legacy_cart
+
+# The scan engine lives with the app's storage code, one directory up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import RateLimiter, scan_pages, parallel_scan, SCAN_SEGMENTS
+
+# Region
+REGION = 'us-east-1'
+# Optional endpoint for a local DynamoDB stand-in (e.g. DynamoDB Local or moto_server)
+ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL')
+dynamodb = boto3.client('dynamodb', region_name=REGION, endpoint_url=ENDPOINT_URL)
+
+META_TABLE = 'FF_Meta'
+SCHEMA_VERSION_KEY = 'schema_version'
+
+# boto3 resources must not be shared between threads
+local = threading.local()
+
+def resource():
+    if not hasattr(local, 'resource'):
+        local.resource = boto3.session.Session().resource('dynamodb', region_name=REGION, endpoint_url=ENDPOINT_URL)
+    return local.resource
+
+# ==================== TABLES AND INDEXES ====================
+
+def wait_until_active(table_name, poll_interval):
+    """Block until the table and every one of its indexes is ACTIVE"""
+    while True:
+        description = dynamodb.describe_table(TableName=table_name)['Table']
+        indexes = description.get('GlobalSecondaryIndexes', [])
+        if description['TableStatus'] == 'ACTIVE' and all(
+            gsi['IndexStatus'] == 'ACTIVE' and not gsi.get('Backfilling') for gsi in indexes
+        ):
+            return
+        time.sleep(poll_interval)
+
+def ensure_table(table_def, poll_interval):
+    """Create the table if it is missing, otherwise add the indexes it lacks"""
+    table_name = table_def['TableName']
+    try:
+        description = dynamodb.describe_table(TableName=table_name)['Table']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
+        print(f"   Creating table {table_name}...")
+        dynamodb.create_table(**table_def)
+        wait_until_active(table_name, poll_interval)
+        return
+    
+    existing = {gsi['IndexName'] for gsi in description.get('GlobalSecondaryIndexes', [])}
+    for gsi in table_def.get('GlobalSecondaryIndexes', []):
+        if gsi['IndexName'] not in existing:
+            add_index(table_name, table_def['AttributeDefinitions'], gsi, poll_interval)
+
+def add_index(table_name, attribute_definitions, gsi, poll_interval):
+    """Add a global secondary index and wait until DynamoDB has backfilled it"""
+    # Only the attributes used by this index need to be declared
+    key_names = {key['AttributeName'] for key in gsi['KeySchema']}
+    print(f"   Adding index {gsi['IndexName']} to {table_name}...")
+    # DynamoDB builds one index per table at a time
+    wait_until_active(table_name, poll_interval)
+    dynamodb.update_table(
+        TableName=table_name,
+        AttributeDefinitions=[attr for attr in attribute_definitions if attr['AttributeName'] in key_names],
+        GlobalSecondaryIndexUpdates=[{'Create': gsi}]
+    )
+    wait_until_active(table_name, poll_interval)
+
+# ==================== COPYING ITEMS ====================
+
+def get_meta(meta_key):
+    response = resource().Table(META_TABLE).get_item(Key={'meta_key': meta_key}, ConsistentRead=True)
+    return response.get('Item')
+
+def put_meta(item):
+    resource().Table(META_TABLE).put_item(Item=item)
+
+def write_items(table_name, items, limiter):
+    """Batch write one page of items, within the write capacity budget"""
+    if limiter:
+        limiter.wait()
+    # batch_writer sends 25 items per BatchWriteItem and resends unprocessed items
+    with resource().Table(table_name).batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    if limiter:
+        # An item of up to 1 KB costs one write unit
+        limiter.consume(len(items))
+
+def copy_items(name, source, target, transform, args):
+    """Copy every item of source into target, passing each through transform.
+    
+    transform(item) returns the item to write, or None to skip it; copying a table
+    onto itself reshapes it in place. Pages are read by scan_pages and written by
+    one thread per segment; a segment's position is saved in the checkpoint once
+    its page is written, so a rerun never skips an item (it may write some twice).
+    """
+    checkpoint_key = f"migration#{name}"
+    checkpoint = get_meta(checkpoint_key)
+    if checkpoint and checkpoint.get('done'):
+        print(f"   {name}: already copied {checkpoint['copied']} item(s)")
+        return
+    if checkpoint:
+        print(f"   {name}: resuming after {checkpoint['copied']} item(s)...")
+    else:
+        checkpoint = {'meta_key': checkpoint_key, 'segments': args.segments, 'positions': {}, 'copied': 0, 'done': False}
+    start_keys = {int(segment): key for segment, key in checkpoint['positions'].items()}
+    write_limiter = RateLimiter(args.write_capacity) if args.write_capacity else None
+    
+    # segment -> (write future, last key of the page, items in the page)
+    pending = {}
+    
+    def settle(segment):
+        future, last_key, count = pending.pop(segment)
+        future.result()
+        checkpoint['positions'][str(segment)] = last_key
+        checkpoint['copied'] += count
+        put_meta(checkpoint)
+    
+    with ThreadPoolExecutor(max_workers=int(checkpoint['segments'])) as executor:
+        # Only this thread touches the Table; scan_pages's segment threads use its client
+        pages = scan_pages(
+            resource().Table(source), int(checkpoint['segments']),
+            capacity_per_second=args.read_capacity, start_keys=start_keys, Limit=args.page_size
+        )
+        for segment, items, last_key in pages:
+            # One write per segment at a time, so positions are saved in order
+            if segment in pending:
+                settle(segment)
+            rows = [row for row in map(transform, items) if row is not None]
+            pending[segment] = (executor.submit(write_items, target, rows, write_limiter), last_key, len(rows))
+        for segment in list(pending):
+            settle(segment)
+    
+    checkpoint['done'] = True
+    put_meta(checkpoint)
+    print(f"   {name}: copied {checkpoint['copied']} item(s) from {source} to {target}")
+
+# ==================== MIGRATIONS ====================
+
+def create_tables(args):
+    for table_def in TABLES:
+        ensure_table(table_def, args.poll_interval)
+    backfill_email_reservations()
+    migrate_legacy_cart()
+
+def snapshot_order_item_details(args):
+    products = {
+        product['product_id']: product
+        for product in parallel_scan(
+            resource().Table('FF_Products'), args.segments,
+            projection=['product_id', 'name', 'image', 'image_variants'],
+            capacity_per_second=args.read_capacity
+        )
+    }
+    
+    def add_details(order_item):
+        product = products.get(order_item['product_id'])
+        # Items that already have a copy, or whose product is gone, are left alone
+        if 'name' in order_item or not product:
+            return None
+        return dict(
+            order_item, name=product['name'], image=product.get('image', ''),
+            image_variants=product.get('image_variants', [])
+        )
+    
+    copy_items('order-item-details', 'FF_Order_Items', 'FF_Order_Items', add_details, args)
+
+def create_sales_stats(args):
+    ensure_table(next(table_def for table_def in TABLES if table_def['TableName'] == 'FF_Sales_Stats'), args.poll_interval)
+    print("   Run rebuild_sales_stats.py to fill it from the existing orders")
+
+# (version, description, apply(args)); append new migrations with the next version
+MIGRATIONS = [
+    (1, "Create the FF_* tables and their indexes", create_tables),
+    (2, "Copy product names and images into order items", snapshot_order_item_details),
+    (3, "Create the sales stats table", create_sales_stats),
+]
+
+# ==================== SCHEMA VERSION ====================
+
+def applied_version():
+    """Schema version recorded in FF_Meta; 0 before the first migration"""
+    try:
+        item = get_meta(SCHEMA_VERSION_KEY)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return 0
+        raise
+    return int(item['version']) if item else 0
+
+def record_version(previous, version, description):
+    """Record a migration as applied; fails if another run recorded one meanwhile"""
+    resource().Table(META_TABLE).update_item(
+        Key={'meta_key': SCHEMA_VERSION_KEY},
+        UpdateExpression='SET version = :version, history = list_append(if_not_exists(history, :empty), :entry)',
+        ConditionExpression='attribute_not_exists(version) OR version = :previous',
+        ExpressionAttributeValues={
+            ':version': version,
+            ':previous': previous,
+            ':empty': [],
+            ':entry': [{'version': version, 'description': description, 'applied_at': datetime.now().isoformat()}]
+        }
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending Furnish Fusion schema migrations")
+    parser.add_argument('--status', action='store_true', help="Only show which migrations are pending")
+    parser.add_argument('--to', type=int, help="Stop after this version")
+    parser.add_argument('--segments', type=int, default=SCAN_SEGMENTS, help="Parallel scan segments for copies")
+    parser.add_argument('--page-size', type=int, default=500, help="Items per scan page for copies")
+    parser.add_argument('--read-capacity', type=float, help="Read capacity units per second to use at most")
+    parser.add_argument('--write-capacity', type=float, help="Write capacity units per second to use at most")
+    parser.add_argument('--poll-interval', type=float, default=5, help="Seconds between table status checks")
+    args = parser.parse_args()
+    
+    current = applied_version()
+    target = args.to if args.to is not None else MIGRATIONS[-1][0]
+    pending = [migration for migration in MIGRATIONS if current < migration[0] <= target]
+    print(f"Schema version: {current}")
+    for version, description, _ in MIGRATIONS:
+        print(f"  {'✅' if version <= current else '⏳'} {version}: {description}")
+    if args.status or not pending:
+        return 0
+    
+    for version, description, apply in pending:
+        print(f"Applying {version}: {description}...")
+        apply(args)
+        try:
+            record_version(current, version, description)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                print(f"❌ Another run changed the schema version while {version} was applied")
+                return 1
+            raise
+        current = version
+        print(f"✅ Schema version {version}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Bulk Product Import/Export for Furnish Fusion
+Streams CSV or JSONL product files into and out of FF_Products without loading
+them into memory.
+
+Import: every row needs name, category and price, and a sku unless it carries a
+product_id (image is optional). The product id is derived from the SKU, so importing
+the same SKU again updates the product in place. Rows that carry a product_id (e.g.
+from an export) update that product instead. Products are written in batches through
+batch_writer; the existing products of each batch are read first and the file's
+fields merged into them, so a product keeps its image variants and creation time.
+New products get the time of the import as created_at, which the "newest" sort
+uses. Invalid rows are reported and skipped.
+    python product_catalog.py import products.csv
+
+Export: scans FF_Products in parallel segments and writes every product; progress
+is saved to a checkpoint file after each page, so an interrupted export continues
+where it stopped when run again.
+    python product_catalog.py export products.jsonl
+"""
+
+import os
+import io
+import re
+import sys
+import csv
+import json
+import uuid
+import queue
+import argparse
+import time
+import threading
+from datetime import datetime
+from decimal import Decimal
+import boto3
+from botocore.config import Config
+
+# The scan engine lives with the app's storage code, one directory up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import json_number, scan_pages
+
+# Region
+REGION = 'us-east-1'
+# Optional endpoint for a local DynamoDB stand-in (e.g. DynamoDB Local or moto_server)
+ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL')
+
+PRODUCTS_TABLE = 'FF_Products'
+META_TABLE = 'FF_Meta'
+
+# Product ids of imported products are uuid5(SKU_NAMESPACE, sku)
+SKU_NAMESPACE = uuid.UUID('3b8f6f0e-9c57-4d2a-8a43-5f2e1c7d9a60')
+SKU_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+CATEGORIES = ('sofa', 'bed', 'table', 'chair')
+EXPORT_FIELDS = ['sku', 'product_id', 'name', 'category', 'price', 'image']
+# Products read per BatchGetItem, the most it allows
+BATCH_GET_SIZE = 100
+
+# Adaptive retries slow the client down when DynamoDB throttles the writes
+RETRY_CONFIG = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
+
+def resource():
+    """DynamoDB resource; boto3 resources must not be shared between threads"""
+    return boto3.session.Session().resource('dynamodb', region_name=REGION, endpoint_url=ENDPOINT_URL, config=RETRY_CONFIG)
+
+def file_format(path, requested):
+    """csv or jsonl, from --format or the file extension"""
+    if requested:
+        return requested
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+# ==================== IMPORT ====================
+
+def read_rows(path, fmt):
+    """Yield (line_number, row) from a CSV or JSONL file, one row at a time"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError as e:
+                        yield line_number, e
+
+def validate_row(row):
+    """Turn a file row into a product item; raises ValueError describing the first problem"""
+    if isinstance(row, Exception):
+        raise ValueError(f"not valid JSON ({row})")
+    if not isinstance(row, dict):
+        raise ValueError("each line must be a JSON object")
+    
+    # Products added through the admin pages have no sku, so exports of them carry
+    # only their product_id
+    product_id = str(row.get('product_id') or '').strip()
+    sku = str(row.get('sku') or '').strip()
+    if (sku or not product_id) and not SKU_PATTERN.match(sku):
+        raise ValueError(f"invalid sku {sku!r}")
+    
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    
+    category = str(row.get('category') or '').strip().lower()
+    if category not in CATEGORIES:
+        raise ValueError(f"category must be one of {', '.join(CATEGORIES)}, got {category!r}")
+    
+    try:
+        price = Decimal(str(row.get('price')).strip())
+    except ArithmeticError:
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    if not price.is_finite() or price != price.to_integral_value() or price < 0:
+        raise ValueError(f"price must be a whole number of rupees, got {row.get('price')!r}")
+    
+    item = {
+        'product_id': product_id or str(uuid.uuid5(SKU_NAMESPACE, sku)),
+        'name': name,
+        'category': category,
+        'price': int(price),
+        'image': str(row.get('image') or '').strip()
+    }
+    if sku:
+        item['sku'] = sku
+    return item
+
+def get_existing_products(product_ids):
+    """Current items of the given products, by product_id; missing products are absent"""
+    dynamodb = resource()
+    request = {PRODUCTS_TABLE: {'Keys': [{'product_id': product_id} for product_id in product_ids], 'ConsistentRead': True}}
+    existing = {}
+    attempt = 0
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response['Responses'].get(PRODUCTS_TABLE, []):
+            existing[item['product_id']] = item
+        request = response.get('UnprocessedKeys')
+        if request:
+            # Throttled keys come back unprocessed; back off before asking again
+            attempt += 1
+            time.sleep(min(0.05 * 2 ** attempt, 2))
+    return existing
+
+def write_products(items, stats, lock, created_at):
+    """Worker: write products from the queue until it yields None.
+    
+    A put replaces the whole item, so every batch first reads the products it
+    overwrites and keeps what the file does not set, e.g. the image variants built
+    by images.py and created_at. A product changed by someone else between that read
+    and the write loses the change.
+    """
+    done = False
+    try:
+        table = resource().Table(PRODUCTS_TABLE)
+        # batch_writer sends 25 items per BatchWriteItem and resends unprocessed items
+        with table.batch_writer(overwrite_by_pkeys=['product_id']) as batch:
+            while not done:
+                chunk = [items.get()]
+                # Whatever else is waiting, up to one BatchGetItem's worth
+                while chunk[-1] is not None and len(chunk) < BATCH_GET_SIZE:
+                    try:
+                        chunk.append(items.get_nowait())
+                    except queue.Empty:
+                        break
+                if chunk[-1] is None:
+                    chunk.pop()
+                    done = True
+                if not chunk:
+                    continue
+                existing = get_existing_products({item['product_id'] for item in chunk})
+                for item in chunk:
+                    current = existing.get(item['product_id'], {'created_at': created_at})
+                    batch.put_item(Item=dict(current, **item))
+                with lock:
+                    stats['written'] += len(chunk)
+    except Exception as e:
+        with lock:
+            stats['errors'].append(e)
+        # Keep draining, so the reader is never blocked on a full queue
+        if not done:
+            while items.get() is not None:
+                pass
+
+def bump_catalog_version():
+    """Tell running app servers that the catalog changed, so their caches reload"""
+    resource().Table(META_TABLE).update_item(
+        Key={'meta_key': 'catalog_version'},
+        UpdateExpression='ADD version :one',
+        ExpressionAttributeValues={':one': 1}
+    )
+
+def import_products(args):
+    fmt = file_format(args.file, args.format)
+    stats = {'rows': 0, 'invalid': 0, 'written': 0, 'errors': []}
+    lock = threading.Lock()
+    # Bounded, so reading never runs far ahead of writing
+    items = queue.Queue(maxsize=args.workers * 100)
+    # Creation time of the products this import adds
+    created_at = datetime.utcnow().isoformat()
+    workers = []
+    if not args.dry_run:
+        workers = [
+            threading.Thread(target=write_products, args=(items, stats, lock, created_at), daemon=True)
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+    
+    try:
+        for line_number, row in read_rows(args.file, fmt):
+            stats['rows'] += 1
+            try:
+                item = validate_row(row)
+            except ValueError as e:
+                stats['invalid'] += 1
+                if stats['invalid'] <= args.max_errors:
+                    print(f"❌ Line {line_number}: {e}")
+                continue
+            if workers and not stats['errors']:
+                items.put(item)
+    finally:
+        for _ in workers:
+            items.put(None)
+        for worker in workers:
+            worker.join()
+    
+    if stats['invalid'] > args.max_errors:
+        print(f"   ... and {stats['invalid'] - args.max_errors} more invalid row(s)")
+    if stats['written']:
+        bump_catalog_version()
+    if stats['errors']:
+        print(f"❌ Import stopped after {stats['written']} product(s): {stats['errors'][0]}")
+        return 1
+    action = "Validated" if args.dry_run else "Imported"
+    count = stats['rows'] - stats['invalid'] if args.dry_run else stats['written']
+    print(f"✅ {action} {count} product(s) from {stats['rows']} row(s), {stats['invalid']} invalid")
+    return 1 if stats['invalid'] else 0
+
+# ==================== EXPORT ====================
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_checkpoint(path, checkpoint):
+    # Replace atomically, so a crash never leaves half a checkpoint behind
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def export_products(args):
+    fmt = file_format(args.file, args.format)
+    checkpoint_path = args.checkpoint or args.file + '.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path) if not args.restart else None
+    # Only this thread touches the Table; scan_pages's segment threads use its client
+    table = resource().Table(PRODUCTS_TABLE)
+    
+    if checkpoint:
+        if checkpoint.get('done'):
+            print(f"✅ Export already complete ({checkpoint['exported']} products); use --restart to export again")
+            return 0
+        print(f"Resuming export after {checkpoint['exported']} product(s)...")
+        f = open(args.file, 'r+b')
+        # Drop anything written after the last checkpoint; it is exported again
+        f.truncate(checkpoint['offset'])
+        f.seek(checkpoint['offset'])
+    else:
+        checkpoint = {'offset': 0, 'exported': 0, 'segments': args.segments, 'positions': {}, 'done': False}
+        f = open(args.file, 'wb')
+    # Where every segment got to; segments not in it have not returned a page yet
+    start_keys = {int(segment): key for segment, key in checkpoint['positions'].items()}
+    
+    with f:
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        writer = csv.DictWriter(text, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        if fmt == 'csv' and checkpoint['offset'] == 0:
+            writer.writeheader()
+        
+        pages = scan_pages(
+            table, checkpoint['segments'], capacity_per_second=args.capacity, start_keys=start_keys, Limit=args.page_size
+        )
+        for segment, items, last_key in pages:
+            for item in items:
+                if fmt == 'csv':
+                    writer.writerow(item)
+                else:
+                    text.write(json.dumps(item, ensure_ascii=False, default=json_number) + '\n')
+            
+            text.flush()
+            os.fsync(f.fileno())
+            checkpoint['exported'] += len(items)
+            checkpoint['offset'] = f.tell()
+            checkpoint['positions'][str(segment)] = last_key
+            save_checkpoint(checkpoint_path, checkpoint)
+        
+        checkpoint['done'] = True
+        save_checkpoint(checkpoint_path, checkpoint)
+        text.detach()
+    
+    print(f"✅ Exported {checkpoint['exported']} product(s) to {args.file}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or export Furnish Fusion products")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    import_parser = commands.add_parser('import', help="Create or update products from a CSV/JSONL file")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension")
+    import_parser.add_argument('--workers', type=int, default=4, help="Concurrent batch writers")
+    import_parser.add_argument('--max-errors', type=int, default=20, help="Invalid rows to print")
+    import_parser.add_argument('--dry-run', action='store_true', help="Only validate the file")
+    
+    export_parser = commands.add_parser('export', help="Write every product to a CSV/JSONL file")
+    export_parser.add_argument('file')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension")
+    export_parser.add_argument('--checkpoint', help="Default: <file>.checkpoint")
+    export_parser.add_argument('--page-size', type=int, default=500, help="Products per scan page")
+    export_parser.add_argument('--segments', type=int, default=4, help="Parallel scan segments")
+    export_parser.add_argument('--capacity', type=float, help="Read capacity units per second to use at most")
+    export_parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over")
+    
+    args = parser.parse_args()
+    if args.command == 'import':
+        return import_products(args)
+    return export_products(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,39 +4,107 @@ Single file Flask application using DynamoDB, SNS, IAM, and EC2
 Region: us-east-1
 """
 
-from flask import Flask, render_template, request, redirect, session, url_for, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, session, url_for, flash, g, has_request_context, Response, make_response, send_from_directory
 from functools import wraps
 import os
+import time
+import json
+import bisect
+import hashlib
+import atexit
+import fcntl
+import tempfile
+import threading
+import queue
+from collections import OrderedDict
 import boto3
+from botocore.config import Config
+from storage import create_backend, listen_to_calls, map_concurrently, paginate_products, sales_changes, OrderStatusConflict
+from images import build_image_variants
+from passwords import PasswordHasher, PasswordHashingBusy
+from search import SearchIndex, CategoryIndex, CATEGORY_SORTS
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # ==================== AWS CONFIGURATION ====================
 # MANUALLY REPLACE THE SNS_TOPIC_ARN BELOW WITH YOUR ACTUAL ARN
 AWS_REGION = 'us-east-1'  # Hardcoded to us-east-1
 SNS_TOPIC_ARN = 'arn:aws:sns:us-east-1:619071311787:project_topic'  # ⚠️ REPLACE THIS WITH YOUR ARN
-
-# DynamoDB Table Names
-DYNAMODB_TABLE_USERS = 'FF_Users'
-DYNAMODB_TABLE_PRODUCTS = 'FF_Products'
-DYNAMODB_TABLE_CART = 'FF_Cart'
-DYNAMODB_TABLE_ORDERS = 'FF_Orders'
-DYNAMODB_TABLE_ORDER_ITEMS = 'FF_Order_Items'
-
-# Initialize DynamoDB clients
-dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
-dynamodb_client = boto3.client('dynamodb', region_name=AWS_REGION)
-
-# Get table references
-users_table = dynamodb.Table(DYNAMODB_TABLE_USERS)
-products_table = dynamodb.Table(DYNAMODB_TABLE_PRODUCTS)
-cart_table = dynamodb.Table(DYNAMODB_TABLE_CART)
-orders_table = dynamodb.Table(DYNAMODB_TABLE_ORDERS)
-order_items_table = dynamodb.Table(DYNAMODB_TABLE_ORDER_ITEMS)
+# Optional endpoint for a local SNS stand-in (e.g. moto_server or LocalStack)
+SNS_ENDPOINT_URL = os.environ.get('SNS_ENDPOINT_URL')
+
+# Number of products shown per category page
+PRODUCTS_PER_PAGE = int(os.environ.get('PRODUCTS_PER_PAGE', 12))
+
+# Number of orders shown per admin orders page
+ADMIN_ORDERS_PER_PAGE = int(os.environ.get('ADMIN_ORDERS_PER_PAGE', 25))
+
+# Every status an order can be in
+ORDER_STATUSES = ['placed', 'paid', 'shipped', 'delivered', 'cancelled', 'returned']
+# Statuses in which an order counts towards the sales stats
+SALES_STATUSES = ['paid', 'shipped', 'delivered']
+# Status changes an order may go through: paid -> shipped -> delivered -> returned,
+# and cancellation before the order ships
+ORDER_TRANSITIONS = {
+    'placed': ['paid', 'cancelled'],
+    'paid': ['shipped', 'cancelled'],
+    'shipped': ['delivered'],
+    'delivered': ['returned']
+}
+# Statuses in which a customer may still cancel their order
+CANCELLABLE_STATUSES = [status for status, changes in ORDER_TRANSITIONS.items() if 'cancelled' in changes]
+# Most orders one bulk status change may name
+BULK_STATUS_MAX_ORDERS = int(os.environ.get('BULK_STATUS_MAX_ORDERS', 500))
+
+# Periods (in days) the admin analytics page can show, the first being the default
+ANALYTICS_PERIODS = [30, 7, 90, 365]
+# Number of best selling products on the admin analytics page
+ANALYTICS_TOP_PRODUCTS = int(os.environ.get('ANALYTICS_TOP_PRODUCTS', 10))
+
+# Namespace for order ids derived from checkout tokens
+CHECKOUT_NAMESPACE = uuid.UUID('6f1c0e52-3d1a-4f0e-9b8e-2c5d7a9e4b11')
+
+# Threads used to run independent queries side by side
+QUERY_WORKERS = int(os.environ.get('QUERY_WORKERS', 8))
+# Segments (and threads) a full table scan is split into
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', 4))
+
+# 'sync' or 'async' (gevent workers, see gunicorn.conf.py)
+SERVING_MODE = os.environ.get('SERVING_MODE', 'sync')
+# Connections each AWS client may keep open; async workers have many requests in flight
+AWS_MAX_CONNECTIONS = int(os.environ.get('AWS_MAX_CONNECTIONS', 200 if SERVING_MODE == 'async' else 10))
+
+# Storage engine: 'dynamodb' (default), 'memory' or 'sqlite' (see storage.py)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'dynamodb')
+# Database file used by the sqlite engine
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'furnish_fusion.db')
+# Optional endpoint for a local DynamoDB stand-in (e.g. DynamoDB Local or moto_server)
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL')
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# Where resized/WebP product images are written (see images.py); served under /images/
+IMAGE_DERIVATIVES_DIR = os.environ.get('IMAGE_DERIVATIVES_DIR', os.path.join(STATIC_DIR, 'derived'))
+# Derivative names contain a content hash, so browsers and CDNs may keep them forever
+IMAGE_CACHE_MAX_AGE = 31536000
+
+# Initialize the storage engine
+storage = create_backend(
+    STORAGE_BACKEND,
+    region=AWS_REGION,
+    dynamodb_endpoint_url=DYNAMODB_ENDPOINT_URL,
+    sqlite_path=SQLITE_PATH,
+    query_workers=QUERY_WORKERS,
+    max_connections=AWS_MAX_CONNECTIONS,
+    scan_segments=SCAN_SEGMENTS
+)
 
 # Initialize SNS client
-sns_client = boto3.client('sns', region_name=AWS_REGION)
+sns_client = boto3.client(
+    'sns',
+    region_name=AWS_REGION,
+    endpoint_url=SNS_ENDPOINT_URL,
+    config=Config(max_pool_connections=AWS_MAX_CONNECTIONS)
+)
 
 # ==================== FLASK CONFIGURATION ====================
 
@@ -44,234 +112,853 @@ app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'FURNISH_FUSION')
 app.config['DEBUG'] = os.environ.get('DEBUG', 'False').lower() == 'true'
 
-# ==================== DYNAMODB FUNCTIONS ====================
+# ==================== METRICS ====================
+
+# Directory where every worker publishes its metrics, so /metrics can add them up
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'furnish_fusion_metrics'))
+# Seconds between metric snapshots written by each worker
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# Latency histogram buckets in seconds
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and help text of every exported metric
+METRIC_DEFINITIONS = {
+    'ff_http_requests_total': ('counter', 'HTTP requests by route, method and status'),
+    'ff_http_request_duration_seconds': ('histogram', 'HTTP request latency by route'),
+    'ff_data_calls_total': ('counter', 'Data layer function calls by function and route'),
+    'ff_data_errors_total': ('counter', 'Data layer function calls that raised, by function and route'),
+    'ff_data_call_duration_seconds': ('histogram', 'Data layer function latency by function and route'),
+    'ff_dynamodb_requests_total': ('counter', 'DynamoDB API calls by operation, table and route'),
+    'ff_dynamodb_errors_total': ('counter', 'Failed DynamoDB API calls by operation, error code and route'),
+    'ff_dynamodb_request_duration_seconds': ('histogram', 'DynamoDB API call latency by operation and table'),
+    'ff_dynamodb_consumed_capacity_units_total': ('counter', 'DynamoDB capacity units consumed by table, route and kind'),
+    'ff_sns_requests_total': ('counter', 'SNS API calls by operation and outcome'),
+    'ff_sns_request_duration_seconds': ('histogram', 'SNS API call latency by operation'),
+    'ff_password_hash_rejected_total': ('counter', 'Password hashes refused with 503 because too many hashes were running and waiting host-wide, by route'),
+    'ff_password_rehashes_total': ('counter', 'Stored password hashes upgraded to PASSWORD_HASH_METHOD at login'),
+}
+
+# DynamoDB operations that consume read capacity; everything else consumes write capacity
+DYNAMODB_READ_OPERATIONS = {'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'}
+
+class Metrics:
+    """Prometheus style counters and latency histograms for one worker.
+    
+    Gunicorn workers do not share memory, so every worker writes a snapshot of
+    its metrics to METRICS_DIR from a background thread, and /metrics adds up the
+    snapshots of all workers. A snapshot is named after the worker's pid and a random
+    token, since a new worker may get the pid of one that exited, and the worker holds
+    a lock on a matching .lock file for as long as it lives. /metrics folds the
+    snapshots of workers whose lock is free into retired.json, so counters never go
+    backwards; clear METRICS_DIR when the service restarts.
+    """
+    
+    def __init__(self, directory, flush_interval, buckets):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = buckets
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.name = None      # file name stem of this process's snapshot
+        self.name_pid = None
+        self.lock_fd = None
+    
+    def start(self):
+        """Start the flush thread; safe to call repeatedly and after a fork"""
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            # Metrics recorded before the fork belong to the parent
+            if self.pid is not None and self.pid != os.getpid():
+                self.counters, self.histograms = {}, {}
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name='metrics-flusher', daemon=True)
+            self.thread.start()
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+    
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()]
+            }
+    
+    def claim(self):
+        """Name this process's snapshot and lock its .lock file, which marks it as alive"""
+        with self.lock:
+            if self.name_pid == os.getpid():
+                return self.name
+            if self.lock_fd is not None:
+                # Inherited from the parent; the parent's own descriptor keeps its lock
+                os.close(self.lock_fd)
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"worker-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+            # Never closed: the lock is released when the process exits, however it exits
+            self.lock_fd = os.open(os.path.join(self.directory, name + '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+            self.name, self.name_pid = name, os.getpid()
+            return name
+    
+    def flush(self):
+        """Write this worker's snapshot; the rename makes it appear atomically"""
+        path = os.path.join(self.directory, self.claim() + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+    
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+    
+    @staticmethod
+    def add_snapshot(counters, histograms, snapshot):
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    
+    def read_snapshot(self, filename):
+        try:
+            with open(os.path.join(self.directory, filename)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def is_alive(self, name):
+        """Whether the worker writing the snapshot called name still holds its lock"""
+        try:
+            fd = os.open(os.path.join(self.directory, name + '.lock'), os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+    
+    def collect(self):
+        """Add up the snapshots of every worker, folding those of exited workers into retired.json"""
+        self.flush()
+        retired_path = os.path.join(self.directory, 'retired.json')
+        # One collector at a time, so a snapshot is never folded twice, nor counted
+        # both in retired.json and on its own
+        with open(os.path.join(self.directory, 'retired.lock'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            retired = self.read_snapshot('retired.json') or {'counters': [], 'histograms': [], 'folded': []}
+            snapshots = {
+                filename[:-len('.json')]: self.read_snapshot(filename)
+                for filename in os.listdir(self.directory)
+                if filename.startswith('worker-') and filename.endswith('.json')
+            }
+            # Snapshots that were folded but not deleted, e.g. after a crash
+            folded = set(retired['folded']) & set(snapshots)
+            dead = [name for name in snapshots if name not in folded and not self.is_alive(name)]
+            
+            counters, histograms = {}, {}
+            self.add_snapshot(counters, histograms, retired)
+            for name in dead:
+                if snapshots[name]:
+                    self.add_snapshot(counters, histograms, snapshots[name])
+            if dead:
+                retired = {
+                    'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                    'histograms': [[name, dict(labels), values] for (name, labels), values in histograms.items()],
+                    'folded': sorted(folded | set(dead))
+                }
+                with open(retired_path + '.tmp', 'w') as f:
+                    json.dump(retired, f)
+                os.replace(retired_path + '.tmp', retired_path)
+                for name in dead:
+                    for suffix in ('.json', '.lock'):
+                        try:
+                            os.remove(os.path.join(self.directory, name + suffix))
+                        except FileNotFoundError:
+                            pass
+            
+            for name, snapshot in snapshots.items():
+                if snapshot and name not in folded and name not in dead:
+                    self.add_snapshot(counters, histograms, snapshot)
+        return counters, histograms
+    
+    def render(self):
+        """All workers' metrics in the Prometheus text exposition format"""
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRIC_DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), values):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {values[-1]}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    """Render label pairs as {name="value",...}"""
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH_INTERVAL, METRICS_BUCKETS)
+atexit.register(metrics.flush)
+
+def current_route():
+    """Endpoint of the request being served, or 'background' for work outside requests"""
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+def instrumented(f):
+    """Count and time calls of a data layer function per route"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        route = current_route()
+        try:
+            return f(*args, **kwargs)
+        except Exception:
+            metrics.inc('ff_data_errors_total', function=f.__name__, route=route)
+            raise
+        finally:
+            metrics.inc('ff_data_calls_total', function=f.__name__, route=route)
+            metrics.observe('ff_data_call_duration_seconds', time.perf_counter() - started, function=f.__name__, route=route)
+    return wrapper
+
+def record_dynamodb_call(operation, tables, seconds, capacity, error):
+    """Storage listener for every DynamoDB API call"""
+    route = current_route()
+    for table in tables:
+        metrics.inc('ff_dynamodb_requests_total', operation=operation, table=table, route=route)
+    metrics.observe('ff_dynamodb_request_duration_seconds', seconds, operation=operation, table=','.join(tables))
+    if error:
+        metrics.inc('ff_dynamodb_errors_total', operation=operation, code=error, route=route)
+    kind = 'read' if operation in DYNAMODB_READ_OPERATIONS else 'write'
+    for table, units in capacity:
+        metrics.inc('ff_dynamodb_consumed_capacity_units_total', units, table=table, route=route, kind=kind)
+
+def record_sns_call(operation, params, seconds, parsed):
+    """Listener for every SNS API call"""
+    failed = parsed is None or 'Error' in parsed or bool(parsed.get('Failed'))
+    metrics.inc('ff_sns_requests_total', operation=operation, outcome='error' if failed else 'ok')
+    metrics.observe('ff_sns_request_duration_seconds', seconds, operation=operation)
+
+if storage.name == 'dynamodb':
+    storage.add_call_listener(record_dynamodb_call)
+listen_to_calls(sns_client, record_sns_call)
+
+@app.before_request
+def start_request_timer():
+    metrics.start()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_started' in g:
+        route = current_route()
+        metrics.inc('ff_http_requests_total', route=route, method=request.method, status=str(response.status_code))
+        metrics.observe('ff_http_request_duration_seconds', time.perf_counter() - g.request_started, route=route)
+    return response
+
+# ==================== CATALOG CACHE ====================
+
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 1024))
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 300))
+# How often each worker checks FF_Meta for writes made by other workers
+CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 2))
+
+class CatalogCache:
+    """Bounded LRU cache for product reads, shared by all requests in a worker.
+    
+    Gunicorn workers do not share memory, so they agree on freshness through a
+    catalog version counter in FF_Meta. Every product write bumps the counter and
+    each worker drops its entries once it notices a newer version. Entries also
+    expire after a TTL as a safety net. Cached values must be treated as read-only.
+    """
+    
+    def __init__(self, max_size, ttl, check_interval):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self.version_checked_at = 0.0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+    
+    def sync_version(self):
+        """Return the current catalog version, re-reading it from FF_Meta when due"""
+        now = time.monotonic()
+        if self.version is not None and now - self.version_checked_at < self.check_interval:
+            return self.version
+        
+        version = get_catalog_version()
+        with self.lock:
+            self.version_checked_at = now
+            if version != self.version:
+                if self.version is not None:
+                    self._clear()
+                self.version = version
+            return self.version
+    
+    def get(self, key):
+        """Return (True, value) on a hit or (False, None) on a miss"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return True, entry[0]
+            self.stats['misses'] += 1
+            return False, None
+    
+    def set(self, key, value, version):
+        """Store a value loaded while the catalog was at the given version"""
+        with self.lock:
+            # A write happened while the value was being loaded, so it may be stale
+            if version != self.version:
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss"""
+        version = self.sync_version()
+        found, value = self.get(key)
+        if found:
+            return value
+        value = loader()
+        self.set(key, value, version)
+        return value
+    
+    def invalidate(self):
+        """Drop every entry here and, via the version counter, in all other workers.
+        Returns the new catalog version."""
+        version = increment_catalog_version()
+        with self.lock:
+            self._clear()
+            self.version = version
+            self.version_checked_at = time.monotonic()
+        return version
+    
+    def _clear(self):
+        self.entries.clear()
+        self.stats['invalidations'] += 1
+    
+    def snapshot(self):
+        """Counters for monitoring"""
+        with self.lock:
+            return dict(self.stats, size=len(self.entries), version=self.version)
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL, CATALOG_VERSION_CHECK_INTERVAL)
+
+# ==================== CATALOG INDEXES ====================
+
+# Products shown on the search page and in the autocomplete list
+SEARCH_RESULTS_LIMIT = int(os.environ.get('SEARCH_RESULTS_LIMIT', 48))
+SEARCH_SUGGESTIONS_LIMIT = int(os.environ.get('SEARCH_SUGGESTIONS_LIMIT', 8))
+# How long a request waits for the indexes to be (re)built before using what there is
+CATALOG_INDEX_WAIT = float(os.environ.get('CATALOG_INDEX_WAIT', 5))
+
+class CatalogIndexes:
+    """Keeps this worker's in-memory catalog indexes (search and category pages,
+    see search.py) in step with the catalog.
+    
+    The indexes are built from the whole catalog in a background thread when the
+    worker serves its first request. Product writes made by this worker update
+    them in place; when the catalog version shows that someone else changed the
+    catalog (another worker, a bulk import), they are rebuilt, and requests wait
+    up to CATALOG_INDEX_WAIT for that. Queries only ever read memory.
+    """
+    
+    def __init__(self):
+        self.search_index = SearchIndex()
+        self.category_index = CategoryIndex()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.stats = {'rebuilds': 0, 'failures': 0}
+    
+    def start(self):
+        """Rebuild the indexes unless a rebuild is running; safe to call repeatedly and
+        after a fork. Returns the rebuilding thread."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive() or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.rebuild, name='catalog-indexes', daemon=True)
+                self.thread.start()
+            return self.thread
+    
+    def rebuild(self):
+        try:
+            # Read the version first, so the indexes are never older than the version they claim
+            version = storage.get_catalog_version()
+            products = storage.get_all_products()
+            self.search_index.rebuild(products, version)
+            self.category_index.rebuild(products, version)
+            self.stats['rebuilds'] += 1
+        except Exception as e:
+            self.stats['failures'] += 1
+            print(f"Catalog index build failed: {e}")
+    
+    def ensure_current(self):
+        """Bring the indexes up to the catalog version, waiting for a rebuild if needed.
+        Returns whether they have been built at all."""
+        if self.category_index.version != catalog_cache.sync_version():
+            self.start().join(CATALOG_INDEX_WAIT)
+        return self.category_index.version is not None
+    
+    def put(self, product, version):
+        self.search_index.put(product, version)
+        self.category_index.put(product, version)
+    
+    def delete(self, product_id, version):
+        self.search_index.delete(product_id, version)
+        self.category_index.delete(product_id, version)
+    
+    def snapshot(self):
+        """Counters for monitoring"""
+        return dict(self.stats, size=len(self.category_index), version=self.category_index.version)
+
+catalog_indexes = CatalogIndexes()
+
+@app.before_request
+def start_catalog_indexes():
+    if catalog_indexes.pid != os.getpid():
+        catalog_indexes.start()
+
+# ==================== STORAGE FUNCTIONS ====================
+
+# Meta
+@instrumented
+def get_catalog_version():
+    """Get the catalog version counter"""
+    return storage.get_catalog_version()
+
+@instrumented
+def increment_catalog_version():
+    """Bump the catalog version counter after a product write; returns the new version"""
+    return storage.increment_catalog_version()
 
 # Users
+@instrumented
 def create_user(name, email, password_hash, phone_no=None, address=None, role='user'):
-    """Create a new user"""
+    """Create a new user; raises ValueError if the email is already registered"""
     user_id = str(uuid.uuid4())
-    users_table.put_item(
-        Item={
-            'user_id': user_id,
-            'name': name,
-            'email': email,
-            'password_hash': password_hash,
-            'role': role,
-            'phone_no': phone_no or '',
-            'address': address or ''
-        }
-    )
+    storage.create_user({
+        'user_id': user_id,
+        'name': name,
+        'email': email,
+        'password_hash': password_hash,
+        'role': role,
+        'phone_no': phone_no or '',
+        'address': address or ''
+    })
     return user_id
 
+@instrumented
 def get_user_by_email(email):
     """Get user by email"""
-    response = users_table.scan(
-        FilterExpression='email = :email',
-        ExpressionAttributeValues={':email': email}
-    )
-    items = response.get('Items', [])
-    return items[0] if items else None
+    return storage.get_user_by_email(email)
 
+@instrumented
 def get_user_by_id(user_id):
     """Get user by user_id"""
-    response = users_table.get_item(Key={'user_id': user_id})
-    return response.get('Item')
+    return storage.get_user_by_id(user_id)
+
+@instrumented
+def get_users_by_ids(user_ids):
+    """Get many users at once; returns a dict of user_id -> user"""
+    if not user_ids:
+        return {}
+    return storage.get_users_by_ids(user_ids)
+
+@instrumented
+def update_user_password_hash(user_id, password_hash):
+    """Replace a user's password hash"""
+    storage.update_user_password_hash(user_id, password_hash)
 
 # Products
+@instrumented
 def get_all_products():
     """Get all products"""
-    response = products_table.scan()
-    return response.get('Items', [])
-
-def get_products_by_category(category):
-    """Get products by category"""
-    response = products_table.scan(
-        FilterExpression='category = :category',
-        ExpressionAttributeValues={':category': category}
+    return catalog_cache.get_or_load(('all',), storage.get_all_products)
+
+@instrumented
+def get_products_by_category(category, cursor=None, limit=PRODUCTS_PER_PAGE):
+    """Get one page of products in a category, cheapest first.
+    Returns (products, next_cursor, prev_cursor); a cursor is None when there is no such page."""
+    return catalog_cache.get_or_load(
+        ('category', category, cursor, limit),
+        lambda: storage.get_products_by_category(category, cursor, limit)
     )
-    return response.get('Items', [])
 
+def category_page_key(product):
+    """Pagination position of a product on a category page, for every sort"""
+    return {'product_id': product['product_id'], 'price': product['price'], 'created_at': product.get('created_at', '')}
+
+def get_category_page(category, sort, min_price=None, max_price=None, cursor=None, limit=PRODUCTS_PER_PAGE):
+    """Get one page of a category in the given sort (see CATEGORY_SORTS), limited to
+    products priced within [min_price, max_price]; either bound may be None.
+    Returns (products, next_cursor, prev_cursor), served from the category index."""
+    if not catalog_indexes.ensure_current():
+        # The index could not be built; the storage index serves the plain listing
+        return get_products_by_category(category, cursor, limit)
+    
+    def fetch(start_key, backwards, count):
+        return catalog_indexes.category_index.fetch(category, sort, min_price, max_price, start_key, backwards, count)
+    
+    return paginate_products(fetch, cursor, limit, key=category_page_key)
+
+def search_catalog(query, limit):
+    """Products matching a search query, best first"""
+    if not query:
+        return []
+    catalog_indexes.ensure_current()
+    return catalog_indexes.search_index.search(query, limit)
+
+@instrumented
 def get_product_by_id(product_id):
     """Get product by product_id"""
-    response = products_table.get_item(Key={'product_id': product_id})
-    return response.get('Item')
+    return catalog_cache.get_or_load(('product', product_id), lambda: storage.get_product_by_id(product_id))
+
+@instrumented
+def get_products_by_ids(product_ids):
+    """Get many products at once; returns a dict of product_id -> product.
+    Missing products are simply absent from the result."""
+    version = catalog_cache.sync_version()
+    products = {}
+    unique_ids = []
+    for product_id in dict.fromkeys(product_ids):
+        found, product = catalog_cache.get(('product', product_id))
+        if not found:
+            unique_ids.append(product_id)
+        elif product:
+            products[product_id] = product
+    
+    if unique_ids:
+        products.update(storage.get_products_by_ids(unique_ids))
+    
+    for product_id in unique_ids:
+        if product_id in products:
+            catalog_cache.set(('product', product_id), products[product_id], version)
+    return products
 
+@instrumented
 def add_product(name, category, price, image):
     """Add a new product"""
-    product_id = str(uuid.uuid4())
-    products_table.put_item(
-        Item={
-            'product_id': product_id,
-            'name': name,
-            'category': category,
-            'price': int(price),
-            'image': image
-        }
-    )
-    return product_id
-
+    product = {
+        'product_id': str(uuid.uuid4()),
+        'name': name,
+        'category': category,
+        'price': int(price),
+        'image': image,
+        'image_variants': build_image_variants(STATIC_DIR, IMAGE_DERIVATIVES_DIR, image),
+        'created_at': datetime.utcnow().isoformat()
+    }
+    storage.put_product(product)
+    catalog_indexes.put(product, catalog_cache.invalidate())
+    return product['product_id']
+
+@instrumented
 def update_product(product_id, name, category, price, image):
     """Update a product"""
-    products_table.update_item(
-        Key={'product_id': product_id},
-        UpdateExpression='SET #n = :name, category = :category, price = :price, #img = :image',
-        ExpressionAttributeNames={
-            '#n': 'name',
-            '#img': 'image'
-        },
-        ExpressionAttributeValues={
-            ':name': name,
-            ':category': category,
-            ':price': int(price),
-            ':image': image
-        }
-    )
-
+    changes = {
+        'name': name,
+        'category': category,
+        'price': int(price),
+        'image': image,
+        'image_variants': build_image_variants(STATIC_DIR, IMAGE_DERIVATIVES_DIR, image)
+    }
+    storage.update_product(product_id, changes)
+    catalog_indexes.put(dict(changes, product_id=product_id), catalog_cache.invalidate())
+
+@instrumented
 def delete_product(product_id):
     """Delete a product"""
-    products_table.delete_item(Key={'product_id': product_id})
+    storage.delete_product(product_id)
+    catalog_indexes.delete(product_id, catalog_cache.invalidate())
 
 # Cart
+@instrumented
 def get_cart_items(user_id):
     """Get all cart items for a user"""
-    response = cart_table.scan(
-        FilterExpression='user_id = :user_id',
-        ExpressionAttributeValues={':user_id': user_id}
-    )
-    return response.get('Items', [])
-
-def get_cart_item_by_user_product(user_id, product_id):
-    """Get cart item by user_id and product_id"""
-    response = cart_table.scan(
-        FilterExpression='user_id = :user_id AND product_id = :product_id',
-        ExpressionAttributeValues={
-            ':user_id': user_id,
-            ':product_id': product_id
-        }
-    )
-    items = response.get('Items', [])
-    return items[0] if items else None
+    return storage.get_cart_items(user_id)
 
+def current_price(product_id):
+    """(price, catalog_version) of a product for the cart summary; price is None for a missing product.
+    The version is read first, so the price is never older than the version it is recorded against."""
+    version = catalog_cache.sync_version()
+    product = get_product_by_id(product_id)
+    return (product["price"] if product else None), version
+
+@instrumented
 def add_to_cart(user_id, product_id, quantity=1):
-    """Add item to cart or update quantity"""
-    existing_item = get_cart_item_by_user_product(user_id, product_id)
-    
-    if existing_item:
-        new_quantity = existing_item.get('quantity', 0) + quantity
-        cart_table.update_item(
-            Key={'cart_id': existing_item['cart_id']},
-            UpdateExpression='SET quantity = :qty',
-            ExpressionAttributeValues={':qty': new_quantity}
-        )
-        return existing_item['cart_id']
-    else:
-        cart_id = str(uuid.uuid4())
-        cart_table.put_item(
-            Item={
-                'cart_id': cart_id,
-                'user_id': user_id,
-                'product_id': product_id,
-                'quantity': quantity
-            }
-        )
-        return cart_id
+    """Add item to cart or increase its quantity"""
+    price, version = current_price(product_id)
+    storage.add_to_cart(user_id, product_id, quantity, price, version)
 
-def remove_from_cart(cart_id):
+@instrumented
+def remove_from_cart(user_id, product_id):
     """Remove item from cart"""
-    cart_table.delete_item(Key={'cart_id': cart_id})
+    price, version = current_price(product_id)
+    storage.remove_from_cart(user_id, product_id, price, version)
 
-def clear_cart(user_id):
-    """Clear all items from user's cart"""
-    items = get_cart_items(user_id)
-    for item in items:
-        cart_table.delete_item(Key={'cart_id': item['cart_id']})
+@instrumented
+def get_cart_summary(user_id):
+    """Item count and subtotal of a user's cart.
+    
+    The summary is kept up to date by every cart change, so this is normally one
+    read. The cart is only re-priced when the catalog changed since the summary was
+    priced, or when a change could not be applied to it.
+    """
+    version = catalog_cache.sync_version()
+    summary = storage.get_cart_summary(user_id)
+    if summary and summary.get("catalog_version") == version:
+        return summary
+    
+    cart_items = storage.get_cart_items(user_id)
+    products = get_products_by_ids([item["product_id"] for item in cart_items])
+    priced = {"item_count": 0, "subtotal": 0, "catalog_version": version}
+    for item in cart_items:
+        product = products.get(item["product_id"])
+        if product:
+            priced["item_count"] += item["quantity"]
+            priced["subtotal"] += product["price"] * item["quantity"]
+    # Skipped if the cart changed meanwhile; the next read prices it again
+    storage.save_cart_summary(user_id, priced, summary["revision"] if summary else None)
+    return priced
 
 # Orders
-def create_order(user_id, total_price, payment_method, payment_status='SUCCESS', status='paid'):
-    """Create a new order"""
-    order_id = str(uuid.uuid4())
-    orders_table.put_item(
-        Item={
-            'order_id': order_id,
-            'user_id': user_id,
-            'total_price': int(total_price),
-            'payment_method': payment_method,
-            'payment_status': payment_status,
-            'status': status,
-            'created_at': datetime.utcnow().isoformat()
-        }
-    )
-    return order_id
-
+@instrumented
 def get_orders_by_user(user_id):
-    """Get all orders for a user"""
-    response = orders_table.scan(
-        FilterExpression='user_id = :user_id',
-        ExpressionAttributeValues={':user_id': user_id}
-    )
-    items = response.get('Items', [])
-    items.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return items
+    """Get all orders for a user, newest first"""
+    return storage.get_orders_by_user(user_id)
 
-def get_all_orders():
-    """Get all orders (for admin)"""
-    response = orders_table.scan()
-    items = response.get('Items', [])
-    items.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return items
+@instrumented
+def get_orders_page(statuses=ORDER_STATUSES, cursor=None, start_date=None, end_date=None, limit=ADMIN_ORDERS_PER_PAGE):
+    """Get one page of orders with the given statuses, newest first (for admin).
+    start_date and end_date are inclusive YYYY-MM-DD bounds on created_at.
+    Returns (orders, next_cursor)."""
+    return storage.get_orders_page(statuses, cursor, start_date, end_date, limit)
 
+@instrumented
 def get_order_by_id(order_id):
     """Get order by order_id"""
-    response = orders_table.get_item(Key={'order_id': order_id})
-    return response.get('Item')
-
-def update_order_status(order_id, status):
-    """Update order status"""
-    orders_table.update_item(
-        Key={'order_id': order_id},
-        UpdateExpression='SET #status = :status',
-        ExpressionAttributeNames={'#status': 'status'},
-        ExpressionAttributeValues={':status': status}
-    )
+    return storage.get_order_by_id(order_id)
+
+@instrumented
+def get_orders_by_ids(order_ids):
+    """Get many orders at once; returns a dict of order_id -> order"""
+    if not order_ids:
+        return {}
+    return storage.get_orders_by_ids(order_ids)
+
+def moves_sales(from_status, to_status):
+    """Whether an order starts or stops counting as a sale when its status changes"""
+    return (from_status in SALES_STATUSES) != (to_status in SALES_STATUSES)
+
+@instrumented
+def update_order_status(order_id, status, order=None, order_items=None):
+    """Update order status, moving the order into or out of the sales stats when it
+    starts or stops counting as a sale. order is the order as the caller read it, and
+    order_items its items if they have been read. The write is conditional on the order
+    still having the status it was read with, so a change the state machine
+    (ORDER_TRANSITIONS) does not allow, or a concurrent change, raises OrderStatusConflict."""
+    order = order or storage.get_order_by_id(order_id)
+    if not order:
+        raise ValueError("Order not found")
+    if status not in ORDER_TRANSITIONS.get(order['status'], []):
+        raise OrderStatusConflict(f"A {order['status']} order cannot be marked {status}")
+    changes = []
+    if moves_sales(order['status'], status):
+        if order_items is None:
+            order_items = get_order_items_for_orders([order])[order_id]
+        changes = sales_changes(order, order_item_categories(order_items), 1 if status in SALES_STATUSES else -1)
+    storage.update_order_status(order_id, status, expected_status=order['status'], sales_changes=changes)
+
+def bulk_update_order_status(order_ids, status):
+    """Move many orders to one status. The orders, and the items of those that move
+    into or out of the sales stats, are read in batches; each order is then written
+    with a conditional write of its own, side by side, so one conflicting order never
+    holds up or undoes the others. Returns one {order_id, result, message} per order
+    id, result being 'updated', 'conflict', 'not_found' or 'error'."""
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return []
+    orders = get_orders_by_ids(order_ids)
+    moving = [
+        order for order in orders.values()
+        if status in ORDER_TRANSITIONS.get(order['status'], []) and moves_sales(order['status'], status)
+    ]
+    items_by_order = get_order_items_for_orders(moving)
+    # One product read for every legacy item in the batch
+    order_item_categories([oi for order_items in items_by_order.values() for oi in order_items])
+    
+    def apply(order_id):
+        order = orders.get(order_id)
+        if not order:
+            return {"order_id": order_id, "result": "not_found", "message": "Order not found"}
+        try:
+            update_order_status(order_id, status, order, items_by_order.get(order_id))
+        except OrderStatusConflict as e:
+            return {"order_id": order_id, "result": "conflict", "message": str(e)}
+        except Exception as e:
+            # e.g. a throttled write; the other orders are still changed
+            print(f"Could not update order {order_id} to {status}: {e}")
+            return {"order_id": order_id, "result": "error", "message": str(e)}
+        return {"order_id": order_id, "result": "updated", "message": f"Marked {status}"}
+    
+    return map_concurrently(apply, order_ids, min(QUERY_WORKERS, len(order_ids)))
 
-# Order Items
-def create_order_item(order_id, product_id, quantity, price):
-    """Create an order item"""
-    order_item_id = str(uuid.uuid4())
-    order_items_table.put_item(
-        Item={
-            'order_item_id': order_item_id,
+# Checkout
+def checkout_order_id(user_id, checkout_token):
+    """Derive the order id for a checkout token, so resubmitting a payment form maps to the same order"""
+    return str(uuid.uuid5(CHECKOUT_NAMESPACE, f"{user_id}:{checkout_token}"))
+
+@instrumented
+def checkout_order(order_id, user_id, cart_items, lines, total_price, payment_method, notification=None):
+    """Write an order and its items and empty the cart as one atomic checkout.
+    
+    lines are the priced cart lines ({product_id, quantity, price, name, category, image, image_variants}).
+    The product name, category and image are copied into the order items, so order
+    history and the sales stats do not depend on the product. The paid order is added
+    to the sales stats in the same transaction. Each cart row is only deleted if its quantity is
+    unchanged, so the order matches what was priced.
+    The order is only written if order_id is new, which makes retries no-ops.
+    An optional notification is written to the outbox in the same transaction.
+    Returns (order, created).
+    """
+    order_items = [
+        {
+            'order_item_id': str(uuid.uuid5(uuid.UUID(order_id), line['product_id'])),
             'order_id': order_id,
-            'product_id': product_id,
-            'quantity': quantity,
-            'price': int(price)
+            'product_id': line['product_id'],
+            'quantity': line['quantity'],
+            'price': int(line['price']),
+            'name': line['name'],
+            'category': line['category'],
+            'image': line['image'],
+            'image_variants': line['image_variants']
         }
-    )
-    return order_item_id
+        for line in lines
+    ]
+    order = {
+        'order_id': order_id,
+        'user_id': user_id,
+        'total_price': int(total_price),
+        'payment_method': payment_method,
+        'payment_status': 'SUCCESS',
+        'status': 'paid',
+        'created_at': datetime.utcnow().isoformat(),
+        'order_item_ids': [item['order_item_id'] for item in order_items]
+    }
+    return storage.checkout(order, order_items, cart_items, notification, sales_changes(order, order_items, 1))
+
+# Sales Stats
+@instrumented
+def get_sales_stats(kind, first=None, last=None):
+    """Sales stats rows of a kind ('day', 'category' or 'product') with buckets from first to last"""
+    return storage.get_sales_stats(kind, first, last)
+
+@instrumented
+def get_top_sales(kind, limit):
+    """The sales stats rows of a kind with the most revenue, highest first"""
+    return storage.get_top_sales(kind, limit)
 
-def get_order_items_by_order(order_id):
-    """Get all items for an order"""
-    response = order_items_table.scan(
-        FilterExpression='order_id = :order_id',
-        ExpressionAttributeValues={':order_id': order_id}
-    )
-    return response.get('Items', [])
+# Order Items
+@instrumented
+def get_order_items_for_orders(orders):
+    """Get the items of many orders at once; returns a dict of order_id -> items"""
+    if not orders:
+        return {}
+    return storage.get_order_items_for_orders(orders)
+
+# Notification Outbox
+@instrumented
+def claim_outbox_notification(notification_id, lease_seconds):
+    """Take the lease on an outbox row whose previous lease has expired; returns False if someone else holds it"""
+    return storage.claim_outbox_notification(notification_id, lease_seconds)
+
+@instrumented
+def get_expired_outbox_notifications():
+    """Get outbox rows whose lease has expired, i.e. nobody is currently sending them"""
+    return storage.get_expired_outbox_notifications()
+
+@instrumented
+def delete_outbox_notification(notification_id):
+    """Remove a delivered notification from the outbox"""
+    storage.delete_outbox_notification(notification_id)
 
 # ==================== SNS FUNCTION ====================
 
-def send_order_notification(order_id, total_price):
-    """Send order confirmation notification via AWS SNS"""
-    if not SNS_TOPIC_ARN or SNS_TOPIC_ARN == 'arn:aws:sns:us-east-1:619071311787:project_topic':
-        # Fallback to console output if SNS not configured
-        print("================================")
-        print("ORDER CONFIRMATION NOTIFICATION")
-        print(f"Order ID: {order_id}")
-        print(f"Total Amount: ₹{total_price}")
-        print("================================")
-        return
-    
-    try:
-        message = f"""
+NOTIFICATION_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_SIZE', 1000))
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', 5))
+# How long a worker owns an outbox row before others may pick it up
+NOTIFICATION_LEASE_SECONDS = int(os.environ.get('NOTIFICATION_LEASE_SECONDS', 300))
+# How often each worker looks for outbox rows left behind by a crash or a full queue
+NOTIFICATION_SWEEP_INTERVAL = float(os.environ.get('NOTIFICATION_SWEEP_INTERVAL', 60))
+# SNS PublishBatch accepts at most 10 messages
+SNS_PUBLISH_BATCH_SIZE = 10
+
+def sns_configured():
+    """Whether a real SNS topic has been set up"""
+    return bool(SNS_TOPIC_ARN) and SNS_TOPIC_ARN != 'arn:aws:sns:us-east-1:619071311787:project_topic'
+
+def print_order_notification(order_id, total_price):
+    """Console fallback used when SNS is not configured or cannot be reached"""
+    print("================================")
+    print("ORDER CONFIRMATION NOTIFICATION")
+    print(f"Order ID: {order_id}")
+    print(f"Total Amount: ₹{total_price}")
+    print("================================")
+
+def build_order_notification(order_id, total_price):
+    """Build the outbox row for an order confirmation notification"""
+    message = f"""
         Order Confirmation
         
         Order ID: {order_id}
@@ -279,24 +966,339 @@ def send_order_notification(order_id, total_price):
         
         Thank you for your purchase!
         """
+    return {
+        'notification_id': order_id,
+        'order_id': order_id,
+        'total_price': int(total_price),
+        'subject': f'Order Confirmation - Order #{order_id}',
+        'message': message,
+        # The worker that wrote the row owns it until the lease runs out
+        'lease_until': int(time.time()) + NOTIFICATION_LEASE_SECONDS,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+class NotificationDispatcher:
+    """Publishes outbox notifications to SNS from a background thread.
+    
+    Checkout writes the notification to FF_Notification_Outbox in its own
+    transaction and then enqueues it here, so requests never wait on SNS.
+    The worker thread publishes queued notifications in batches, retries
+    failures with exponential backoff and deletes each outbox row once it is
+    delivered. Rows that never make it through the queue (full queue, crash,
+    restart) are picked up again by a periodic sweep once their lease expires.
+    """
+    
+    def __init__(self, sns, topic_arn, capacity=NOTIFICATION_QUEUE_SIZE,
+                 max_attempts=NOTIFICATION_MAX_ATTEMPTS, sweep_interval=NOTIFICATION_SWEEP_INTERVAL):
+        self.sns = sns
+        self.topic_arn = topic_arn
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self.queue = queue.Queue(maxsize=capacity)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.stats = {'published': 0, 'failed': 0, 'retried': 0, 'deferred': 0}
+    
+    def start(self):
+        """Start the worker thread; safe to call repeatedly and after a fork"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            # Gunicorn forks workers after import, and threads do not survive a fork
+            self.pid = os.getpid()
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self.thread = threading.Thread(target=self.run, name='notification-dispatcher', daemon=True)
+            self.thread.start()
+    
+    def enqueue(self, notification):
+        """Hand a notification to the worker; returns False if the queue is full.
+        A rejected notification stays in the outbox and is sent by a later sweep."""
+        self.start()
+        try:
+            self.queue.put_nowait((notification, 0))
+            return True
+        except queue.Full:
+            self.stats['deferred'] += 1
+            return False
+    
+    def run(self):
+        retries = []  # (due_at, notification, attempts)
+        next_sweep = time.monotonic()
         
-        response = sns_client.publish(
-            TopicArn=SNS_TOPIC_ARN,
-            Message=message,
-            Subject=f'Order Confirmation - Order #{order_id}'
-        )
+        while True:
+            now = time.monotonic()
+            if now >= next_sweep:
+                self.sweep()
+                next_sweep = now + self.sweep_interval
+            
+            # Wait for new work, but wake up for due retries and the next sweep
+            wake_at = min([next_sweep] + [due_at for due_at, _, _ in retries])
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, wake_at - time.monotonic())))
+                # Several orders landing together are published in one call
+                while len(batch) < SNS_PUBLISH_BATCH_SIZE:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            now = time.monotonic()
+            due = [(notification, attempts) for due_at, notification, attempts in retries if due_at <= now]
+            retries = [retry for retry in retries if retry[0] > now]
+            batch.extend(due)
+            
+            for start in range(0, len(batch), SNS_PUBLISH_BATCH_SIZE):
+                for notification, attempts in self.publish_batch(batch[start:start + SNS_PUBLISH_BATCH_SIZE]):
+                    if attempts >= self.max_attempts:
+                        # Leave the row in the outbox; a sweep will retry once the lease expires
+                        print(f"Giving up on notification {notification['notification_id']} for now")
+                        self.stats['failed'] += 1
+                        continue
+                    self.stats['retried'] += 1
+                    retries.append((time.monotonic() + 2 ** attempts, notification, attempts))
+    
+    def publish_batch(self, batch):
+        """Publish up to 10 notifications; returns the (notification, attempts) pairs to retry"""
+        if not batch:
+            return []
         
-        print(f"SNS notification sent: {response['MessageId']}")
-        return response
+        if not self.topic_arn or not sns_configured():
+            for notification, _ in batch:
+                print_order_notification(notification['order_id'], notification['total_price'])
+                self.delivered(notification)
+            return []
         
+        try:
+            response = self.sns.publish_batch(
+                TopicArn=self.topic_arn,
+                PublishBatchRequestEntries=[
+                    {'Id': str(index), 'Subject': notification['subject'], 'Message': notification['message']}
+                    for index, (notification, _) in enumerate(batch)
+                ]
+            )
+        except Exception as e:
+            print(f"Error sending SNS notifications: {e}")
+            return [(notification, attempts + 1) for notification, attempts in batch]
+        
+        for entry in response.get('Successful', []):
+            notification, _ = batch[int(entry['Id'])]
+            print(f"SNS notification sent: {entry['MessageId']}")
+            self.delivered(notification)
+        
+        to_retry = []
+        for entry in response.get('Failed', []):
+            notification, attempts = batch[int(entry['Id'])]
+            print(f"Error sending SNS notification: {entry.get('Code')} {entry.get('Message')}")
+            if entry.get('SenderFault'):
+                # The request itself is bad and will never succeed; keep a console copy
+                print_order_notification(notification['order_id'], notification['total_price'])
+                self.stats['failed'] += 1
+                self.remove_from_outbox(notification)
+            else:
+                to_retry.append((notification, attempts + 1))
+        return to_retry
+    
+    def delivered(self, notification):
+        self.stats['published'] += 1
+        self.remove_from_outbox(notification)
+    
+    def remove_from_outbox(self, notification):
+        # Never let a storage error stop the worker thread
+        try:
+            delete_outbox_notification(notification['notification_id'])
+        except Exception as e:
+            # The lease will expire and the notification may be sent once more
+            print(f"Error removing notification {notification['notification_id']} from outbox: {e}")
+    
+    def sweep(self):
+        """Queue outbox rows whose lease expired, e.g. after a crash or restart"""
+        try:
+            for notification in get_expired_outbox_notifications():
+                if self.queue.full():
+                    return
+                if claim_outbox_notification(notification['notification_id'], NOTIFICATION_LEASE_SECONDS):
+                    self.queue.put_nowait((notification, 0))
+        except Exception as e:
+            print(f"Error sweeping notification outbox: {e}")
+    
+    def snapshot(self):
+        """Counters for monitoring"""
+        return dict(self.stats, queued=self.queue.qsize())
+
+notification_dispatcher = NotificationDispatcher(sns_client, SNS_TOPIC_ARN)
+
+# ==================== PASSWORD HASHING ====================
+
+# werkzeug method for new hashes, with every parameter spelled out; stored hashes
+# with other parameters are rehashed at the next successful login
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# Hashes running at once on the whole host, across every gunicorn worker; leaves
+# half the CPUs to browsing requests
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 1) // 2)))
+# Seconds to wait for a hash before answering 503
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+# Gunicorn's worker settings (see gunicorn.conf.py), which bound how many logins can
+# be in flight at once
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 4))
+WORKER_CONNECTIONS = int(os.environ.get('WORKER_CONNECTIONS', 500))
+if SERVING_MODE == 'async':
+    # A waiting login only parks a greenlet, so let as many wait as the running
+    # hashes can get through within the timeout (at roughly 10 hashes a second
+    # each), but never more than the workers have connections
+    DEFAULT_PASSWORD_HASH_QUEUE_SIZE = min(WEB_WORKERS * WORKER_CONNECTIONS, int(PASSWORD_HASH_WORKERS * PASSWORD_HASH_TIMEOUT * 10))
+else:
+    # A waiting login blocks a whole sync worker; every worker may wait, since each
+    # holds only one request and the hashes themselves are bounded above
+    DEFAULT_PASSWORD_HASH_QUEUE_SIZE = max(0, WEB_WORKERS - PASSWORD_HASH_WORKERS)
+# Hashes that may wait for a running slot, host-wide, before logins answer 503 at once
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', DEFAULT_PASSWORD_HASH_QUEUE_SIZE))
+# Lock file shared by every worker to count the hashes above; processes that should
+# share the limit must use the same path
+PASSWORD_HASH_SLOTS_FILE = os.environ.get('PASSWORD_HASH_SLOTS_FILE', os.path.join(tempfile.gettempdir(), 'furnish_fusion_password_slots'))
+
+# Async workers hash in a process pool, so a hash does not stall their other requests
+password_hasher = PasswordHasher(PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE,
+                                 PASSWORD_HASH_TIMEOUT, PASSWORD_HASH_SLOTS_FILE, offload=SERVING_MODE == 'async')
+
+def hash_password(password):
+    """Hash a new password; raises PasswordHashingBusy when too many hashes are waiting"""
+    try:
+        return password_hasher.hash(password)
+    except PasswordHashingBusy:
+        metrics.inc('ff_password_hash_rejected_total', route=current_route())
+        raise
+
+def check_password(user, password):
+    """Check a user's password, upgrading the stored hash if it uses outdated parameters.
+    Raises PasswordHashingBusy when too many hashes are waiting."""
+    if not user:
+        return False
+    try:
+        valid, new_hash = password_hasher.verify(user["password_hash"], password)
+    except PasswordHashingBusy:
+        metrics.inc('ff_password_hash_rejected_total', route=current_route())
+        raise
+    if new_hash:
+        try:
+            update_user_password_hash(user["user_id"], new_hash)
+            metrics.inc('ff_password_rehashes_total')
+        except Exception as e:
+            # The old hash still works, so try again at the next login
+            print(f"Could not upgrade password hash of {user['user_id']}: {e}")
+    return valid
+
+def busy_response(template):
+    """503 for an auth form when password hashing is saturated"""
+    flash("We are handling a lot of sign-ins right now. Please try again in a moment.", "error")
+    return render_template(template), 503, {"Retry-After": "2"}
+
+# ==================== HELPERS ====================
+
+def run_concurrently(*calls):
+    """Run independent zero-argument calls side by side; returns their results in order.
+    In async mode the pool threads are greenlets, so this is cheap."""
+    return map_concurrently(lambda call: call(), calls, len(calls))
+
+def order_item_details(items_by_order):
+    """Name, image and quantity of the items of many orders; returns a dict of order_id -> items.
+    Items carry a copy of the product taken at checkout; products are only read for
+    items written before that copy existed (see migration 2 in aws-config/migrate.py)."""
+    missing = [oi["product_id"] for order_items in items_by_order.values() for oi in order_items if "name" not in oi]
+    products = get_products_by_ids(missing) if missing else {}
+    
+    details = {}
+    for order_id, order_items in items_by_order.items():
+        details[order_id] = []
+        for oi in order_items:
+            product = oi if "name" in oi else products.get(oi["product_id"])
+            if product:
+                details[order_id].append({
+                    "name": product["name"],
+                    "image": product.get("image", ""),
+                    "image_variants": product.get("image_variants", []),
+                    "quantity": oi["quantity"]
+                })
+    return details
+
+def order_item_categories(order_items):
+    """Give order items the category of their product, read for items written before
+    checkout stored it; items of deleted products count as 'other'"""
+    missing = [oi for oi in order_items if "category" not in oi]
+    products = get_products_by_ids([oi["product_id"] for oi in missing]) if missing else {}
+    for oi in missing:
+        product = products.get(oi["product_id"])
+        oi["category"] = product["category"] if product else "other"
+    return order_items
+
+def image_url(variant):
+    """URL of an image derivative"""
+    return url_for("derived_image", filename=variant["path"])
+
+@app.template_filter("srcset")
+def srcset_filter(variants, mime_type):
+    """srcset attribute for the derivatives of one type, e.g. 'image/webp'"""
+    return ", ".join(f"{image_url(v)} {v['width']}w" for v in variants if v["type"] == mime_type)
+
+@app.template_filter("thumbnail")
+def thumbnail_filter(item):
+    """URL of the smallest non-WebP derivative of an item's image, or of the original"""
+    variants = [v for v in item.get("image_variants") or [] if v["type"] != "image/webp"]
+    if variants:
+        return image_url(min(variants, key=lambda v: v["width"]))
+    return url_for("static", filename=item.get("image", ""))
+
+def current_cart_summary():
+    """The logged in user's cart summary, read once per request"""
+    if "cart_summary" not in g:
+        g.cart_summary = get_cart_summary(session["user_id"])
+    return g.cart_summary
+
+def cart_count():
+    """Items in the logged in user's cart, for the cart badge.
+    
+    The count is kept in the session with the catalog version it was read at, so
+    pages only read the cart summary after the cart or the catalog changed (see
+    forget_cart_count). Changes made from another browser show up at the next catalog
+    change or cart change made from this one.
+    """
+    if "user_id" not in session:
+        return None
+    version = catalog_cache.sync_version()
+    cached = session.get("cart_count")
+    if cached and cached[0] == version:
+        return cached[1]
+    try:
+        count = current_cart_summary()["item_count"]
     except Exception as e:
-        print(f"Error sending SNS notification: {e}")
-        # Fallback to console output
-        print("================================")
-        print("ORDER CONFIRMATION NOTIFICATION")
-        print(f"Order ID: {order_id}")
-        print(f"Total Amount: ₹{total_price}")
-        print("================================")
+        # The badge is decoration; never fail a page over it
+        print(f"Cart summary error: {e}")
+        return None
+    session["cart_count"] = [version, count]
+    return count
+
+def forget_cart_count():
+    """Drop the session's cart badge count after changing the cart or the logged in user"""
+    session.pop("cart_count", None)
+
+@app.context_processor
+def inject_cart_count():
+    return {"cart_count": cart_count()}
+
+def valid_price(value):
+    """Return value as a whole number of rupees if it is one, otherwise None"""
+    try:
+        price = int(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price >= 0 else None
+
+def valid_date(value):
+    """Return value if it is a YYYY-MM-DD date, otherwise None"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
 
 # ==================== AUTH DECORATORS ====================
 
@@ -329,7 +1331,22 @@ def home():
 
 @app.route("/health")
 def health():
-    return {"status": "healthy"}, 200
+    return {
+        "status": "healthy",
+        "catalog_cache": catalog_cache.snapshot(),
+        "catalog_indexes": catalog_indexes.snapshot(),
+        "notifications": notification_dispatcher.snapshot()
+    }, 200
+
+@app.route("/images/<path:filename>")
+def derived_image(filename):
+    response = send_from_directory(IMAGE_DERIVATIVES_DIR, filename, max_age=IMAGE_CACHE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 # ==================== AUTH ROUTES ====================
 
@@ -340,25 +1357,27 @@ def register():
             name = request.form["name"]
             email = request.form["email"]
             password = request.form["password"]
-            password_hash = generate_password_hash(password)
-
+            
             phone_no = request.form.get("phone_no", "")
             address = request.form.get("address", "")
-
+            
             # Check if user already exists
             existing_user = get_user_by_email(email)
             if existing_user:
                 flash("Email already registered. Please login.", "error")
                 return redirect(url_for("login"))
-
+            
             # Create user
+            password_hash = hash_password(password)
             user_id = create_user(name, email, password_hash, phone_no, address, role='user')
-
+            
             flash("Registration successful! Please login.", "success")
             return redirect(url_for("login"))
+        except PasswordHashingBusy:
+            return busy_response("auth/register.html")
         except Exception as e:
             flash(f"Registration failed: {str(e)}", "error")
-
+    
     return render_template("auth/register.html")
 
 @app.route("/login", methods=["GET", "POST"])
@@ -367,10 +1386,10 @@ def login():
         try:
             email = request.form["email"]
             password = request.form["password"]
-
+            
             user = get_user_by_email(email)
-
-            if user and check_password_hash(user["password_hash"], password):
+            
+            if check_password(user, password):
                 # If user is an admin, redirect them to admin login page
                 if user.get("role") == "admin":
                     flash("Please use Admin Login for administrator access.", "info")
@@ -378,14 +1397,17 @@ def login():
                 
                 session["user_id"] = user["user_id"]
                 session["role"] = user.get("role", "user")
-
+                forget_cart_count()
+                
                 flash("Login successful!", "success")
                 return redirect("/home")
-
+            
             flash("Invalid email or password", "error")
+        except PasswordHashingBusy:
+            return busy_response("auth/login.html")
         except Exception as e:
             flash(f"Login error: {str(e)}", "error")
-
+    
     return render_template("auth/login.html")
 
 @app.route("/logout")
@@ -401,25 +1423,27 @@ def admin_register():
             name = request.form["name"]
             email = request.form["email"]
             password = request.form["password"]
-            password_hash = generate_password_hash(password)
-
+            
             phone_no = request.form.get("phone_no", "")
             address = request.form.get("address", "")
-
+            
             # Check if admin already exists
             existing_user = get_user_by_email(email)
             if existing_user:
                 flash("Email already registered. Please login.", "error")
                 return redirect(url_for("admin_login"))
-
+            
             # Create admin user with role='admin'
+            password_hash = hash_password(password)
             user_id = create_user(name, email, password_hash, phone_no, address, role='admin')
-
+            
             flash("Admin registration successful! Please login.", "success")
             return redirect(url_for("admin_login"))
+        except PasswordHashingBusy:
+            return busy_response("auth/admin_register.html")
         except Exception as e:
             flash(f"Registration failed: {str(e)}", "error")
-
+    
     return render_template("auth/admin_register.html")
 
 @app.route("/admin/login", methods=["GET", "POST"])
@@ -428,10 +1452,10 @@ def admin_login():
         try:
             email = request.form["email"]
             password = request.form["password"]
-
+            
             user = get_user_by_email(email)
-
-            if user and check_password_hash(user["password_hash"], password):
+            
+            if check_password(user, password):
                 # Check if user is an admin
                 if user.get("role") != "admin":
                     flash("Access denied. This is for administrators only.", "error")
@@ -439,41 +1463,139 @@ def admin_login():
                 
                 session["user_id"] = user["user_id"]
                 session["role"] = "admin"
-
+                forget_cart_count()
+                
                 flash("Admin login successful!", "success")
                 return redirect("/admin")
-
+            
             flash("Invalid email or password", "error")
+        except PasswordHashingBusy:
+            return busy_response("auth/admin_login.html")
         except Exception as e:
             flash(f"Login error: {str(e)}", "error")
-
+    
     return render_template("auth/admin_login.html")
 
 # ==================== PRODUCT ROUTES ====================
 
+def templates_fingerprint():
+    """Hash of every template, so a deploy with changed templates changes all page ETags"""
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for filename in sorted(files):
+            with open(os.path.join(root, filename), 'rb') as f:
+                digest.update(filename.encode() + f.read())
+    return digest.hexdigest()
+
+TEMPLATES_FINGERPRINT = templates_fingerprint()
+
+def render_catalog_page(page_key, template, fragment_name, fragment_template, load):
+    """Render a page whose content only depends on the catalog.
+    
+    The content fragment is rendered once per catalog version and kept in the
+    catalog cache, so product writes invalidate it. The page gets a strong ETag
+    built from the catalog version, the page, the viewer's role and cart badge; a browser
+    revalidating with a matching ETag gets 304 without any rendering or storage
+    reads, as the badge count comes from the session (see cart_count). Pages
+    carrying flashed messages are never given an ETag.
+    """
+    version = catalog_cache.sync_version()
+    etag = hashlib.sha1(
+        '|'.join(str(part) for part in (TEMPLATES_FINGERPRINT, version, session.get("role"), cart_count()) + page_key).encode()
+    ).hexdigest()
+    has_flashes = bool(session.get("_flashes"))
+    
+    if not has_flashes and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        fragment = catalog_cache.get_or_load(
+            ('page',) + page_key,
+            lambda: render_template(fragment_template, **load())
+        )
+        response = make_response(render_template(template, **{fragment_name: fragment}))
+    
+    if not has_flashes:
+        response.set_etag(etag)
+    # Pages depend on the session, so only the browser may keep them and it must revalidate
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+def render_category(category, template):
+    """Render one page of a category using the sort, price range and cursor from the query string"""
+    cursor = request.args.get("cursor")
+    sort = request.args.get("sort") if request.args.get("sort") in CATEGORY_SORTS else "price_asc"
+    min_price = valid_price(request.args.get("min_price"))
+    max_price = valid_price(request.args.get("max_price"))
+    # Pages are cached per index version too, in case the index is still catching up
+    catalog_indexes.ensure_current()
+    
+    def load():
+        products, next_cursor, prev_cursor = get_category_page(category, sort, min_price, max_price, cursor=cursor)
+        # The fragment is shared by everyone with this page key, so its links carry
+        # only the normalized filters, never the query string of whoever rendered it
+        page_args = {"sort": sort, "min_price": min_price, "max_price": max_price}
+        return {
+            "products": products,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+            "page_args": {name: value for name, value in page_args.items() if value is not None}
+        }
+    
+    return render_catalog_page(
+        (request.endpoint, category, sort, min_price, max_price, cursor, catalog_indexes.category_index.version),
+        template, "grid", "products/grid.html", load
+    )
+
 @app.route("/sofas")
 @login_required
 def sofas():
-    products = get_products_by_category("sofa")
-    return render_template("products/sofas.html", products=products)
+    return render_category("sofa", "products/sofas.html")
 
 @app.route("/beds")
 @login_required
 def beds():
-    products = get_products_by_category("bed")
-    return render_template("products/beds.html", products=products)
+    return render_category("bed", "products/beds.html")
 
 @app.route("/tables")
 @login_required
 def tables():
-    products = get_products_by_category("table")
-    return render_template("products/tables.html", products=products)
+    return render_category("table", "products/tables.html")
 
 @app.route("/chairs")
 @login_required
 def chairs():
-    products = get_products_by_category("chair")
-    return render_template("products/chairs.html", products=products)
+    return render_category("chair", "products/chairs.html")
+
+# Category page of every product category, for links from search results
+CATEGORY_PAGES = {"sofa": "/sofas", "bed": "/beds", "table": "/tables", "chair": "/chairs"}
+
+@app.route("/search")
+@login_required
+def search_products():
+    query = request.args.get("q", "").strip()
+    products = search_catalog(query, SEARCH_RESULTS_LIMIT)
+    return render_template("products/search.html", query=query, products=products)
+
+@app.route("/search/suggest")
+@login_required
+def search_suggestions():
+    """Autocomplete: the best matches for what has been typed so far, as JSON"""
+    query = request.args.get("q", "").strip()
+    products = search_catalog(query, SEARCH_SUGGESTIONS_LIMIT)
+    return {
+        "query": query,
+        "suggestions": [
+            {
+                "product_id": product["product_id"],
+                "name": product["name"],
+                "category": product.get("category"),
+                "price": int(product["price"]),
+                "url": CATEGORY_PAGES.get(product.get("category"), "/home")
+            }
+            for product in products
+        ]
+    }
 
 # ==================== CART ROUTES ====================
 
@@ -483,6 +1605,7 @@ def add_to_cart_route(product_id):
     try:
         user_id = session["user_id"]
         add_to_cart(user_id, product_id, quantity=1)
+        forget_cart_count()
         flash("Item added to cart!", "success")
     except Exception as e:
         flash(f"Error adding to cart: {str(e)}", "error")
@@ -494,20 +1617,22 @@ def view_cart():
     try:
         user_id = session["user_id"]
         cart_items = get_cart_items(user_id)
+        products = get_products_by_ids([item["product_id"] for item in cart_items])
         
         # Get product details for each cart item
         items_with_details = []
         total = 0
         
         for item in cart_items:
-            product = get_product_by_id(item["product_id"])
+            product = products.get(item["product_id"])
             if product:
                 item_detail = {
-                    "cart_id": item["cart_id"],
+                    "product_id": item["product_id"],
                     "name": product["name"],
                     "price": product["price"],
                     "quantity": item["quantity"],
-                    "image": product.get("image", "")
+                    "image": product.get("image", ""),
+                    "image_variants": product.get("image_variants", [])
                 }
                 items_with_details.append(item_detail)
                 total += product["price"] * item["quantity"]
@@ -517,11 +1642,12 @@ def view_cart():
         flash(f"Error loading cart: {str(e)}", "error")
         return redirect("/home")
 
-@app.route("/remove-from-cart/<cart_id>")
+@app.route("/remove-from-cart/<product_id>")
 @login_required
-def remove_from_cart_route(cart_id):
+def remove_from_cart_route(product_id):
     try:
-        remove_from_cart(cart_id)
+        remove_from_cart(session["user_id"], product_id)
+        forget_cart_count()
         flash("Item removed from cart", "success")
     except Exception as e:
         flash(f"Error removing item: {str(e)}", "error")
@@ -533,21 +1659,17 @@ def remove_from_cart_route(cart_id):
 @login_required
 def place_order():
     try:
-        user_id = session["user_id"]
-        cart_items = get_cart_items(user_id)
+        summary = current_cart_summary()
         
-        if not cart_items:
+        if not summary["item_count"]:
             flash("Your cart is empty", "warning")
             return redirect("/cart")
         
-        # Calculate total
-        total_price = 0
-        for item in cart_items:
-            product = get_product_by_id(item["product_id"])
-            if product:
-                total_price += product["price"] * item["quantity"]
+        total_price = summary["subtotal"]
         
-        return render_template("payment.html", total=total_price)
+        # Identifies this payment form, so submitting it twice places one order
+        checkout_token = str(uuid.uuid4())
+        return render_template("payment.html", total=total_price, checkout_token=checkout_token)
     except Exception as e:
         flash(f"Error: {str(e)}", "error")
         return redirect("/cart")
@@ -558,58 +1680,68 @@ def process_payment():
     try:
         user_id = session["user_id"]
         payment_method = request.form.get("payment_method", "cash")
+        checkout_token = request.form.get("checkout_token") or str(uuid.uuid4())
+        order_id = checkout_order_id(user_id, checkout_token)
         
-        # Get cart items
-        cart_items = get_cart_items(user_id)
+        # A repeated submission of the same payment form returns the existing order
+        order, cart_items = run_concurrently(
+            lambda: get_order_by_id(order_id),
+            lambda: get_cart_items(user_id)
+        )
+        if order:
+            return render_template(
+                "orders/confirmation.html",
+                order_id=order_id,
+                total_price=order["total_price"],
+                payment_method=order["payment_method"]
+            )
         
         if not cart_items:
             flash("Your cart is empty", "warning")
             return redirect("/home")
         
         # Calculate total
+        products = get_products_by_ids([item["product_id"] for item in cart_items])
         total_price = 0
         cart_with_products = []
         for item in cart_items:
-            product = get_product_by_id(item["product_id"])
+            product = products.get(item["product_id"])
             if product:
                 item_total = product["price"] * item["quantity"]
                 total_price += item_total
                 cart_with_products.append({
                     "product_id": item["product_id"],
                     "quantity": item["quantity"],
-                    "price": product["price"]
+                    "price": product["price"],
+                    "name": product["name"],
+                    "category": product["category"],
+                    "image": product.get("image", ""),
+                    "image_variants": product.get("image_variants", [])
                 })
         
-        # Create order
-        order_id = create_order(
+        # Create order and order items, clear the cart and queue the notification in one transaction
+        notification = build_order_notification(order_id, total_price)
+        order, created = checkout_order(
+            order_id=order_id,
             user_id=user_id,
+            cart_items=cart_items,
+            lines=cart_with_products,
             total_price=total_price,
             payment_method=payment_method,
-            payment_status="SUCCESS",
-            status="paid"
+            notification=notification
         )
+        forget_cart_count()
         
-        # Create order items
-        for item in cart_with_products:
-            create_order_item(
-                order_id=order_id,
-                product_id=item["product_id"],
-                quantity=item["quantity"],
-                price=item["price"]
-            )
-        
-        # Clear cart
-        clear_cart(user_id)
-        
-        # Send notification
-        send_order_notification(order_id, total_price)
+        if created:
+            # Send notification in the background
+            notification_dispatcher.enqueue(notification)
+            flash("Order placed successfully 🎉", "success")
         
-        flash("Order placed successfully 🎉", "success")
         return render_template(
             "orders/confirmation.html",
             order_id=order_id,
-            total_price=total_price,
-            payment_method=payment_method
+            total_price=order["total_price"],
+            payment_method=order["payment_method"]
         )
     except Exception as e:
         flash(f"Error processing payment: {str(e)}", "error")
@@ -621,22 +1753,13 @@ def my_orders():
     try:
         user_id = session["user_id"]
         orders = get_orders_by_user(user_id)
+        items_by_order = order_item_details(get_order_items_for_orders(orders))
         
         # Get order items for each order
         for order in orders:
-            order_items = get_order_items_by_order(order["order_id"])
-            items_with_details = []
-            for oi in order_items:
-                product = get_product_by_id(oi["product_id"])
-                if product:
-                    items_with_details.append({
-                        "name": product["name"],
-                        "image": product.get("image", ""),
-                        "quantity": oi["quantity"]
-                    })
-            order["items"] = items_with_details
-        
-        return render_template("orders/history.html", orders=orders)
+            order["items"] = items_by_order[order["order_id"]]
+        
+        return render_template("orders/history.html", orders=orders, cancellable_statuses=CANCELLABLE_STATUSES)
     except Exception as e:
         flash(f"Error loading orders: {str(e)}", "error")
         return redirect("/home")
@@ -649,8 +1772,8 @@ def cancel_order(order_id):
         order = get_order_by_id(order_id)
         
         if order and order["user_id"] == user_id:
-            if order["status"] in ["placed", "paid"]:
-                update_order_status(order_id, "cancelled")
+            if order["status"] in CANCELLABLE_STATUSES:
+                update_order_status(order_id, "cancelled", order)
                 flash("Order cancelled successfully", "info")
             else:
                 flash("Cannot cancel this order", "error")
@@ -670,7 +1793,7 @@ def return_order(order_id):
         
         if order and order["user_id"] == user_id:
             if order["status"] == "delivered":
-                update_order_status(order_id, "returned")
+                update_order_status(order_id, "returned", order)
                 flash("Return request submitted", "info")
             else:
                 flash("Can only return delivered orders", "error")
@@ -687,8 +1810,11 @@ def return_order(order_id):
 @admin_required
 def admin_dashboard():
     try:
-        products = get_all_products()
-        return render_template("admin/dashboard.html", products=products)
+        return render_catalog_page(
+            ("admin_dashboard",),
+            "admin/dashboard.html", "product_table", "admin/product_table.html",
+            lambda: {"products": get_all_products()}
+        )
     except Exception as e:
         flash(f"Error loading dashboard: {str(e)}", "error")
         return redirect("/home")
@@ -749,26 +1875,37 @@ def admin_delete_product(product_id):
 @admin_required
 def admin_orders():
     try:
-        orders = get_all_orders()
+        status = request.args.get("status", "")
+        start_date = valid_date(request.args.get("start_date"))
+        end_date = valid_date(request.args.get("end_date"))
+        
+        orders, next_cursor = get_orders_page(
+            statuses=[status] if status in ORDER_STATUSES else ORDER_STATUSES,
+            cursor=request.args.get("cursor"),
+            start_date=start_date,
+            end_date=end_date
+        )
+        # Customers and order items do not depend on each other
+        users, items_by_order = run_concurrently(
+            lambda: get_users_by_ids([order["user_id"] for order in orders]),
+            lambda: order_item_details(get_order_items_for_orders(orders))
+        )
         
         # Get customer names and order items
         for order in orders:
-            user = get_user_by_id(order["user_id"])
+            user = users.get(order["user_id"])
             order["customer_name"] = user.get("name", "Unknown") if user else "Unknown"
-            
-            order_items = get_order_items_by_order(order["order_id"])
-            items_with_details = []
-            for oi in order_items:
-                product = get_product_by_id(oi["product_id"])
-                if product:
-                    items_with_details.append({
-                        "name": product["name"],
-                        "image": product.get("image", ""),
-                        "quantity": oi["quantity"]
-                    })
-            order["items"] = items_with_details
-        
-        return render_template("admin/orders.html", orders=orders)
+            order["items"] = items_by_order[order["order_id"]]
+        
+        filters = {"status": status, "start_date": start_date or "", "end_date": end_date or ""}
+        return render_template(
+            "admin/orders.html",
+            orders=orders,
+            next_cursor=next_cursor,
+            filters=filters,
+            statuses=ORDER_STATUSES,
+            bulk_statuses=["shipped", "delivered", "cancelled"]
+        )
     except Exception as e:
         flash(f"Error loading orders: {str(e)}", "error")
         return redirect("/admin")
@@ -783,6 +1920,86 @@ def admin_update_order_status(order_id, status):
         flash(f"Error updating order status: {str(e)}", "error")
     return redirect("/admin/orders")
 
+# Bulk status change: a form (order_ids, status) gets a results page, JSON
+# ({"order_ids": [...], "status": ...}) gets the per-order results as JSON
+@app.route("/admin/orders/status", methods=["POST"])
+@admin_required
+def admin_bulk_order_status():
+    data = request.get_json(silent=True) if request.is_json else None
+    if request.is_json and not isinstance(data, dict):
+        return {"error": "Send a JSON object with order_ids and status"}, 400
+    if data is not None:
+        order_ids, status = data.get("order_ids"), data.get("status")
+    else:
+        # Checkboxes send one order_ids field each; a pasted list may be separated by commas or whitespace
+        order_ids = " ".join(request.form.getlist("order_ids")).replace(",", " ").split()
+        status = request.form.get("status")
+    
+    if not isinstance(order_ids, list) or not all(isinstance(order_id, str) for order_id in order_ids) or not order_ids:
+        error = "Choose at least one order"
+    elif len(order_ids) > BULK_STATUS_MAX_ORDERS:
+        error = f"At most {BULK_STATUS_MAX_ORDERS} orders can be changed at once"
+    elif status not in ORDER_STATUSES:
+        error = "Choose a valid status"
+    else:
+        error = None
+    if error:
+        if data is not None:
+            return {"error": error}, 400
+        flash(error, "error")
+        return redirect("/admin/orders")
+    
+    try:
+        results = bulk_update_order_status(order_ids, status)
+    except Exception as e:
+        if data is not None:
+            return {"error": str(e)}, 500
+        flash(f"Error updating order status: {str(e)}", "error")
+        return redirect("/admin/orders")
+    
+    counts = {outcome: sum(1 for r in results if r["result"] == outcome) for outcome in ("updated", "conflict", "not_found", "error")}
+    if data is not None:
+        return {"status": status, "results": results, **counts}
+    return render_template("admin/order_status_results.html", status=status, results=results, counts=counts)
+
+@app.route("/admin/analytics")
+@admin_required
+def admin_analytics():
+    try:
+        days = request.args.get("days", type=int)
+        if days not in ANALYTICS_PERIODS:
+            days = ANALYTICS_PERIODS[0]
+        today = datetime.utcnow().date()
+        first_day = (today - timedelta(days=days - 1)).isoformat()
+        
+        # A few reads of precomputed rows, however many orders there are
+        day_rows, categories, top_products = run_concurrently(
+            lambda: get_sales_stats("day", first_day, today.isoformat()),
+            lambda: get_sales_stats("category"),
+            lambda: get_top_sales("product", ANALYTICS_TOP_PRODUCTS)
+        )
+        
+        # Every day of the period, newest first, including days without sales
+        by_day = {row["bucket"]: row for row in day_rows}
+        sales_by_day = []
+        for offset in range(days):
+            day = (today - timedelta(days=offset)).isoformat()
+            sales_by_day.append(by_day.get(day, {"bucket": day, "revenue": 0, "orders": 0, "units": 0}))
+        totals = {field: sum(row[field] for row in day_rows) for field in ("revenue", "orders", "units")}
+        
+        return render_template(
+            "admin/analytics.html",
+            days=days,
+            periods=ANALYTICS_PERIODS,
+            totals=totals,
+            sales_by_day=sales_by_day,
+            categories=sorted(categories, key=lambda row: row["revenue"], reverse=True),
+            top_products=[row for row in top_products if row["units"] > 0]
+        )
+    except Exception as e:
+        flash(f"Error loading analytics: {str(e)}", "error")
+        return redirect("/admin")
+
 # ==================== RUN APPLICATION ====================
 
 if __name__ == "__main__":
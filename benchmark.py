@@ -0,0 +1,475 @@
+"""
+Furnish Fusion - Benchmark
+Drives realistic shopper, visitor and admin traffic through the Flask app and
+reports per-route throughput, latency percentiles and storage calls per request.
+
+The app runs in-process behind the Flask test client, so the numbers measure the
+application itself plus its storage engine, without network or gunicorn overhead.
+
+Examples:
+    # DynamoDB Local / moto_server listening on localhost:8000
+    python benchmark.py --storage dynamodb --endpoint-url http://localhost:8000
+    
+    # In-process DynamoDB stand-in (pip install moto)
+    python benchmark.py --storage moto --duration 60 --concurrency 16
+    
+    # Compare against an earlier run
+    python benchmark.py --storage moto --output after.json --baseline before.json
+"""
+
+import os
+import re
+import io
+import sys
+import html
+import json
+import time
+import math
+import random
+import argparse
+import platform
+import threading
+import contextlib
+import contextvars
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from storage import StorageBackend, sales_changes, merge_sales_changes
+
+CATEGORY_ROUTES = {'sofa': '/sofas', 'bed': '/beds', 'table': '/tables', 'chair': '/chairs'}
+PAYMENT_METHODS = ['card', 'upi', 'cod']
+SCENARIOS = ('shopper', 'visitor', 'admin')
+BENCH_PASSWORD = 'bench-password'
+# A redirect here means the session is not logged in, which is never a success
+LOGIN_PATHS = ('/login', '/admin/login')
+BENCH_ADMIN_EMAIL = 'bench-admin@example.com'
+
+# Stats of the request currently being driven; storage calls are counted against it
+current_request = contextvars.ContextVar('current_request', default=None)
+
+# ==================== SETUP ====================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Furnish Fusion shopper and admin flows")
+    parser.add_argument('--storage', choices=['dynamodb', 'moto', 'memory', 'sqlite'], default='dynamodb',
+                        help="dynamodb talks to --endpoint-url, moto runs an in-process DynamoDB stand-in")
+    parser.add_argument('--endpoint-url', default='http://localhost:8000', help="local DynamoDB endpoint")
+    parser.add_argument('--sqlite-path', default='benchmark.db')
+    parser.add_argument('--products', type=int, default=200, help="catalog size to seed")
+    parser.add_argument('--users', type=int, default=50, help="shoppers to seed")
+    parser.add_argument('--orders', type=int, default=500, help="historical orders to seed")
+    parser.add_argument('--concurrency', type=int, default=8, help="virtual users running side by side")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument('--mix', default='shopper=70,visitor=10,admin=20',
+                        help="scenario weights, e.g. shopper=70,visitor=10,admin=20")
+    parser.add_argument('--checkout-ratio', type=float, default=0.3,
+                        help="share of shopper sessions that check out")
+    parser.add_argument('--seed', type=int, default=1, help="random seed")
+    parser.add_argument('--output', default='bench_results.json', help="where to write the JSON results")
+    parser.add_argument('--baseline', help="earlier results JSON to compare against")
+    return parser.parse_args(argv)
+
+def parse_mix(mix):
+    """Parse "name=weight,..." into a dict"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario in --mix: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def configure_environment(args):
+    """Point the app at the selected storage engine; must run before aws_app is imported"""
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ['STORAGE_BACKEND'] = 'dynamodb' if args.storage == 'moto' else args.storage
+    os.environ['SQLITE_PATH'] = args.sqlite_path
+    # Every virtual user runs in this one process, so any of them may wait for a hash
+    os.environ.setdefault('PASSWORD_HASH_QUEUE_SIZE', str(args.concurrency))
+    if args.storage == 'dynamodb':
+        os.environ['DYNAMODB_ENDPOINT_URL'] = args.endpoint_url
+    
+    if args.storage == 'moto':
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise SystemExit("--storage moto needs moto: pip install moto")
+        mock_aws().start()
+    
+    if args.storage in ('dynamodb', 'moto'):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aws-config'))
+        import create_dynamodb_tables
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_dynamodb_tables.main()
+
+def install_call_counter(aws_app):
+    """Count storage calls made on behalf of each request.
+    For DynamoDB every API call is counted (including retries and pages), for the
+    other engines every storage method call."""
+    def count(*args, **kwargs):
+        stats = current_request.get()
+        if stats is not None:
+            stats['calls'] += 1
+    
+    storage = aws_app.storage
+    if storage.name == 'dynamodb':
+        storage.add_call_listener(count)
+        return
+    
+    def counted(method):
+        def wrapper(*args, **kwargs):
+            # Only the outermost call counts; engines may call their own methods
+            stats = current_request.get()
+            if stats is None or stats['depth']:
+                return method(*args, **kwargs)
+            stats['calls'] += 1
+            stats['depth'] += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats['depth'] -= 1
+        return wrapper
+    
+    for name, member in vars(StorageBackend).items():
+        if callable(member) and not name.startswith('_'):
+            setattr(storage, name, counted(getattr(storage, name)))
+
+# ==================== SEEDING ====================
+
+def seed_data(aws_app, args, rng):
+    """Seed the catalog, shoppers, an admin and historical orders.
+    Returns the product ids and the shopper emails."""
+    storage = aws_app.storage
+    password_hash = aws_app.hash_password(BENCH_PASSWORD)
+    
+    product_ids = []
+    for i in range(args.products):
+        product_id = f"bench-product-{i}"
+        storage.put_product({
+            'product_id': product_id,
+            'name': f"Bench Product {i}",
+            'category': list(CATEGORY_ROUTES)[i % len(CATEGORY_ROUTES)],
+            'price': rng.randint(1000, 90000),
+            'image': 'images/placeholder.jpg'
+        })
+        product_ids.append(product_id)
+    aws_app.increment_catalog_version()
+    
+    def ensure_user(email, name, role):
+        try:
+            aws_app.create_user(name, email, password_hash, role=role)
+        except ValueError:
+            pass
+        return storage.get_user_by_email(email)['user_id']
+    
+    ensure_user(BENCH_ADMIN_EMAIL, 'Bench Admin', 'admin')
+    emails = [f"bench-user-{i}@example.com" for i in range(args.users)]
+    user_ids = [ensure_user(email, f"Bench User {i}", 'user') for i, email in enumerate(emails)]
+    
+    now = datetime.utcnow()
+    sales_totals = {}
+    for i in range(args.orders):
+        order_id = f"bench-order-{i}"
+        lines = [(rng.choice(product_ids), rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+        order_items = []
+        for line, (product_id, quantity) in enumerate(lines):
+            number = int(product_id.rsplit('-', 1)[1])
+            order_items.append({
+                'order_item_id': f"{order_id}-{line}",
+                'order_id': order_id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'price': 1000,
+                'name': f"Bench Product {number}",
+                'category': list(CATEGORY_ROUTES)[number % len(CATEGORY_ROUTES)],
+                'image': 'images/placeholder.jpg',
+                'image_variants': []
+            })
+            storage.put_order_item(order_items[-1])
+        order = {
+            'order_id': order_id,
+            'user_id': rng.choice(user_ids),
+            'total_price': sum(1000 * quantity for _, quantity in lines),
+            'payment_method': rng.choice(PAYMENT_METHODS),
+            'payment_status': 'SUCCESS',
+            'status': rng.choice(aws_app.ORDER_STATUSES),
+            'created_at': (now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))).isoformat(),
+            'order_item_ids': [item['order_item_id'] for item in order_items]
+        }
+        storage.put_order(order)
+        if order['status'] in aws_app.SALES_STATUSES:
+            merge_sales_changes(sales_totals, sales_changes(order, order_items, 1))
+    # The orders bypass checkout, so their sales stats are written in one go
+    storage.replace_sales_stats(list(sales_totals.values()))
+    
+    return product_ids, emails
+
+# ==================== VIRTUAL USERS ====================
+
+def find_cursor(page, path):
+    """The cursor of the first link to path on a page, if any"""
+    for href in re.findall(r'href="([^"]*)"', page):
+        url = urlparse(html.unescape(href))
+        if url.path == path and 'cursor' in url.query:
+            return parse_qs(url.query)['cursor'][0]
+    return None
+
+class VirtualUser:
+    """One simulated browser session driving requests and recording their stats"""
+    
+    def __init__(self, app, number, product_ids, emails, args, recording):
+        self.app = app
+        self.number = number
+        self.product_ids = product_ids
+        self.emails = emails
+        self.args = args
+        self.recording = recording
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.client = app.test_client()
+        self.samples = {}
+        self.registrations = 0
+    
+    def request(self, route, method, path, redirect_to=None, **kwargs):
+        """Send one request and record it. Only a redirect to redirect_to counts as a
+        success when it is given; otherwise any status below 400 does, except a
+        redirect to a login page."""
+        stats = {'calls': 0, 'depth': 0}
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.client.open(path, method=method, **kwargs)
+            location = urlparse(response.headers.get('Location', '')).path if response.status_code in (301, 302, 303) else None
+            if redirect_to:
+                ok = location == redirect_to
+            else:
+                ok = response.status_code < 400 and location not in LOGIN_PATHS
+        except Exception:
+            response, ok = None, False
+        elapsed = time.perf_counter() - start
+        current_request.reset(token)
+        
+        if self.recording.is_set():
+            sample = self.samples.setdefault(route, {'latencies': [], 'calls': 0, 'errors': 0})
+            sample['latencies'].append(elapsed)
+            sample['calls'] += stats['calls']
+            sample['errors'] += 0 if ok else 1
+        return response
+    
+    def new_session(self):
+        self.client = self.app.test_client()
+    
+    def login(self, email):
+        self.request('login', 'POST', '/login', redirect_to='/home', data={'email': email, 'password': BENCH_PASSWORD})
+    
+    def browse(self):
+        path = CATEGORY_ROUTES[self.rng.choice(list(CATEGORY_ROUTES))]
+        response = self.request('category', 'GET', path)
+        cursor = response and find_cursor(response.get_data(as_text=True), path)
+        if cursor and self.rng.random() < 0.5:
+            self.request('category_next', 'GET', path, query_string={'cursor': cursor})
+        if self.rng.random() < 0.3:
+            low = self.rng.randrange(1000, 60000, 1000)
+            self.request('category_filtered', 'GET', path, query_string={
+                'min_price': low,
+                'max_price': low + self.rng.randrange(5000, 30000, 1000),
+                'sort': self.rng.choice(['price_asc', 'price_desc', 'newest'])
+            })
+    
+    def search(self):
+        number = str(self.rng.randrange(len(self.product_ids)))
+        # Autocomplete asks again for every character typed, then the results page loads
+        for end in range(1, len(number) + 1):
+            self.request('search_suggest', 'GET', '/search/suggest', query_string={'q': f"bench product {number[:end]}"})
+        self.request('search', 'GET', '/search', query_string={'q': f"bench product {number}"})
+    
+    def shopper(self):
+        self.new_session()
+        self.login(self.rng.choice(self.emails))
+        for _ in range(self.rng.randint(1, 3)):
+            self.browse()
+        if self.rng.random() < 0.5:
+            self.search()
+        for product_id in self.rng.sample(self.product_ids, self.rng.randint(1, 3)):
+            self.request('add_to_cart', 'GET', f'/add-to-cart/{product_id}')
+        self.request('cart', 'GET', '/cart')
+        
+        if self.rng.random() < self.args.checkout_ratio:
+            response = self.request('place_order', 'GET', '/place-order')
+            tokens = re.findall(r'name="checkout_token" value="([^"]+)"', response.get_data(as_text=True)) if response else []
+            if tokens:
+                self.request('process_payment', 'POST', '/process-payment', data={
+                    'checkout_token': tokens[0],
+                    'payment_method': self.rng.choice(PAYMENT_METHODS)
+                })
+        self.request('my_orders', 'GET', '/my-orders')
+    
+    def visitor(self):
+        self.new_session()
+        self.registrations += 1
+        email = f"bench-visitor-{self.args.seed}-{self.number}-{self.registrations}-{time.time_ns()}@example.com"
+        self.request('register', 'POST', '/register', redirect_to='/login', data={
+            'name': 'Bench Visitor',
+            'email': email,
+            'password': BENCH_PASSWORD,
+            'phone_no': '9999999999',
+            'address': 'Bench Street'
+        })
+        self.login(email)
+        self.browse()
+    
+    def admin(self):
+        self.new_session()
+        self.request('admin_login', 'POST', '/admin/login', redirect_to='/admin', data={'email': BENCH_ADMIN_EMAIL, 'password': BENCH_PASSWORD})
+        self.request('admin_dashboard', 'GET', '/admin')
+        response = self.request('admin_orders', 'GET', '/admin/orders')
+        cursor = response and find_cursor(response.get_data(as_text=True), '/admin/orders')
+        if cursor:
+            self.request('admin_orders_next', 'GET', '/admin/orders', query_string={'cursor': cursor})
+        self.request('admin_orders_filtered', 'GET', '/admin/orders', query_string={
+            'status': self.rng.choice(['paid', 'shipped', 'delivered'])
+        })
+        # Ship a page of paid orders in one request
+        response = self.request('admin_orders_paid', 'GET', '/admin/orders', query_string={'status': 'paid'})
+        order_ids = response and re.findall(r'name="order_ids" value="([^"]+)"', response.get_data(as_text=True))
+        if order_ids:
+            self.request('admin_bulk_status', 'POST', '/admin/orders/status', json={'order_ids': order_ids, 'status': 'shipped'})
+        self.request('admin_analytics', 'GET', '/admin/analytics', query_string={'days': self.rng.choice([7, 30, 90])})
+    
+    def run(self, weights, stop):
+        names, values = list(weights), list(weights.values())
+        while not stop.is_set():
+            getattr(self, self.rng.choices(names, values)[0])()
+
+# ==================== REPORTING ====================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(virtual_users, duration):
+    merged = {}
+    for user in virtual_users:
+        for route, sample in user.samples.items():
+            target = merged.setdefault(route, {'latencies': [], 'calls': 0, 'errors': 0})
+            target['latencies'].extend(sample['latencies'])
+            target['calls'] += sample['calls']
+            target['errors'] += sample['errors']
+    
+    routes = {}
+    for route, sample in sorted(merged.items()):
+        latencies = sorted(sample['latencies'])
+        count = len(latencies)
+        routes[route] = {
+            'requests': count,
+            'errors': sample['errors'],
+            'throughput_rps': round(count / duration, 2),
+            'latency_ms': {
+                'mean': round(sum(latencies) / count * 1000, 2),
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'p99': round(percentile(latencies, 99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2)
+            },
+            'storage_calls_per_request': round(sample['calls'] / count, 2)
+        }
+    
+    requests = sum(route['requests'] for route in routes.values())
+    calls = sum(sample['calls'] for sample in merged.values())
+    totals = {
+        'requests': requests,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'throughput_rps': round(requests / duration, 2),
+        'storage_calls_per_request': round(calls / requests, 2) if requests else 0
+    }
+    return routes, totals
+
+def print_report(results, baseline=None):
+    base_routes = (baseline or {}).get('routes', {})
+    print(f"\n{'route':<24}{'req':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'calls':>7}"
+          + (f"{'Δ rps':>9}{'Δ p95':>9}" if baseline else ''))
+    for route, stats in results['routes'].items():
+        latency = stats['latency_ms']
+        line = (f"{route:<24}{stats['requests']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9.1f}"
+                f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}"
+                f"{stats['storage_calls_per_request']:>7.1f}")
+        if route in base_routes:
+            before = base_routes[route]
+            line += f"{change(before['throughput_rps'], stats['throughput_rps']):>9}"
+            line += f"{change(before['latency_ms']['p95'], latency['p95']):>9}"
+        print(line)
+    totals = results['totals']
+    print(f"\nTotal: {totals['requests']} requests, {totals['errors']} errors, "
+          f"{totals['throughput_rps']} req/s, {totals['storage_calls_per_request']} storage calls/request")
+
+def change(before, after):
+    if not before:
+        return '-'
+    return f"{(after - before) / before * 100:+.0f}%"
+
+# ==================== MAIN ====================
+
+def main(argv=None):
+    args = parse_args(argv)
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import aws_app
+    app = aws_app.app
+    
+    print(f"Seeding {args.products} products, {args.users} users and {args.orders} orders ({args.storage})...")
+    product_ids, emails = seed_data(aws_app, args, rng)
+    install_call_counter(aws_app)
+    
+    recording = threading.Event()
+    stop = threading.Event()
+    virtual_users = [VirtualUser(app, number, product_ids, emails, args, recording) for number in range(args.concurrency)]
+    threads = [threading.Thread(target=user.run, args=(weights, stop), daemon=True) for user in virtual_users]
+    
+    print(f"Running {args.concurrency} virtual users: {args.warmup}s warmup, {args.duration}s measured...")
+    # The app prints order notifications when SNS is not configured; keep them out of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        recording.set()
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        recording.clear()
+        duration = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+    
+    routes, totals = summarize(virtual_users, duration)
+    results = {
+        'started_at': datetime.utcnow().isoformat(),
+        'config': vars(args),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'duration_s': round(duration, 2),
+        'totals': totals,
+        'routes': routes
+    }
+    
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
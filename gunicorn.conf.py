@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for Furnish Fusion
+Gunicorn reads this file automatically when started from the application directory.
+
+SERVING_MODE=sync   blocking workers, one request in flight per worker (default)
+SERVING_MODE=async  gevent workers; every DynamoDB and SNS round trip yields to other
+                    requests, so each worker keeps up to WORKER_CONNECTIONS requests in flight
+"""
+
+import os
+
+SERVING_MODE = os.environ.get('SERVING_MODE', 'sync')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', 4))
+
+if SERVING_MODE == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 500))
+elif SERVING_MODE != 'sync':
+    raise ValueError(f"Unknown SERVING_MODE: {SERVING_MODE}")
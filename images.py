@@ -0,0 +1,114 @@
+"""
+Furnish Fusion - Image Derivatives
+Builds resized, WebP and fingerprinted copies of product images so product cards
+can load a small tile instead of the full original.
+
+Derivatives are written to IMAGE_DERIVATIVES_DIR under names that contain a hash
+of the original's content, so their URLs never change meaning and can be cached
+forever. Run this file to (re)build the derivatives of every product:
+    python images.py
+"""
+
+import os
+import io
+import hashlib
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow is optional; without it products keep their original image
+    Image = None
+
+# Widths of the resized copies, in pixels; grid tiles are about 300px wide
+IMAGE_WIDTHS = tuple(int(width) for width in os.environ.get('IMAGE_WIDTHS', '320,640').split(','))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+
+def pipeline_available():
+    """Whether Pillow is installed"""
+    return Image is not None
+
+def is_inside(directory, path):
+    """Whether path, once symlinks and '..' are resolved, lies inside directory"""
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([directory, os.path.realpath(path)]) == directory
+
+def build_image_variants(static_dir, derivatives_dir, image):
+    """Write the derivatives of static/<image> and return their descriptions.
+    
+    Each variant is {'path', 'width', 'type'}, with path relative to derivatives_dir.
+    Returns an empty list if Pillow is missing or the image cannot be read, in
+    which case the original image is used as before. An image outside static_dir,
+    or one whose derivatives would land outside derivatives_dir, is refused the same way.
+    """
+    if not pipeline_available() or not image:
+        return []
+    
+    source = os.path.join(static_dir, image)
+    # image comes from the product form and the import files, so it may be absolute or
+    # climb out with '..'
+    if not is_inside(static_dir, source):
+        print(f"Cannot build variants of {image}: not inside {static_dir}")
+        return []
+    try:
+        with open(source, 'rb') as f:
+            data = f.read()
+        original = Image.open(io.BytesIO(data))
+        original.load()
+    except (OSError, ValueError) as e:
+        print(f"Cannot build variants of {image}: {e}")
+        return []
+    
+    fingerprint = hashlib.sha256(data).hexdigest()[:12]
+    stem, extension = os.path.splitext(image)
+    if stem.startswith('images/'):
+        stem = stem[len('images/'):]
+    if not is_inside(derivatives_dir, os.path.join(derivatives_dir, stem)):
+        print(f"Cannot build variants of {image}: derivatives would be outside {derivatives_dir}")
+        return []
+    fallback_format = 'JPEG' if original.format == 'JPEG' else 'PNG'
+    fallback_type = 'image/jpeg' if fallback_format == 'JPEG' else 'image/png'
+    if fallback_format == 'JPEG':
+        original = original.convert('RGB')
+    
+    widths = [width for width in IMAGE_WIDTHS if width < original.width] + [original.width]
+    formats = [(fallback_format, fallback_type, extension.lower())]
+    if features.check('webp'):
+        formats.append(('WEBP', 'image/webp', '.webp'))
+    
+    variants = []
+    for width in widths:
+        if width == original.width:
+            resized = original
+        else:
+            resized = original.resize((width, round(original.height * width / original.width)), Image.LANCZOS)
+        for image_format, mime_type, suffix in formats:
+            path = f"{stem}-{fingerprint}-{width}w{suffix}"
+            target = os.path.join(derivatives_dir, path)
+            # The name already identifies the content, so existing files are up to date
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                resized.save(target + '.tmp', image_format, quality=IMAGE_QUALITY, optimize=image_format != 'WEBP')
+                os.replace(target + '.tmp', target)
+            variants.append({'path': path, 'width': width, 'type': mime_type})
+    return variants
+
+def main():
+    """Build derivatives for every product in the catalog"""
+    import aws_app
+    
+    if not pipeline_available():
+        raise SystemExit("Pillow is not installed: pip install Pillow")
+    
+    products = aws_app.storage.get_all_products()
+    print(f"Building image variants for {len(products)} products...")
+    built = 0
+    for product in products:
+        variants = build_image_variants(aws_app.STATIC_DIR, aws_app.IMAGE_DERIVATIVES_DIR, product.get('image'))
+        if variants != product.get('image_variants', []):
+            aws_app.storage.update_product(product['product_id'], {'image_variants': variants})
+            built += 1
+    if built:
+        aws_app.increment_catalog_version()
+    print(f"✅ Updated {built} product(s)")
+
+if __name__ == "__main__":
+    main()
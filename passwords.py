@@ -0,0 +1,187 @@
+"""
+Furnish Fusion - Password Hashing
+Limits how many passwords are hashed at once on the whole host, across every
+gunicorn worker, so a burst of logins cannot take all CPUs or all workers away
+from browsing requests. Logins beyond the limit wait for a slot, up to a bounded
+number of them; the rest are refused at once.
+
+This module is imported by the pool processes, so keep it free of app imports.
+"""
+
+import os
+import time
+import fcntl
+import random
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class PasswordHashingBusy(Exception):
+    """Every hashing slot is taken; the request should be answered with 503"""
+
+def hash_method(password_hash):
+    """Method and parameters of a werkzeug hash, e.g. 'scrypt:32768:8:1'"""
+    return password_hash.split('$', 1)[0]
+
+def verify_password(password_hash, password, method):
+    """Check a password; returns (ok, new_hash).
+    new_hash is set when the password is right but was hashed with other parameters than method."""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if hash_method(password_hash) != method:
+        return True, generate_password_hash(password, method)
+    return True, None
+
+# Seconds between attempts to take a hashing slot while waiting for one
+SLOT_POLL_INTERVAL = 0.01
+
+class HostSlots:
+    """A fixed number of slots shared by every process on the host, each a one-byte
+    fcntl lock in the file at path.
+    
+    The kernel drops a process's locks when it exits, so a worker killed in the
+    middle of a hash never leaks its slot. fcntl locks belong to the process, not
+    the thread, so the slots this process holds are also tracked here.
+    """
+    
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+        self.held = set()
+    
+    def _file(self):
+        if self.pid != os.getpid():
+            # Locks are not inherited by a forked worker, so neither is the bookkeeping.
+            # The descriptor is never closed: closing any descriptor of the file would
+            # drop every lock this process holds on it.
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.pid = os.getpid()
+            self.held = set()
+        return self.fd
+    
+    def try_acquire(self):
+        """Take a free slot without waiting; returns its number, or None if all are taken"""
+        with self.lock:
+            fd = self._file()
+            # Start at a random slot, so the scan is short unless nearly every slot is taken
+            start = random.randrange(self.count) if self.count else 0
+            for index in range(self.count):
+                slot = (start + index) % self.count
+                if slot in self.held:
+                    continue
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                except OSError:
+                    continue
+                self.held.add(slot)
+                return slot
+            return None
+    
+    def release(self, slot):
+        with self.lock:
+            if self.pid == os.getpid() and slot in self.held:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, slot)
+                self.held.discard(slot)
+
+class PasswordHasher:
+    """Password hashing limited across every process of the host.
+    
+    At most concurrency hashes run at once on the host and at most queue_size more
+    wait for a slot; beyond that, calls raise PasswordHashingBusy at once instead
+    of tying up another worker. The slots live in two lock files next to
+    slots_path, so every gunicorn worker shares them without any setup in the
+    master.
+    
+    Sync workers hash in the request thread, as they would wait for the hash
+    anyway. Async workers (offload=True) hash in a process pool of their own, so
+    the hash does not stall the worker's other requests; the pool is started on
+    first use, after gunicorn has forked the worker.
+    """
+    
+    def __init__(self, method, concurrency, queue_size, timeout, slots_path, offload=False):
+        self.method = method
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.offload = offload
+        self.running = HostSlots(slots_path + '.running', concurrency)
+        self.waiting = HostSlots(slots_path + '.waiting', queue_size)
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+    
+    def executor(self):
+        with self.lock:
+            if self.pool is None or self.pid != os.getpid():
+                # One worker may hold every slot of the host. Spawned processes do not
+                # inherit the locks of the worker's other threads.
+                self.pool = ProcessPoolExecutor(self.concurrency, mp_context=multiprocessing.get_context('spawn'))
+                self.pid = os.getpid()
+            return self.pool
+    
+    def reset(self, pool):
+        """Drop a pool whose processes died, so the next call starts a new one"""
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+    
+    def acquire(self, deadline):
+        """Take a running slot, waiting for one in a waiting slot until deadline;
+        raises PasswordHashingBusy if the queue is full or the deadline passes"""
+        slot = self.running.try_acquire()
+        if slot is not None:
+            return slot
+        place = self.waiting.try_acquire()
+        if place is None:
+            raise PasswordHashingBusy()
+        try:
+            while time.monotonic() < deadline:
+                # Under gevent the sleep yields to the worker's other requests
+                time.sleep(SLOT_POLL_INTERVAL)
+                slot = self.running.try_acquire()
+                if slot is not None:
+                    return slot
+        finally:
+            self.waiting.release(place)
+        raise PasswordHashingBusy()
+    
+    def run(self, fn, *args):
+        deadline = time.monotonic() + self.timeout
+        slot = self.acquire(deadline)
+        if not self.offload:
+            try:
+                return fn(*args)
+            finally:
+                self.running.release(slot)
+        
+        pool = self.executor()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self.running.release(slot)
+            self.reset(pool)
+            raise
+        except Exception:
+            self.running.release(slot)
+            raise
+        # The slot stays taken until the hash is done, even if the caller gives up waiting
+        future.add_done_callback(lambda _: self.running.release(slot))
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            raise PasswordHashingBusy()
+        except BrokenProcessPool:
+            self.reset(pool)
+            raise
+    
+    def hash(self, password):
+        """Hash a new password"""
+        return self.run(generate_password_hash, password, self.method)
+    
+    def verify(self, password_hash, password):
+        """Check a password; returns (ok, new_hash), see verify_password"""
+        return self.run(verify_password, password_hash, password, self.method)
@@ -0,0 +1,38 @@
+"""
+Furnish Fusion - Sales Stats Rebuild
+Recomputes the sales stats behind /admin/analytics from the orders. Checkout and
+order status changes keep them up to date afterwards, so this only needs to run
+once after upgrading, or if the stats are ever suspected to be wrong.
+
+Orders placed or changed while it runs may be counted twice or not at all, so run
+it when the shop is quiet.
+    python rebuild_sales_stats.py
+"""
+
+import aws_app
+from storage import sales_changes, merge_sales_changes
+
+# Orders read per page
+BATCH_SIZE = 100
+
+def main():
+    print("Rebuilding sales stats from the orders...")
+    totals = {}
+    cursor = None
+    orders_seen = 0
+    while True:
+        orders, cursor = aws_app.get_orders_page(statuses=aws_app.SALES_STATUSES, cursor=cursor, limit=BATCH_SIZE)
+        items_by_order = aws_app.get_order_items_for_orders(orders)
+        # Fills in the categories in place, with one product read for the whole page
+        aws_app.order_item_categories([oi for order_items in items_by_order.values() for oi in order_items])
+        for order in orders:
+            merge_sales_changes(totals, sales_changes(order, items_by_order[order["order_id"]], 1))
+        orders_seen += len(orders)
+        if not cursor:
+            break
+
+    aws_app.storage.replace_sales_stats(list(totals.values()))
+    print(f"✅ Counted {orders_seen} order(s) into {len(totals)} stats row(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Furnish Fusion - Product Search and Browsing Indexes
+In-memory indexes over the catalog, so that search, autocomplete and filtered
+category pages never read the products table:
+  SearchIndex    - inverted index over product names and categories
+  CategoryIndex  - per-category arrays sorted by price and by age, for price
+                   ranges and sorting with binary search
+
+Search: every query word must match a word of the product; the last one may also
+be the start of one ("sof" finds sofas), as the shopper may still be typing it.
+Matches in the name count more than matches in the category, and exact words
+more than prefixes.
+"""
+
+import re
+import bisect
+import threading
+from operator import itemgetter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Weight of a word by the field it appears in
+FIELD_WEIGHTS = {'name': 3.0, 'category': 1.0}
+# A query word that is only the start of a product word scores this share of the weight
+PREFIX_FACTOR = 0.5
+# At most this many index words are expanded per query prefix, so "a" stays cheap
+MAX_PREFIX_EXPANSIONS = 64
+
+def normalize(word):
+    """Fold simple English plurals, so "sofas" and "sofa" are the same word"""
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+def tokenize(text):
+    """Lower-cased, normalized words of a text, in order"""
+    return [normalize(word) for word in TOKEN_PATTERN.findall(str(text or '').lower())]
+
+class CatalogIndex:
+    """Base of the indexes: keeps the catalog version the index reflects and
+    applies whole rebuilds and single product writes under one lock.
+    
+    version is None until the index is first built. Subclasses set up their
+    structures in _clear() and maintain them in _add() and _remove().
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self._clear()
+    
+    def _clear(self):
+        self.products = {}   # product_id -> product
+    
+    def _add(self, product):
+        raise NotImplementedError
+    
+    def _remove(self, product_id):
+        raise NotImplementedError
+    
+    def rebuild(self, products, version):
+        """Replace the whole index; ignored if the index already reflects a newer version"""
+        fresh = type(self)()
+        for product in products:
+            fresh._add(product)
+        with self.lock:
+            if self.version is not None and version < self.version:
+                return
+            for name, value in vars(fresh).items():
+                if name not in ('lock', 'version'):
+                    setattr(self, name, value)
+            self.version = version
+    
+    def put(self, product, version):
+        """Add a product, or apply changed fields to an indexed one, after the write
+        that moved the catalog to version"""
+        with self.lock:
+            product = dict(self.products.get(product['product_id'], {}), **product)
+            self._remove(product['product_id'])
+            self._add(product)
+            self._advance(version)
+    
+    def delete(self, product_id, version):
+        """Remove one product after the write that moved the catalog to version"""
+        with self.lock:
+            self._remove(product_id)
+            self._advance(version)
+    
+    def _advance(self, version):
+        # Only follow the version if this write is the only change since the last one
+        # seen; otherwise another worker wrote too, and the index stays behind until rebuilt
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.products)
+
+class SearchIndex(CatalogIndex):
+    """Inverted index from words to the products that contain them.
+    
+    postings maps word -> {product_id: weight}; words is the same set of words,
+    sorted, for prefix lookups with bisect.
+    """
+    
+    def _clear(self):
+        self.products = {}   # product_id -> product
+        self.postings = {}   # word -> {product_id: weight}
+        self.words = []
+    
+    def _weights(self, product):
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for word in tokenize(product.get(field)):
+                weights[word] = max(weights.get(word, 0), weight)
+        return weights
+    
+    def _add(self, product):
+        product_id = product['product_id']
+        self.products[product_id] = product
+        for word, weight in self._weights(product).items():
+            if word not in self.postings:
+                self.postings[word] = {}
+                bisect.insort(self.words, word)
+            self.postings[word][product_id] = weight
+    
+    def _remove(self, product_id):
+        product = self.products.pop(product_id, None)
+        if product is None:
+            return
+        for word in self._weights(product):
+            documents = self.postings.get(word)
+            if documents is None:
+                continue
+            documents.pop(product_id, None)
+            if not documents:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+    
+    def _matches(self, word, is_prefix):
+        """{product_id: score} for one query word"""
+        scores = dict(self.postings.get(word, {}))
+        if not is_prefix:
+            return scores
+        start = bisect.bisect_left(self.words, word)
+        for candidate in self.words[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(word):
+                break
+            if candidate == word:
+                continue
+            for product_id, weight in self.postings[candidate].items():
+                scores[product_id] = max(scores.get(product_id, 0), weight * PREFIX_FACTOR)
+        return scores
+    
+    def search(self, query, limit):
+        """Products matching every word of the query, best first.
+        The last word also matches as a prefix, as the shopper may still be typing it."""
+        words = tokenize(query)
+        if not words:
+            return []
+        # The last word is looked up as typed for prefixes ("tabl") and folded for exact matches ("sofas")
+        raw_last = TOKEN_PATTERN.findall(str(query).lower())[-1]
+        with self.lock:
+            scores = None
+            for position, word in enumerate(words):
+                is_last = position == len(words) - 1
+                matches = self._matches(raw_last if is_last else word, is_prefix=is_last)
+                if is_last and raw_last != word:
+                    for product_id, score in self._matches(word, is_prefix=False).items():
+                        matches[product_id] = max(matches.get(product_id, 0), score)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {product_id: score + matches[product_id] for product_id, score in scores.items() if product_id in matches}
+                if not scores:
+                    return []
+            # Ties go to shorter names, which match the query more closely
+            ranked = sorted(
+                scores.items(),
+                key=lambda entry: (-entry[1], len(self.products[entry[0]]['name']), self.products[entry[0]]['name'])
+            )
+            return [self.products[product_id] for product_id, _ in ranked[:limit]]
+
+# Orders a category page can be sorted in
+CATEGORY_SORTS = ('price_asc', 'price_desc', 'newest')
+
+def sort_position(product, sort):
+    """Position of a product in the array a sort walks through"""
+    if sort == 'newest':
+        return (product.get('created_at', ''), product['product_id'])
+    return (product['price'], product['product_id'])
+
+class CategoryIndex(CatalogIndex):
+    """Every category's products as arrays of (price, product_id) and
+    (created_at, product_id), kept sorted as products are written.
+    
+    A page is located with binary search and then read off the array, so its cost
+    depends on the page size rather than on the size of the category.
+    """
+    
+    def _clear(self):
+        self.products = {}    # product_id -> product
+        self.by_price = {}    # category -> sorted [(price, product_id)]
+        self.by_newest = {}   # category -> sorted [(created_at, product_id)]
+    
+    def _add(self, product):
+        self.products[product['product_id']] = product
+        bisect.insort(self.by_price.setdefault(product['category'], []), sort_position(product, 'price_asc'))
+        bisect.insort(self.by_newest.setdefault(product['category'], []), sort_position(product, 'newest'))
+    
+    def _remove(self, product_id):
+        product = self.products.pop(product_id, None)
+        if product is None:
+            return
+        for arrays, sort in ((self.by_price, 'price_asc'), (self.by_newest, 'newest')):
+            keys = arrays.get(product['category'], [])
+            position = sort_position(product, sort)
+            index = bisect.bisect_left(keys, position)
+            if index < len(keys) and keys[index] == position:
+                del keys[index]
+    
+    def fetch(self, category, sort, min_price, max_price, start_key, backwards, count):
+        """Up to count products of a category priced within [min_price, max_price]
+        (either may be None) that come after start_key in the sort order, or before
+        it, nearest first, when backwards. Products are returned as read-only dicts."""
+        with self.lock:
+            by_price = self.by_price.get(category, [])
+            # Bounds of the price range in the price array
+            low = 0 if min_price is None else bisect.bisect_left(by_price, min_price, key=itemgetter(0))
+            high = len(by_price) if max_price is None else bisect.bisect_right(by_price, max_price, key=itemgetter(0))
+            if low >= high:
+                return []
+            position = sort_position(start_key, sort) if start_key else None
+            # price_asc walks its array upwards, the other sorts downwards; backwards flips that
+            upwards = (sort == 'price_asc') != backwards
+            
+            if sort != 'newest':
+                return self._walk(by_price, low, high, position, upwards, count)
+            by_newest = self.by_newest.get(category, [])
+            if high - low == len(by_price):
+                return self._walk(by_newest, 0, len(by_newest), position, upwards, count)
+            if (high - low) ** 2 < count * len(by_price):
+                # A narrow range: order the products in it by age directly, instead of
+                # walking the age array past many products outside the range
+                keys = sorted(sort_position(self.products[product_id], sort) for _, product_id in by_price[low:high])
+                return self._walk(keys, 0, len(keys), position, upwards, count)
+            # A wide range: walk the age array and skip products outside the range;
+            # about count * len / matching products are looked at
+            def in_range(key):
+                price = self.products[key[1]]['price']
+                return (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+            return self._walk(by_newest, 0, len(by_newest), position, upwards, count, in_range)
+    
+    def _walk(self, keys, low, high, position, upwards, count, keep=None):
+        """Products of keys[low:high] after position, in the walking direction"""
+        if upwards:
+            start = bisect.bisect_right(keys, position, low, high) if position else low
+            indexes = range(start, high)
+        else:
+            end = bisect.bisect_left(keys, position, low, high) if position else high
+            indexes = range(end - 1, low - 1, -1)
+        page = []
+        for index in indexes:
+            if keep is None or keep(keys[index]):
+                page.append(self.products[keys[index][1]])
+                if len(page) == count:
+                    break
+        return page
@@ -0,0 +1,38 @@
+// Fill the navbar search box's suggestion list as the shopper types
+(function () {
+    var input = document.querySelector(".nav-search input[data-suggest-url]");
+    if (!input) {
+        return;
+    }
+    var list = document.getElementById(input.getAttribute("list"));
+    var timer = null;
+    var latest = "";
+
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        var query = input.value.trim();
+        if (!query) {
+            list.innerHTML = "";
+            return;
+        }
+        // Wait for a pause in typing before asking the server
+        timer = setTimeout(function () {
+            latest = query;
+            fetch(input.dataset.suggestUrl + "?q=" + encodeURIComponent(query), {credentials: "same-origin"})
+                .then(function (response) { return response.ok ? response.json() : null; })
+                .then(function (data) {
+                    // Answers can arrive out of order; only show those for the current text
+                    if (!data || data.query !== latest) {
+                        return;
+                    }
+                    list.innerHTML = "";
+                    data.suggestions.forEach(function (suggestion) {
+                        var option = document.createElement("option");
+                        option.value = suggestion.name;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(function () {});
+        }, 150);
+    });
+})();
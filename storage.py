@@ -0,0 +1,1848 @@
+"""
+Furnish Fusion - Storage Backends
+Every read and write the application makes goes through one of these engines:
+  dynamodb  - the production engine (FF_* tables in DynamoDB)
+  memory    - plain Python dictionaries, for tests and single-process load runs
+  sqlite    - a local SQLite file with indexes, shareable by several processes
+"""
+
+import os
+import json
+import time
+import base64
+import binascii
+import heapq
+import bisect
+import queue
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+# DynamoDB Table Names
+DYNAMODB_TABLE_USERS = 'FF_Users'
+DYNAMODB_TABLE_PRODUCTS = 'FF_Products'
+DYNAMODB_TABLE_CART = 'FF_Cart_Items'
+DYNAMODB_TABLE_ORDERS = 'FF_Orders'
+DYNAMODB_TABLE_ORDER_ITEMS = 'FF_Order_Items'
+DYNAMODB_TABLE_META = 'FF_Meta'
+DYNAMODB_TABLE_OUTBOX = 'FF_Notification_Outbox'
+DYNAMODB_TABLE_SALES_STATS = 'FF_Sales_Stats'
+
+# DynamoDB Index Names
+DYNAMODB_INDEX_USERS_EMAIL = 'email-index'
+DYNAMODB_INDEX_PRODUCTS_CATEGORY = 'category-price-index'
+DYNAMODB_INDEX_ORDERS_USER = 'user_id-created_at-index'
+DYNAMODB_INDEX_ORDERS_STATUS = 'status-created_at-index'
+DYNAMODB_INDEX_ORDER_ITEMS_ORDER = 'order_id-index'
+DYNAMODB_INDEX_SALES_STATS_REVENUE = 'kind-revenue-index'
+
+# BatchGetItem accepts at most 100 keys per request
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_RETRIES = 5
+
+# TransactWriteItems accepts at most 100 actions per transaction
+TRANSACT_MAX_ITEMS = 100
+TRANSACT_MAX_RETRIES = 3
+
+# Segments a full table scan is split into, each read by its own thread
+SCAN_SEGMENTS = 4
+
+# Sort key of the cart summary row, kept in FF_Cart_Items next to the user's cart lines
+CART_SUMMARY_ID = '#summary'
+
+# Kinds of sales stats rows: per day (bucket YYYY-MM-DD), per category and per product
+SALES_STATS_KINDS = ('day', 'category', 'product')
+
+# ==================== SHARED HELPERS ====================
+
+def json_number(value):
+    """JSON encoder hook for the Decimal numbers DynamoDB returns"""
+    if isinstance(value, Decimal):
+        return int(value) if value == int(value) else float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def map_concurrently(fn, args, max_workers):
+    """Like ThreadPoolExecutor.map, but every call runs in a copy of the caller's
+    context, so context variables such as per-request accounting follow the work"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fn, arg) for arg in args]
+        return [future.result() for future in futures]
+
+def listen_to_calls(client, listener, params_hook=None):
+    """Report every API call a boto3 client makes to listener(operation, params, seconds, parsed).
+    parsed is None when the call failed before a response arrived. params_hook(params, model)
+    may adjust the parameters before they are sent."""
+    # Several listeners may watch one client, so each keeps its own entry in the call context
+    key = object()
+    
+    def before(params, model, context, **kwargs):
+        if params_hook:
+            params_hook(params, model)
+        context[key] = (model.name, params, time.perf_counter())
+    
+    def after(context, parsed=None, **kwargs):
+        if key in context:
+            operation, params, started = context.pop(key)
+            listener(operation, params, time.perf_counter() - started, parsed)
+    
+    prefix = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f'provide-client-params.{prefix}', before)
+    client.meta.events.register(f'after-call.{prefix}', after)
+    client.meta.events.register(f'after-call-error.{prefix}', after)
+
+def encode_cursor(key, direction):
+    """Encode a pagination key into an opaque, URL safe cursor"""
+    payload = json.dumps({'key': key, 'dir': direction}, default=json_number)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor into (key, direction), or (None, 'next') if it is missing or invalid"""
+    if not cursor:
+        return None, 'next'
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()), parse_float=Decimal)
+        return payload['key'], payload['dir']
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None, 'next'
+
+def product_index_key(product):
+    """Key of a product in the category index, used as a pagination position"""
+    return {
+        'product_id': product['product_id'],
+        'category': product['category'],
+        'price': product['price']
+    }
+
+def order_index_key(order):
+    """Key of an order in the status index, used as a pagination position"""
+    return {
+        'order_id': order['order_id'],
+        'status': order['status'],
+        'created_at': order['created_at']
+    }
+
+def paginate_products(fetch, cursor, limit, key=product_index_key):
+    """Turn a category fetch into a page with next/previous cursors.
+    fetch(start_key, backwards, count) returns up to count products after start_key in
+    page order, e.g. cheapest first (or before it, nearest first, when backwards). key(product) is the
+    pagination position stored in the cursors."""
+    start_key, direction = decode_cursor(cursor)
+    backwards = direction == 'prev'
+    
+    # One extra item tells us whether another page exists
+    items = fetch(start_key, backwards, limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    
+    if backwards:
+        items.reverse()
+        has_before, has_after = has_more, True
+    else:
+        has_before, has_after = start_key is not None, has_more
+    
+    next_cursor = encode_cursor(key(items[-1]), 'next') if items and has_after else None
+    prev_cursor = encode_cursor(key(items[0]), 'prev') if items and has_before else None
+    return items, next_cursor, prev_cursor
+
+def order_date_bounds(start_date, end_date):
+    """created_at bounds for inclusive YYYY-MM-DD dates.
+    created_at is an ISO timestamp, so "<date>T~" sorts after every time on that day."""
+    return start_date or '0000', (end_date or '9999') + 'T~'
+
+def change_cart_summary(summary, quantity, price, catalog_version):
+    """Apply a change of quantity items at price to a cart summary in place.
+    The subtotal is only adjusted if the summary was priced at catalog_version;
+    otherwise the summary loses its catalog_version, so it is re-priced when read."""
+    summary['revision'] = summary.get('revision', 0) + 1
+    if price is not None and 'catalog_version' in summary and summary['catalog_version'] == catalog_version:
+        summary['item_count'] += quantity
+        summary['subtotal'] += quantity * price
+    else:
+        summary.pop('catalog_version', None)
+
+class OrderStatusConflict(ValueError):
+    """The order is missing or no longer has the status a change expected"""
+
+def sales_changes(order, order_items, sign):
+    """Changes to the sales stats when an order starts (sign 1) or stops (sign -1)
+    counting as a sale: one {kind, bucket, revenue, orders, units} per stats row,
+    with the product name as label on product rows. Items need their category."""
+    changes = {}
+    
+    def change(kind, bucket, revenue, units, label=None):
+        row = changes.get((kind, bucket))
+        if row is None:
+            row = changes[(kind, bucket)] = {'kind': kind, 'bucket': bucket, 'revenue': 0, 'orders': 0, 'units': 0}
+            # An order counts once per row, however many of its items fall in it
+            row['orders'] = sign
+        row['revenue'] += sign * revenue
+        row['units'] += sign * units
+        if label is not None:
+            row['label'] = label
+    
+    day = order['created_at'][:10]
+    change('day', day, 0, 0)
+    for item in order_items:
+        revenue = item['quantity'] * item['price']
+        change('day', day, revenue, item['quantity'])
+        change('category', item.get('category') or 'other', revenue, item['quantity'])
+        change('product', item['product_id'], revenue, item['quantity'], item.get('name'))
+    return list(changes.values())
+
+def merge_sales_changes(totals, changes):
+    """Add changes into totals, a dict of (kind, bucket) -> stats row"""
+    for change in changes:
+        row = totals.setdefault((change['kind'], change['bucket']), {
+            'kind': change['kind'], 'bucket': change['bucket'], 'revenue': 0, 'orders': 0, 'units': 0
+        })
+        for field in ('revenue', 'orders', 'units'):
+            row[field] += change[field]
+        if 'label' in change:
+            row['label'] = change['label']
+
+class StorageBackend:
+    """Interface every storage engine implements.
+    
+    Items are plain dicts shaped like the DynamoDB items. Callers build complete
+    items (ids, timestamps) before handing them over, so every engine stores
+    exactly the same data. Returned items may be modified by the caller.
+    """
+    
+    name = None
+    
+    # Meta
+    def get_catalog_version(self):
+        raise NotImplementedError
+    
+    def increment_catalog_version(self):
+        raise NotImplementedError
+    
+    # Users
+    def create_user(self, user):
+        """Store a new user; raises ValueError if the email is already registered"""
+        raise NotImplementedError
+    
+    def get_user_by_email(self, email):
+        raise NotImplementedError
+    
+    def get_user_by_id(self, user_id):
+        raise NotImplementedError
+    
+    def get_users_by_ids(self, user_ids):
+        raise NotImplementedError
+    
+    def update_user_password_hash(self, user_id, password_hash):
+        raise NotImplementedError
+    
+    # Products
+    def get_all_products(self):
+        raise NotImplementedError
+    
+    def get_products_by_category(self, category, cursor, limit):
+        """Returns (products, next_cursor, prev_cursor), cheapest first"""
+        raise NotImplementedError
+    
+    def get_product_by_id(self, product_id):
+        raise NotImplementedError
+    
+    def get_products_by_ids(self, product_ids):
+        raise NotImplementedError
+    
+    def put_product(self, product):
+        raise NotImplementedError
+    
+    def update_product(self, product_id, fields):
+        raise NotImplementedError
+    
+    def delete_product(self, product_id):
+        raise NotImplementedError
+    
+    # Cart
+    def get_cart_items(self, user_id):
+        raise NotImplementedError
+    
+    def get_cart_item(self, user_id, product_id):
+        raise NotImplementedError
+    
+    def add_to_cart(self, user_id, product_id, quantity, price=None, catalog_version=None):
+        """Atomically add quantity to a cart line and update the cart summary with it.
+        price is the product's price at catalog_version (see change_cart_summary)."""
+        raise NotImplementedError
+    
+    def remove_from_cart(self, user_id, product_id, price=None, catalog_version=None):
+        """Atomically delete a cart line and take it out of the cart summary"""
+        raise NotImplementedError
+    
+    def get_cart_summary(self, user_id):
+        """{item_count, subtotal, catalog_version, revision}, or None if the user has none.
+        catalog_version is missing when the summary needs re-pricing."""
+        raise NotImplementedError
+    
+    def save_cart_summary(self, user_id, summary, revision):
+        """Store a re-priced summary unless the cart changed since the summary with
+        the given revision (None: no summary) was read; returns whether it was stored"""
+        raise NotImplementedError
+    
+    # Orders
+    def put_order(self, order):
+        raise NotImplementedError
+    
+    def get_orders_by_user(self, user_id):
+        """All orders of a user, newest first"""
+        raise NotImplementedError
+    
+    def get_orders_page(self, statuses, cursor, start_date, end_date, limit):
+        """Returns (orders, next_cursor), newest first"""
+        raise NotImplementedError
+    
+    def get_order_by_id(self, order_id):
+        raise NotImplementedError
+    
+    def get_orders_by_ids(self, order_ids):
+        """Returns a dict of order_id -> order; missing orders are absent"""
+        raise NotImplementedError
+    
+    def update_order_status(self, order_id, status, expected_status=None, sales_changes=()):
+        """Set an order's status, then apply sales_changes to the sales stats.
+        Raises OrderStatusConflict if expected_status is given and the order does not
+        have it (or does not exist); the stats are only changed if the status was.
+        See apply_sales_changes for how the stats are written."""
+        raise NotImplementedError
+    
+    # Order Items
+    def put_order_item(self, order_item):
+        raise NotImplementedError
+    
+    def get_order_items_by_order(self, order_id):
+        raise NotImplementedError
+    
+    def get_order_items_for_orders(self, orders):
+        """Returns a dict of order_id -> items"""
+        raise NotImplementedError
+    
+    # Checkout
+    def checkout(self, order, order_items, cart_items, notification=None, sales_changes=()):
+        """Atomically store the order, its items and the notification, delete the cart
+        lines and mark the cart summary for re-pricing, then apply sales_changes to the
+        sales stats (see apply_sales_changes) if the order was created. Returns
+        (order, created); created is False if the order id already exists.
+        Raises ValueError if a cart line's quantity changed since it was priced."""
+        raise NotImplementedError
+    
+    # Sales Stats
+    def apply_sales_changes(self, changes):
+        """Add sales_changes entries to their stats rows.
+        
+        Every order of a day shares that day's rows, so engines where that would make
+        orders conflict with each other write the stats after the order, outside its
+        transaction. A failure there is logged and never fails the order, and
+        rebuild_sales_stats.py recomputes the totals from the orders."""
+        raise NotImplementedError
+    
+    def get_sales_stats(self, kind, first=None, last=None):
+        """Stats rows of a kind with first <= bucket <= last (either may be None), by bucket"""
+        raise NotImplementedError
+    
+    def get_top_sales(self, kind, limit):
+        """The limit stats rows of a kind with the most revenue, highest first"""
+        raise NotImplementedError
+    
+    def replace_sales_stats(self, rows):
+        """Replace every stats row with rows, e.g. after recomputing them from the orders"""
+        raise NotImplementedError
+    
+    # Notification Outbox
+    def claim_outbox_notification(self, notification_id, lease_seconds):
+        raise NotImplementedError
+    
+    def get_expired_outbox_notifications(self):
+        raise NotImplementedError
+    
+    def delete_outbox_notification(self, notification_id):
+        raise NotImplementedError
+
+# ==================== DYNAMODB ====================
+
+class RateLimiter:
+    """Token bucket shared by threads: lets through units_per_second on average.
+    Callers wait() before a request and consume() what it actually cost, so a
+    request may overdraw the bucket and the next ones wait until it is paid back."""
+    
+    def __init__(self, units_per_second):
+        self.rate = units_per_second
+        self.available = units_per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # At most one second of unused capacity is saved up
+                self.available = min(self.rate, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available > 0:
+                    return
+                delay = -self.available / self.rate
+            time.sleep(delay)
+    
+    def consume(self, units):
+        with self.lock:
+            self.available -= units
+
+def scan_pages(table, segments=SCAN_SEGMENTS, projection=None, capacity_per_second=None, start_keys=None, **scan_kwargs):
+    """Scan a whole DynamoDB table with one thread per segment; yields (segment, items, last_key) per page.
+    
+    Every segment is followed through LastEvaluatedKey to its end; last_key is None
+    on a segment's final page. Pages are handed over through a small queue, so
+    memory stays flat however big the table is, and the threads stop when the
+    caller stops iterating. projection lists the attributes to read.
+    capacity_per_second caps the read capacity units the scan consumes, leaving
+    the rest of the table's capacity to live traffic. To resume a scan, pass the
+    last key seen per segment as start_keys ({segment: key}); segments mapped to
+    None are finished and skipped. Extra scan_kwargs (e.g. FilterExpression) are
+    passed to every Scan call.
+    
+    A boto3 Table must not be used from several threads, so the segments call
+    the table's client instead, which may be; it converts items and keys the same way.
+    """
+    client = table.meta.client
+    table_name = table.name
+    if projection:
+        names = dict(scan_kwargs.get('ExpressionAttributeNames', {}))
+        names.update({f'#p{index}': name for index, name in enumerate(projection)})
+        scan_kwargs['ExpressionAttributeNames'] = names
+        scan_kwargs['ProjectionExpression'] = ', '.join(f'#p{index}' for index in range(len(projection)))
+    limiter = RateLimiter(capacity_per_second) if capacity_per_second else None
+    if limiter:
+        scan_kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+    start_keys = start_keys or {}
+    pending = [segment for segment in range(segments) if start_keys.get(segment, True) is not None]
+    
+    pages = queue.Queue(maxsize=segments)
+    stop = threading.Event()
+    
+    def hand_over(entry):
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def scan_segment(segment):
+        try:
+            kwargs = dict(scan_kwargs, TableName=table_name, Segment=segment, TotalSegments=segments)
+            if start_keys.get(segment):
+                kwargs['ExclusiveStartKey'] = start_keys[segment]
+            while not stop.is_set():
+                if limiter:
+                    limiter.wait()
+                response = client.scan(**kwargs)
+                if limiter:
+                    limiter.consume(response.get('ConsumedCapacity', {}).get('CapacityUnits', 1))
+                last_key = response.get('LastEvaluatedKey')
+                if not hand_over(('page', (segment, response.get('Items', []), last_key))) or not last_key:
+                    break
+                kwargs['ExclusiveStartKey'] = last_key
+        except Exception as e:
+            hand_over(('error', e))
+        finally:
+            hand_over(('done', segment))
+    
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(scan_segment, segment), daemon=True)
+        for segment in pending
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            kind, value = pages.get()
+            if kind == 'page':
+                yield value
+            elif kind == 'error':
+                raise value
+            else:
+                running -= 1
+    finally:
+        stop.set()
+
+def parallel_scan(table, segments=SCAN_SEGMENTS, projection=None, capacity_per_second=None, **scan_kwargs):
+    """Yield every item of a DynamoDB table, scanning segments in parallel (see scan_pages)"""
+    for _, items, _ in scan_pages(table, segments, projection, capacity_per_second, **scan_kwargs):
+        yield from items
+
+class DynamoDBBackend(StorageBackend):
+    """Production engine backed by the FF_* DynamoDB tables"""
+    
+    name = 'dynamodb'
+    
+    def __init__(self, region, endpoint_url=None, query_workers=8, max_connections=10, scan_segments=SCAN_SEGMENTS):
+        import boto3
+        from botocore.config import Config
+        from boto3.dynamodb.conditions import Key
+        from boto3.dynamodb.types import TypeSerializer
+        from botocore.exceptions import ClientError
+        
+        self.Key = Key
+        self.ClientError = ClientError
+        self.type_serializer = TypeSerializer()
+        self.query_workers = query_workers
+        self.scan_segments = scan_segments
+        
+        # Each client keeps its own connection pool, sized for the requests in flight
+        config = Config(max_pool_connections=max_connections)
+        self.dynamodb = boto3.resource('dynamodb', region_name=region, endpoint_url=endpoint_url, config=config)
+        self.client = boto3.client('dynamodb', region_name=region, endpoint_url=endpoint_url, config=config)
+        
+        self.users_table = self.dynamodb.Table(DYNAMODB_TABLE_USERS)
+        self.products_table = self.dynamodb.Table(DYNAMODB_TABLE_PRODUCTS)
+        self.cart_table = self.dynamodb.Table(DYNAMODB_TABLE_CART)
+        self.orders_table = self.dynamodb.Table(DYNAMODB_TABLE_ORDERS)
+        self.order_items_table = self.dynamodb.Table(DYNAMODB_TABLE_ORDER_ITEMS)
+        self.meta_table = self.dynamodb.Table(DYNAMODB_TABLE_META)
+        self.outbox_table = self.dynamodb.Table(DYNAMODB_TABLE_OUTBOX)
+        self.sales_stats_table = self.dynamodb.Table(DYNAMODB_TABLE_SALES_STATS)
+    
+    def add_call_listener(self, listener):
+        """Report every DynamoDB API call to listener(operation, tables, seconds, capacity, error).
+        capacity lists (table, capacity units) as returned by ReturnConsumedCapacity."""
+        def request_capacity(params, model):
+            if 'ReturnConsumedCapacity' in model.input_shape.members:
+                params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+        
+        def report(operation, params, seconds, parsed):
+            if 'TableName' in params:
+                tables = [params['TableName']]
+            elif 'RequestItems' in params:
+                tables = list(params['RequestItems'])
+            else:
+                tables = list(dict.fromkeys(
+                    action['TableName'] for item in params.get('TransactItems', []) for action in item.values()
+                ))
+            consumed = (parsed or {}).get('ConsumedCapacity', [])
+            if isinstance(consumed, dict):
+                consumed = [consumed]
+            capacity = [(entry['TableName'], entry.get('CapacityUnits', 0)) for entry in consumed]
+            error = 'ConnectionError' if parsed is None else parsed.get('Error', {}).get('Code')
+            listener(operation, tables, seconds, capacity, error)
+        
+        # The resource and the low-level client each have their own event hooks
+        for client in (self.client, self.dynamodb.meta.client):
+            listen_to_calls(client, report, request_capacity)
+    
+    # Helpers
+    def to_dynamodb_item(self, item):
+        """Serialize a plain item for low-level client calls"""
+        return {key: self.type_serializer.serialize(value) for key, value in item.items()}
+    
+    def query_all(self, table, **query_kwargs):
+        """Run a Query and follow LastEvaluatedKey until every page has been read"""
+        items = []
+        while True:
+            response = table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def batch_get_items(self, table_name, key_name, ids):
+        """Get many items by hash key with BatchGetItem; returns a dict of id -> item.
+        Ids are deduplicated and missing items are simply absent from the result."""
+        unique_ids = list(dict.fromkeys(ids))
+        items = {}
+        
+        for start in range(0, len(unique_ids), BATCH_GET_MAX_KEYS):
+            chunk = unique_ids[start:start + BATCH_GET_MAX_KEYS]
+            request_items = {table_name: {'Keys': [{key_name: item_id} for item_id in chunk]}}
+            
+            attempt = 0
+            while request_items:
+                response = self.dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(table_name, []):
+                    items[item[key_name]] = item
+                
+                # Throttled keys come back unprocessed and must be retried with backoff
+                request_items = response.get('UnprocessedKeys')
+                if request_items:
+                    attempt += 1
+                    if attempt > BATCH_GET_MAX_RETRIES:
+                        raise RuntimeError(f"Could not read all items from {table_name}, please try again")
+                    time.sleep(0.05 * 2 ** attempt)
+        
+        return items
+    
+    def transact(self, actions):
+        """Run a transaction, retrying it when it only lost a race with another one,
+        e.g. a cart change from another tab during checkout."""
+        attempt = 0
+        while True:
+            try:
+                return self.client.transact_write_items(TransactItems=actions)
+            except self.ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                codes = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+                if 'TransactionConflict' not in codes or 'ConditionalCheckFailed' in codes or attempt >= TRANSACT_MAX_RETRIES:
+                    raise
+                attempt += 1
+                time.sleep(0.05 * attempt)
+    
+    # Meta
+    def get_catalog_version(self):
+        response = self.meta_table.get_item(Key={'meta_key': 'catalog_version'})
+        return int(response.get('Item', {}).get('version', 0))
+    
+    def increment_catalog_version(self):
+        response = self.meta_table.update_item(
+            Key={'meta_key': 'catalog_version'},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['version'])
+    
+    # Users
+    def create_user(self, user):
+        # The reservation item has no email attribute, so it never shows up in the email index
+        reservation = {'user_id': f"EMAIL#{user['email']}", 'owner_id': user['user_id']}
+        try:
+            self.client.transact_write_items(
+                TransactItems=[
+                    {
+                        'Put': {
+                            'TableName': DYNAMODB_TABLE_USERS,
+                            'Item': self.to_dynamodb_item(reservation),
+                            'ConditionExpression': 'attribute_not_exists(user_id)'
+                        }
+                    },
+                    {
+                        'Put': {
+                            'TableName': DYNAMODB_TABLE_USERS,
+                            'Item': self.to_dynamodb_item(user),
+                            'ConditionExpression': 'attribute_not_exists(user_id)'
+                        }
+                    }
+                ]
+            )
+        except self.ClientError as e:
+            # Only a failed reservation means the email is taken; conflicts, throttling
+            # and the like are not the user's doing
+            reasons = e.response.get('CancellationReasons', [])
+            if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+                raise ValueError("Email already registered")
+            raise
+    
+    def get_user_by_email(self, email):
+        response = self.users_table.query(
+            IndexName=DYNAMODB_INDEX_USERS_EMAIL,
+            KeyConditionExpression=self.Key('email').eq(email),
+            Limit=1
+        )
+        items = response.get('Items', [])
+        return items[0] if items else None
+    
+    def get_user_by_id(self, user_id):
+        response = self.users_table.get_item(Key={'user_id': user_id})
+        return response.get('Item')
+    
+    def get_users_by_ids(self, user_ids):
+        return self.batch_get_items(DYNAMODB_TABLE_USERS, 'user_id', user_ids)
+    
+    def update_user_password_hash(self, user_id, password_hash):
+        try:
+            self.users_table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET password_hash = :hash',
+                ConditionExpression='attribute_exists(user_id)',
+                ExpressionAttributeValues={':hash': password_hash}
+            )
+        except self.ClientError as e:
+            # The user was deleted in the meantime
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    
+    # Products
+    def get_all_products(self):
+        return list(parallel_scan(self.products_table, self.scan_segments))
+    
+    def get_products_by_category(self, category, cursor, limit):
+        def fetch(start_key, backwards, count):
+            query_kwargs = {
+                'IndexName': DYNAMODB_INDEX_PRODUCTS_CATEGORY,
+                'KeyConditionExpression': self.Key('category').eq(category),
+                'ScanIndexForward': not backwards,
+                'Limit': count
+            }
+            if start_key:
+                query_kwargs['ExclusiveStartKey'] = start_key
+            return self.products_table.query(**query_kwargs).get('Items', [])
+        return paginate_products(fetch, cursor, limit)
+    
+    def get_product_by_id(self, product_id):
+        response = self.products_table.get_item(Key={'product_id': product_id})
+        return response.get('Item')
+    
+    def get_products_by_ids(self, product_ids):
+        return self.batch_get_items(DYNAMODB_TABLE_PRODUCTS, 'product_id', product_ids)
+    
+    def put_product(self, product):
+        self.products_table.put_item(Item=product)
+    
+    def update_product(self, product_id, fields):
+        names = {f'#f{index}': name for index, name in enumerate(fields)}
+        values = {f':v{index}': value for index, value in enumerate(fields.values())}
+        self.products_table.update_item(
+            Key={'product_id': product_id},
+            UpdateExpression='SET ' + ', '.join(f'#f{index} = :v{index}' for index in range(len(fields))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    
+    def delete_product(self, product_id):
+        self.products_table.delete_item(Key={'product_id': product_id})
+    
+    # Cart
+    def get_cart_items(self, user_id):
+        items = self.query_all(self.cart_table, KeyConditionExpression=self.Key('user_id').eq(user_id))
+        return [item for item in items if item['product_id'] != CART_SUMMARY_ID]
+    
+    def get_cart_item(self, user_id, product_id):
+        response = self.cart_table.get_item(Key={'user_id': user_id, 'product_id': product_id})
+        return response.get('Item')
+    
+    def cart_summary_update(self, user_id, quantity=0, price=None, catalog_version=None):
+        """Transaction action applying change_cart_summary to the stored summary"""
+        update = {
+            'TableName': DYNAMODB_TABLE_CART,
+            'Key': self.to_dynamodb_item({'user_id': user_id, 'product_id': CART_SUMMARY_ID})
+        }
+        if price is None:
+            update['UpdateExpression'] = 'ADD revision :one REMOVE catalog_version'
+            update['ExpressionAttributeValues'] = self.to_dynamodb_item({':one': 1})
+        else:
+            update['UpdateExpression'] = 'ADD revision :one, item_count :qty, subtotal :amount'
+            update['ConditionExpression'] = 'catalog_version = :version'
+            update['ExpressionAttributeValues'] = self.to_dynamodb_item({
+                ':one': 1, ':qty': quantity, ':amount': quantity * price, ':version': catalog_version
+            })
+        return {'Update': update}
+    
+    def change_cart(self, user_id, line_action, quantity, price, catalog_version):
+        """Apply a cart line action and the matching summary update in one transaction.
+        Falls back to marking the summary for re-pricing when it was not priced at
+        catalog_version. Returns False if the line action's own condition failed."""
+        summary_actions = [self.cart_summary_update(user_id)]
+        if price is not None:
+            summary_actions.insert(0, self.cart_summary_update(user_id, quantity, price, catalog_version))
+        
+        attempt = 0
+        while True:
+            try:
+                self.client.transact_write_items(TransactItems=[line_action, summary_actions[0]])
+                return True
+            except self.ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                codes = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+                if codes and codes[0] == 'ConditionalCheckFailed':
+                    return False
+                if len(codes) > 1 and codes[1] == 'ConditionalCheckFailed' and len(summary_actions) > 1:
+                    summary_actions.pop(0)
+                elif 'TransactionConflict' in codes and attempt < TRANSACT_MAX_RETRIES:
+                    # Another request is changing the same cart; concurrent clicks must not be lost
+                    attempt += 1
+                    time.sleep(0.05 * attempt)
+                else:
+                    raise
+    
+    def add_to_cart(self, user_id, product_id, quantity, price=None, catalog_version=None):
+        # ADD creates the line if needed and increments atomically
+        self.change_cart(user_id, {
+            'Update': {
+                'TableName': DYNAMODB_TABLE_CART,
+                'Key': self.to_dynamodb_item({'user_id': user_id, 'product_id': product_id}),
+                'UpdateExpression': 'ADD quantity :qty',
+                'ExpressionAttributeValues': self.to_dynamodb_item({':qty': quantity})
+            }
+        }, quantity, price, catalog_version)
+    
+    def remove_from_cart(self, user_id, product_id, price=None, catalog_version=None):
+        for _ in range(TRANSACT_MAX_RETRIES + 1):
+            item = self.get_cart_item(user_id, product_id)
+            if not item:
+                return
+            # Only delete the quantity that is taken out of the summary
+            removed = self.change_cart(user_id, {
+                'Delete': {
+                    'TableName': DYNAMODB_TABLE_CART,
+                    'Key': self.to_dynamodb_item({'user_id': user_id, 'product_id': product_id}),
+                    'ConditionExpression': 'quantity = :qty',
+                    'ExpressionAttributeValues': self.to_dynamodb_item({':qty': item['quantity']})
+                }
+            }, -item['quantity'], price, catalog_version)
+            if removed:
+                return
+        raise ValueError("Your cart is being changed elsewhere. Please try again.")
+    
+    def get_cart_summary(self, user_id):
+        response = self.cart_table.get_item(Key={'user_id': user_id, 'product_id': CART_SUMMARY_ID})
+        return response.get('Item')
+    
+    def save_cart_summary(self, user_id, summary, revision):
+        item = dict(summary, user_id=user_id, product_id=CART_SUMMARY_ID, revision=revision or 0)
+        if revision is None:
+            condition = {'ConditionExpression': 'attribute_not_exists(product_id)'}
+        else:
+            condition = {'ConditionExpression': 'revision = :revision', 'ExpressionAttributeValues': {':revision': revision}}
+        try:
+            self.cart_table.put_item(Item=item, **condition)
+            return True
+        except self.ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+    
+    # Orders
+    def put_order(self, order):
+        self.orders_table.put_item(Item=order)
+    
+    def get_orders_by_user(self, user_id):
+        return self.query_all(
+            self.orders_table,
+            IndexName=DYNAMODB_INDEX_ORDERS_USER,
+            KeyConditionExpression=self.Key('user_id').eq(user_id),
+            ScanIndexForward=False
+        )
+    
+    def get_orders_page(self, statuses, cursor, start_date, end_date, limit):
+        """Each status is its own partition in the status index, so one query runs per
+        status and the results are merged by date. The cursor stores how far every
+        status has been read; statuses missing from it are exhausted."""
+        positions, _ = decode_cursor(cursor)
+        if positions is None:
+            positions = {status: None for status in statuses}
+        statuses = [status for status in statuses if status in positions]
+        
+        date_range = self.Key('created_at').between(*order_date_bounds(start_date, end_date))
+        
+        def query_status(status):
+            query_kwargs = {
+                'IndexName': DYNAMODB_INDEX_ORDERS_STATUS,
+                'KeyConditionExpression': self.Key('status').eq(status) & date_range,
+                'ScanIndexForward': False,
+                'Limit': limit + 1
+            }
+            if positions[status]:
+                query_kwargs['ExclusiveStartKey'] = positions[status]
+            response = self.orders_table.query(**query_kwargs)
+            return response.get('Items', []), 'LastEvaluatedKey' in response
+        
+        results = {}
+        if statuses:
+            results = dict(zip(statuses, map_concurrently(
+                query_status, statuses, min(self.query_workers, len(statuses))
+            )))
+        
+        merged = heapq.merge(
+            *[items for items, _ in results.values()],
+            key=lambda order: order['created_at'],
+            reverse=True
+        )
+        orders = [order for _, order in zip(range(limit), merged)]
+        
+        consumed = {}
+        for order in orders:
+            consumed[order['status']] = order
+        
+        next_positions = {}
+        for status, (items, has_more) in results.items():
+            last = consumed.get(status)
+            taken = sum(1 for order in orders if order['status'] == status)
+            if taken < len(items) or has_more:
+                next_positions[status] = order_index_key(last) if last else positions[status]
+        
+        next_cursor = encode_cursor(next_positions, 'next') if next_positions else None
+        return orders, next_cursor
+    
+    def get_order_by_id(self, order_id):
+        response = self.orders_table.get_item(Key={'order_id': order_id})
+        return response.get('Item')
+    
+    def get_orders_by_ids(self, order_ids):
+        return self.batch_get_items(DYNAMODB_TABLE_ORDERS, 'order_id', order_ids)
+    
+    def update_order_status(self, order_id, status, expected_status=None, sales_changes=()):
+        values = {':status': status}
+        update = {
+            'TableName': DYNAMODB_TABLE_ORDERS,
+            'Key': self.to_dynamodb_item({'order_id': order_id}),
+            'UpdateExpression': 'SET #status = :status',
+            'ExpressionAttributeNames': {'#status': 'status'}
+        }
+        if expected_status is not None:
+            update['ConditionExpression'] = '#status = :expected'
+            values[':expected'] = expected_status
+        update['ExpressionAttributeValues'] = self.to_dynamodb_item(values)
+        try:
+            self.client.update_item(**update)
+        except self.ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                raise OrderStatusConflict(f"Order {order_id} is no longer {expected_status}")
+            raise
+        self.apply_sales_changes(sales_changes)
+    
+    # Order Items
+    def put_order_item(self, order_item):
+        self.order_items_table.put_item(Item=order_item)
+    
+    def get_order_items_by_order(self, order_id):
+        return self.query_all(
+            self.order_items_table,
+            IndexName=DYNAMODB_INDEX_ORDER_ITEMS_ORDER,
+            KeyConditionExpression=self.Key('order_id').eq(order_id)
+        )
+    
+    def get_order_items_for_orders(self, orders):
+        """Orders that record their order_item_ids are served by BatchGetItem, older
+        orders fall back to concurrent queries on the order_id index."""
+        items_by_order = {order['order_id']: [] for order in orders}
+        
+        item_ids = [item_id for order in orders for item_id in order.get('order_item_ids', [])]
+        for item in self.batch_get_items(DYNAMODB_TABLE_ORDER_ITEMS, 'order_item_id', item_ids).values():
+            items_by_order[item['order_id']].append(item)
+        
+        legacy_order_ids = [order['order_id'] for order in orders if 'order_item_ids' not in order]
+        if legacy_order_ids:
+            legacy_items = map_concurrently(
+                self.get_order_items_by_order, legacy_order_ids, min(self.query_workers, len(legacy_order_ids))
+            )
+            for order_id, items in zip(legacy_order_ids, legacy_items):
+                items_by_order[order_id] = items
+        
+        return items_by_order
+    
+    # Checkout
+    def checkout(self, order, order_items, cart_items, notification=None, sales_changes=()):
+        user_id = order['user_id']
+        order_put = {
+            'Put': {
+                'TableName': DYNAMODB_TABLE_ORDERS,
+                'Item': self.to_dynamodb_item(order),
+                'ConditionExpression': 'attribute_not_exists(order_id)'
+            }
+        }
+        item_puts = [
+            {'Put': {'TableName': DYNAMODB_TABLE_ORDER_ITEMS, 'Item': self.to_dynamodb_item(item)}}
+            for item in order_items
+        ]
+        commit_puts = [order_put, self.cart_summary_update(user_id)]
+        if notification:
+            commit_puts.append({'Put': {'TableName': DYNAMODB_TABLE_OUTBOX, 'Item': self.to_dynamodb_item(notification)}})
+        cart_deletes = [
+            {
+                'Delete': {
+                    'TableName': DYNAMODB_TABLE_CART,
+                    'Key': self.to_dynamodb_item({'user_id': user_id, 'product_id': item['product_id']}),
+                    'ConditionExpression': 'quantity = :qty',
+                    'ExpressionAttributeValues': self.to_dynamodb_item({':qty': item['quantity']})
+                }
+            }
+            for item in cart_items
+        ]
+        
+        if len(commit_puts) + len(item_puts) + len(cart_deletes) <= TRANSACT_MAX_ITEMS:
+            transaction = commit_puts + item_puts + cart_deletes
+            leftover_deletes = []
+        else:
+            # Too big for one transaction: write the items first under deterministic ids,
+            # which is safe to repeat and invisible until the order exists. The transaction
+            # holding the order Put stays the single commit point.
+            with self.order_items_table.batch_writer() as batch:
+                for item in order_items:
+                    batch.put_item(Item=item)
+            room = TRANSACT_MAX_ITEMS - len(commit_puts)
+            transaction = commit_puts + cart_deletes[:room]
+            leftover_deletes = cart_items[room:]
+        
+        try:
+            self.transact(transaction)
+        except self.ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons', [])
+            if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+                return self.get_order_by_id(order['order_id']), False
+            if any(reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons):
+                raise ValueError("Your cart changed during checkout. Please review it and try again.")
+            raise
+        
+        with self.cart_table.batch_writer() as batch:
+            for item in leftover_deletes:
+                batch.delete_item(Key={'user_id': user_id, 'product_id': item['product_id']})
+        self.apply_sales_changes(sales_changes)
+        
+        return order, True
+    
+    # Sales Stats
+    def sales_stats_update(self, change):
+        """UpdateItem parameters adding one sales_changes entry to its stats row"""
+        expression = 'ADD #revenue :revenue, #orders :orders, #units :units'
+        names = {'#revenue': 'revenue', '#orders': 'orders', '#units': 'units'}
+        values = {':revenue': change['revenue'], ':orders': change['orders'], ':units': change['units']}
+        if 'label' in change:
+            expression += ' SET #label = :label'
+            names['#label'] = 'label'
+            values[':label'] = change['label']
+        return {
+            'TableName': DYNAMODB_TABLE_SALES_STATS,
+            'Key': self.to_dynamodb_item({'kind': change['kind'], 'bucket': change['bucket']}),
+            'UpdateExpression': expression,
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': self.to_dynamodb_item(values)
+        }
+    
+    def apply_sales_changes(self, changes):
+        """One UpdateItem per stats row, side by side. Plain updates of a shared row
+        queue up instead of cancelling each other as transactions would."""
+        def apply(change):
+            try:
+                self.client.update_item(**self.sales_stats_update(change))
+            except Exception as e:
+                print(f"Could not update sales stats {change['kind']} {change['bucket']}: {e}")
+        
+        changes = list(changes)
+        if changes:
+            map_concurrently(apply, changes, min(self.query_workers, len(changes)))
+    
+    def get_sales_stats(self, kind, first=None, last=None):
+        condition = self.Key('kind').eq(kind)
+        if first is not None and last is not None:
+            condition &= self.Key('bucket').between(first, last)
+        elif first is not None:
+            condition &= self.Key('bucket').gte(first)
+        elif last is not None:
+            condition &= self.Key('bucket').lte(last)
+        return self.query_all(self.sales_stats_table, KeyConditionExpression=condition)
+    
+    def get_top_sales(self, kind, limit):
+        response = self.sales_stats_table.query(
+            IndexName=DYNAMODB_INDEX_SALES_STATS_REVENUE,
+            KeyConditionExpression=self.Key('kind').eq(kind),
+            ScanIndexForward=False,
+            Limit=limit
+        )
+        return response.get('Items', [])
+    
+    def replace_sales_stats(self, rows):
+        existing = parallel_scan(self.sales_stats_table, self.scan_segments, projection=['kind', 'bucket'])
+        stale = {(row['kind'], row['bucket']) for row in existing} - {(row['kind'], row['bucket']) for row in rows}
+        with self.sales_stats_table.batch_writer() as batch:
+            for row in rows:
+                batch.put_item(Item=row)
+            for kind, bucket in stale:
+                batch.delete_item(Key={'kind': kind, 'bucket': bucket})
+    
+    # Notification Outbox
+    def claim_outbox_notification(self, notification_id, lease_seconds):
+        now = int(time.time())
+        try:
+            self.outbox_table.update_item(
+                Key={'notification_id': notification_id},
+                UpdateExpression='SET lease_until = :until',
+                ConditionExpression='attribute_exists(notification_id) AND lease_until < :now',
+                ExpressionAttributeValues={':until': now + lease_seconds, ':now': now}
+            )
+            return True
+        except self.ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+    
+    def get_expired_outbox_notifications(self):
+        scan_kwargs = {
+            'FilterExpression': 'lease_until < :now',
+            'ExpressionAttributeValues': {':now': int(time.time())}
+        }
+        items = []
+        while True:
+            response = self.outbox_table.scan(**scan_kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def delete_outbox_notification(self, notification_id):
+        self.outbox_table.delete_item(Key={'notification_id': notification_id})
+
+# ==================== IN-MEMORY ====================
+
+class MemoryBackend(StorageBackend):
+    """Dictionary engine for tests and load runs without AWS.
+    
+    Data lives in the process, so it is not shared between gunicorn workers and
+    is lost on restart; run it with a single worker. The same access paths as the
+    DynamoDB indexes are kept as sorted lists, so lookups cost about the same
+    number of steps as their DynamoDB counterparts rather than a full scan.
+    """
+    
+    name = 'memory'
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.meta = {}
+        self.users = {}
+        self.user_ids_by_email = {}
+        self.products = {}
+        self.products_by_category = {}   # category -> sorted [(price, product_id)]
+        self.carts = {}                  # user_id -> {product_id: item}
+        self.cart_summaries = {}
+        self.orders = {}
+        self.orders_by_user = {}         # user_id -> sorted [(created_at, order_id)]
+        self.orders_by_status = {}       # status -> sorted [(created_at, order_id)]
+        self.order_items = {}
+        self.order_item_ids_by_order = {}
+        self.outbox = {}
+        self.sales_stats = {}            # (kind, bucket) -> stats row
+    
+    @staticmethod
+    def copy(item):
+        return dict(item) if item is not None else None
+    
+    # Meta
+    def get_catalog_version(self):
+        with self.lock:
+            return self.meta.get('catalog_version', 0)
+    
+    def increment_catalog_version(self):
+        with self.lock:
+            self.meta['catalog_version'] = self.meta.get('catalog_version', 0) + 1
+            return self.meta['catalog_version']
+    
+    # Users
+    def create_user(self, user):
+        with self.lock:
+            if user['email'] in self.user_ids_by_email:
+                raise ValueError("Email already registered")
+            self.users[user['user_id']] = dict(user)
+            self.user_ids_by_email[user['email']] = user['user_id']
+    
+    def get_user_by_email(self, email):
+        with self.lock:
+            user_id = self.user_ids_by_email.get(email)
+            return self.copy(self.users.get(user_id))
+    
+    def get_user_by_id(self, user_id):
+        with self.lock:
+            return self.copy(self.users.get(user_id))
+    
+    def get_users_by_ids(self, user_ids):
+        with self.lock:
+            return {user_id: dict(self.users[user_id]) for user_id in user_ids if user_id in self.users}
+    
+    def update_user_password_hash(self, user_id, password_hash):
+        with self.lock:
+            if user_id in self.users:
+                self.users[user_id]['password_hash'] = password_hash
+    
+    # Products
+    def get_all_products(self):
+        with self.lock:
+            return [dict(product) for product in self.products.values()]
+    
+    def get_products_by_category(self, category, cursor, limit):
+        def fetch(start_key, backwards, count):
+            with self.lock:
+                index = self.products_by_category.get(category, [])
+                if start_key:
+                    position = (start_key['price'], start_key['product_id'])
+                    if backwards:
+                        keys = index[:bisect.bisect_left(index, position)][::-1][:count]
+                    else:
+                        keys = index[bisect.bisect_right(index, position):][:count]
+                else:
+                    keys = index[::-1][:count] if backwards else index[:count]
+                return [dict(self.products[product_id]) for _, product_id in keys]
+        return paginate_products(fetch, cursor, limit)
+    
+    def get_product_by_id(self, product_id):
+        with self.lock:
+            return self.copy(self.products.get(product_id))
+    
+    def get_products_by_ids(self, product_ids):
+        with self.lock:
+            return {
+                product_id: dict(self.products[product_id])
+                for product_id in product_ids if product_id in self.products
+            }
+    
+    def _unindex_product(self, product):
+        index = self.products_by_category.get(product['category'], [])
+        position = bisect.bisect_left(index, (product['price'], product['product_id']))
+        if position < len(index) and index[position][1] == product['product_id']:
+            del index[position]
+    
+    def put_product(self, product):
+        with self.lock:
+            if product['product_id'] in self.products:
+                self._unindex_product(self.products[product['product_id']])
+            self.products[product['product_id']] = dict(product)
+            bisect.insort(
+                self.products_by_category.setdefault(product['category'], []),
+                (product['price'], product['product_id'])
+            )
+    
+    def update_product(self, product_id, fields):
+        with self.lock:
+            product = dict(self.products.get(product_id, {'product_id': product_id}))
+            product.update(fields)
+            self.put_product(product)
+    
+    def delete_product(self, product_id):
+        with self.lock:
+            product = self.products.pop(product_id, None)
+            if product:
+                self._unindex_product(product)
+    
+    # Cart
+    def get_cart_items(self, user_id):
+        with self.lock:
+            return [dict(item) for item in self.carts.get(user_id, {}).values()]
+    
+    def get_cart_item(self, user_id, product_id):
+        with self.lock:
+            return self.copy(self.carts.get(user_id, {}).get(product_id))
+    
+    def add_to_cart(self, user_id, product_id, quantity, price=None, catalog_version=None):
+        with self.lock:
+            cart = self.carts.setdefault(user_id, {})
+            item = cart.setdefault(product_id, {'user_id': user_id, 'product_id': product_id, 'quantity': 0})
+            item['quantity'] += quantity
+            change_cart_summary(self.cart_summaries.setdefault(user_id, {}), quantity, price, catalog_version)
+    
+    def remove_from_cart(self, user_id, product_id, price=None, catalog_version=None):
+        with self.lock:
+            item = self.carts.get(user_id, {}).pop(product_id, None)
+            if item:
+                change_cart_summary(self.cart_summaries.setdefault(user_id, {}), -item['quantity'], price, catalog_version)
+    
+    def get_cart_summary(self, user_id):
+        with self.lock:
+            return self.copy(self.cart_summaries.get(user_id))
+    
+    def save_cart_summary(self, user_id, summary, revision):
+        with self.lock:
+            if self.cart_summaries.get(user_id, {}).get('revision') != revision:
+                return False
+            self.cart_summaries[user_id] = dict(summary, revision=revision or 0)
+            return True
+    
+    # Orders
+    def put_order(self, order):
+        with self.lock:
+            previous = self.orders.get(order['order_id'])
+            if previous:
+                self._unindex_order(previous)
+            self.orders[order['order_id']] = dict(order)
+            position = (order['created_at'], order['order_id'])
+            bisect.insort(self.orders_by_user.setdefault(order['user_id'], []), position)
+            bisect.insort(self.orders_by_status.setdefault(order['status'], []), position)
+    
+    def _unindex_order(self, order):
+        position = (order['created_at'], order['order_id'])
+        for index in (self.orders_by_user.get(order['user_id'], []), self.orders_by_status.get(order['status'], [])):
+            at = bisect.bisect_left(index, position)
+            if at < len(index) and index[at] == position:
+                del index[at]
+    
+    def get_orders_by_user(self, user_id):
+        with self.lock:
+            return [dict(self.orders[order_id]) for _, order_id in reversed(self.orders_by_user.get(user_id, []))]
+    
+    def get_orders_page(self, statuses, cursor, start_date, end_date, limit):
+        start_key, _ = decode_cursor(cursor)
+        low, high = order_date_bounds(start_date, end_date)
+        upper = (high, '')
+        if start_key:
+            upper = min(upper, (start_key['created_at'], start_key['order_id']))
+        
+        with self.lock:
+            # Newest first within each status, bounded by the date range and the cursor
+            ranges = []
+            for status in statuses:
+                index = self.orders_by_status.get(status, [])
+                begin = bisect.bisect_left(index, (low, ''))
+                end = bisect.bisect_left(index, upper)
+                ranges.append(reversed(index[begin:end]))
+            positions = list(heapq.merge(*ranges, reverse=True))[:limit + 1]
+            orders = [dict(self.orders[order_id]) for _, order_id in positions]
+        
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        next_cursor = encode_cursor(order_index_key(orders[-1]), 'next') if has_more else None
+        return orders, next_cursor
+    
+    def get_order_by_id(self, order_id):
+        with self.lock:
+            return self.copy(self.orders.get(order_id))
+    
+    def get_orders_by_ids(self, order_ids):
+        with self.lock:
+            return {order_id: dict(self.orders[order_id]) for order_id in order_ids if order_id in self.orders}
+    
+    def update_order_status(self, order_id, status, expected_status=None, sales_changes=()):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if expected_status is not None and (not order or order['status'] != expected_status):
+                raise OrderStatusConflict(f"Order {order_id} is no longer {expected_status}")
+            order = dict(order)
+            order['status'] = status
+            self.put_order(order)
+            self.apply_sales_changes(sales_changes)
+    
+    # Order Items
+    def put_order_item(self, order_item):
+        with self.lock:
+            if order_item['order_item_id'] not in self.order_items:
+                self.order_item_ids_by_order.setdefault(order_item['order_id'], []).append(order_item['order_item_id'])
+            self.order_items[order_item['order_item_id']] = dict(order_item)
+    
+    def get_order_items_by_order(self, order_id):
+        with self.lock:
+            return [dict(self.order_items[item_id]) for item_id in self.order_item_ids_by_order.get(order_id, [])]
+    
+    def get_order_items_for_orders(self, orders):
+        return {order['order_id']: self.get_order_items_by_order(order['order_id']) for order in orders}
+    
+    # Checkout
+    def checkout(self, order, order_items, cart_items, notification=None, sales_changes=()):
+        with self.lock:
+            existing = self.orders.get(order['order_id'])
+            if existing:
+                return dict(existing), False
+            
+            cart = self.carts.get(order['user_id'], {})
+            for item in cart_items:
+                line = cart.get(item['product_id'])
+                if not line or line['quantity'] != item['quantity']:
+                    raise ValueError("Your cart changed during checkout. Please review it and try again.")
+            
+            self.put_order(order)
+            for order_item in order_items:
+                self.put_order_item(order_item)
+            if notification:
+                self.outbox[notification['notification_id']] = dict(notification)
+            for item in cart_items:
+                cart.pop(item['product_id'], None)
+            change_cart_summary(self.cart_summaries.setdefault(order['user_id'], {}), 0, None, None)
+            self.apply_sales_changes(sales_changes)
+            return order, True
+    
+    # Sales Stats
+    def apply_sales_changes(self, changes):
+        # Nothing else writes while the lock is held, so the stats change with the order
+        with self.lock:
+            merge_sales_changes(self.sales_stats, changes)
+    
+    def get_sales_stats(self, kind, first=None, last=None):
+        with self.lock:
+            return sorted(
+                (dict(row) for (row_kind, bucket), row in self.sales_stats.items()
+                 if row_kind == kind and (first is None or bucket >= first) and (last is None or bucket <= last)),
+                key=lambda row: row['bucket']
+            )
+    
+    def get_top_sales(self, kind, limit):
+        with self.lock:
+            rows = [row for (row_kind, _), row in self.sales_stats.items() if row_kind == kind]
+            return [dict(row) for row in heapq.nlargest(limit, rows, key=lambda row: row['revenue'])]
+    
+    def replace_sales_stats(self, rows):
+        with self.lock:
+            self.sales_stats = {(row['kind'], row['bucket']): dict(row) for row in rows}
+    
+    # Notification Outbox
+    def claim_outbox_notification(self, notification_id, lease_seconds):
+        now = int(time.time())
+        with self.lock:
+            notification = self.outbox.get(notification_id)
+            if not notification or notification['lease_until'] >= now:
+                return False
+            notification['lease_until'] = now + lease_seconds
+            return True
+    
+    def get_expired_outbox_notifications(self):
+        now = int(time.time())
+        with self.lock:
+            return [dict(item) for item in self.outbox.values() if item['lease_until'] < now]
+    
+    def delete_outbox_notification(self, notification_id):
+        with self.lock:
+            self.outbox.pop(notification_id, None)
+
+# ==================== SQLITE ====================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    meta_key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    product_id TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_category_price ON products (category, price, product_id);
+CREATE TABLE IF NOT EXISTS cart_items (
+    user_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (user_id, product_id)
+);
+CREATE TABLE IF NOT EXISTS cart_summaries (
+    user_id TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_user_created ON orders (user_id, created_at);
+CREATE INDEX IF NOT EXISTS orders_status_created ON orders (status, created_at, order_id);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_item_id TEXT PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS order_items_order ON order_items (order_id);
+CREATE TABLE IF NOT EXISTS outbox (
+    notification_id TEXT PRIMARY KEY,
+    lease_until INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_lease ON outbox (lease_until);
+CREATE TABLE IF NOT EXISTS sales_stats (
+    kind TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    revenue INTEGER NOT NULL,
+    orders INTEGER NOT NULL,
+    units INTEGER NOT NULL,
+    label TEXT,
+    PRIMARY KEY (kind, bucket)
+);
+CREATE INDEX IF NOT EXISTS sales_stats_revenue ON sales_stats (kind, revenue);
+"""
+
+class SQLiteBackend(StorageBackend):
+    """SQLite engine for local runs and benchmarks.
+    
+    Each item is stored whole as JSON, next to the columns that are looked up or
+    sorted on; those columns carry the same indexes as the DynamoDB tables. WAL
+    mode lets several gunicorn workers share one database file.
+    """
+    
+    name = 'sqlite'
+    
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.conn.executescript(SQLITE_SCHEMA)
+    
+    @property
+    def conn(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front"""
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    
+    @staticmethod
+    def dumps(item):
+        return json.dumps(item, default=json_number)
+    
+    def fetch_one(self, sql, params=()):
+        row = self.conn.execute(sql, params).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def fetch_all(self, sql, params=()):
+        return [json.loads(row[0]) for row in self.conn.execute(sql, params)]
+    
+    @staticmethod
+    def placeholders(values):
+        return ', '.join('?' for _ in values)
+    
+    # Meta
+    def get_catalog_version(self):
+        row = self.conn.execute("SELECT version FROM meta WHERE meta_key = 'catalog_version'").fetchone()
+        return row[0] if row else 0
+    
+    def increment_catalog_version(self):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO meta (meta_key, version) VALUES ('catalog_version', 1) "
+                "ON CONFLICT (meta_key) DO UPDATE SET version = version + 1"
+            )
+            return conn.execute("SELECT version FROM meta WHERE meta_key = 'catalog_version'").fetchone()[0]
+    
+    # Users
+    def create_user(self, user):
+        try:
+            with self.transaction() as conn:
+                conn.execute(
+                    'INSERT INTO users (user_id, email, data) VALUES (?, ?, ?)',
+                    (user['user_id'], user['email'], self.dumps(user))
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError("Email already registered")
+    
+    def get_user_by_email(self, email):
+        return self.fetch_one('SELECT data FROM users WHERE email = ?', (email,))
+    
+    def get_user_by_id(self, user_id):
+        return self.fetch_one('SELECT data FROM users WHERE user_id = ?', (user_id,))
+    
+    def get_users_by_ids(self, user_ids):
+        user_ids = list(dict.fromkeys(user_ids))
+        users = self.fetch_all(
+            f'SELECT data FROM users WHERE user_id IN ({self.placeholders(user_ids)})', user_ids
+        )
+        return {user['user_id']: user for user in users}
+    
+    def update_user_password_hash(self, user_id, password_hash):
+        with self.transaction() as conn:
+            row = conn.execute('SELECT data FROM users WHERE user_id = ?', (user_id,)).fetchone()
+            if row:
+                user = json.loads(row[0])
+                user['password_hash'] = password_hash
+                conn.execute('UPDATE users SET data = ? WHERE user_id = ?', (self.dumps(user), user_id))
+    
+    # Products
+    def get_all_products(self):
+        return self.fetch_all('SELECT data FROM products')
+    
+    def get_products_by_category(self, category, cursor, limit):
+        def fetch(start_key, backwards, count):
+            order = 'DESC' if backwards else 'ASC'
+            if not start_key:
+                return self.fetch_all(
+                    f'SELECT data FROM products WHERE category = ? '
+                    f'ORDER BY price {order}, product_id {order} LIMIT ?',
+                    (category, count)
+                )
+            comparison = '<' if backwards else '>'
+            return self.fetch_all(
+                f'SELECT data FROM products WHERE category = ? AND (price, product_id) {comparison} (?, ?) '
+                f'ORDER BY price {order}, product_id {order} LIMIT ?',
+                (category, json_number(Decimal(start_key['price'])), start_key['product_id'], count)
+            )
+        return paginate_products(fetch, cursor, limit)
+    
+    def get_product_by_id(self, product_id):
+        return self.fetch_one('SELECT data FROM products WHERE product_id = ?', (product_id,))
+    
+    def get_products_by_ids(self, product_ids):
+        product_ids = list(dict.fromkeys(product_ids))
+        products = self.fetch_all(
+            f'SELECT data FROM products WHERE product_id IN ({self.placeholders(product_ids)})', product_ids
+        )
+        return {product['product_id']: product for product in products}
+    
+    def put_product(self, product):
+        with self.transaction() as conn:
+            self._put_product(conn, product)
+    
+    def _put_product(self, conn, product):
+        conn.execute(
+            'INSERT OR REPLACE INTO products (product_id, category, price, data) VALUES (?, ?, ?, ?)',
+            (product['product_id'], product['category'], product['price'], self.dumps(product))
+        )
+    
+    def update_product(self, product_id, fields):
+        with self.transaction() as conn:
+            row = conn.execute('SELECT data FROM products WHERE product_id = ?', (product_id,)).fetchone()
+            product = json.loads(row[0]) if row else {'product_id': product_id}
+            product.update(fields)
+            self._put_product(conn, product)
+    
+    def delete_product(self, product_id):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM products WHERE product_id = ?', (product_id,))
+    
+    # Cart
+    @staticmethod
+    def cart_item(row):
+        return {'user_id': row[0], 'product_id': row[1], 'quantity': row[2]}
+    
+    def get_cart_items(self, user_id):
+        rows = self.conn.execute(
+            'SELECT user_id, product_id, quantity FROM cart_items WHERE user_id = ?', (user_id,)
+        )
+        return [self.cart_item(row) for row in rows]
+    
+    def get_cart_item(self, user_id, product_id):
+        row = self.conn.execute(
+            'SELECT user_id, product_id, quantity FROM cart_items WHERE user_id = ? AND product_id = ?',
+            (user_id, product_id)
+        ).fetchone()
+        return self.cart_item(row) if row else None
+    
+    def _change_cart_summary(self, conn, user_id, quantity, price, catalog_version):
+        row = conn.execute('SELECT data FROM cart_summaries WHERE user_id = ?', (user_id,)).fetchone()
+        summary = json.loads(row[0]) if row else {}
+        change_cart_summary(summary, quantity, price, catalog_version)
+        conn.execute(
+            'INSERT OR REPLACE INTO cart_summaries (user_id, revision, data) VALUES (?, ?, ?)',
+            (user_id, summary['revision'], self.dumps(summary))
+        )
+    
+    def add_to_cart(self, user_id, product_id, quantity, price=None, catalog_version=None):
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity',
+                (user_id, product_id, quantity)
+            )
+            self._change_cart_summary(conn, user_id, quantity, price, catalog_version)
+    
+    def remove_from_cart(self, user_id, product_id, price=None, catalog_version=None):
+        with self.transaction() as conn:
+            row = conn.execute(
+                'SELECT quantity FROM cart_items WHERE user_id = ? AND product_id = ?', (user_id, product_id)
+            ).fetchone()
+            if row:
+                conn.execute('DELETE FROM cart_items WHERE user_id = ? AND product_id = ?', (user_id, product_id))
+                self._change_cart_summary(conn, user_id, -row[0], price, catalog_version)
+    
+    def get_cart_summary(self, user_id):
+        return self.fetch_one('SELECT data FROM cart_summaries WHERE user_id = ?', (user_id,))
+    
+    def save_cart_summary(self, user_id, summary, revision):
+        summary = dict(summary, revision=revision or 0)
+        with self.transaction() as conn:
+            if revision is None:
+                return conn.execute(
+                    'INSERT OR IGNORE INTO cart_summaries (user_id, revision, data) VALUES (?, ?, ?)',
+                    (user_id, 0, self.dumps(summary))
+                ).rowcount == 1
+            return conn.execute(
+                'UPDATE cart_summaries SET data = ? WHERE user_id = ? AND revision = ?',
+                (self.dumps(summary), user_id, revision)
+            ).rowcount == 1
+    
+    # Orders
+    def put_order(self, order):
+        with self.transaction() as conn:
+            self._put_order(conn, order)
+    
+    def _put_order(self, conn, order):
+        conn.execute(
+            'INSERT OR REPLACE INTO orders (order_id, user_id, status, created_at, data) VALUES (?, ?, ?, ?, ?)',
+            (order['order_id'], order['user_id'], order['status'], order['created_at'], self.dumps(order))
+        )
+    
+    def get_orders_by_user(self, user_id):
+        return self.fetch_all(
+            'SELECT data FROM orders WHERE user_id = ? ORDER BY created_at DESC', (user_id,)
+        )
+    
+    def get_orders_page(self, statuses, cursor, start_date, end_date, limit):
+        start_key, _ = decode_cursor(cursor)
+        low, high = order_date_bounds(start_date, end_date)
+        sql = (
+            f'SELECT data FROM orders WHERE status IN ({self.placeholders(statuses)}) '
+            'AND created_at BETWEEN ? AND ?'
+        )
+        params = list(statuses) + [low, high]
+        if start_key:
+            sql += ' AND (created_at, order_id) < (?, ?)'
+            params += [start_key['created_at'], start_key['order_id']]
+        sql += ' ORDER BY created_at DESC, order_id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        orders = self.fetch_all(sql, params)
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        next_cursor = encode_cursor(order_index_key(orders[-1]), 'next') if has_more else None
+        return orders, next_cursor
+    
+    def get_order_by_id(self, order_id):
+        return self.fetch_one('SELECT data FROM orders WHERE order_id = ?', (order_id,))
+    
+    def get_orders_by_ids(self, order_ids):
+        order_ids = list(dict.fromkeys(order_ids))
+        orders = self.fetch_all(f'SELECT data FROM orders WHERE order_id IN ({self.placeholders(order_ids)})', order_ids)
+        return {order['order_id']: order for order in orders}
+    
+    def update_order_status(self, order_id, status, expected_status=None, sales_changes=()):
+        with self.transaction() as conn:
+            row = conn.execute('SELECT data FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+            order = json.loads(row[0]) if row else None
+            if expected_status is not None and (not order or order['status'] != expected_status):
+                raise OrderStatusConflict(f"Order {order_id} is no longer {expected_status}")
+            if order:
+                order['status'] = status
+                self._put_order(conn, order)
+                self._apply_sales_changes(conn, sales_changes)
+    
+    # Order Items
+    def put_order_item(self, order_item):
+        with self.transaction() as conn:
+            self._put_order_item(conn, order_item)
+    
+    def _put_order_item(self, conn, order_item):
+        conn.execute(
+            'INSERT OR REPLACE INTO order_items (order_item_id, order_id, data) VALUES (?, ?, ?)',
+            (order_item['order_item_id'], order_item['order_id'], self.dumps(order_item))
+        )
+    
+    def get_order_items_by_order(self, order_id):
+        return self.fetch_all('SELECT data FROM order_items WHERE order_id = ?', (order_id,))
+    
+    def get_order_items_for_orders(self, orders):
+        items_by_order = {order['order_id']: [] for order in orders}
+        order_ids = list(items_by_order)
+        for item in self.fetch_all(
+            f'SELECT data FROM order_items WHERE order_id IN ({self.placeholders(order_ids)})', order_ids
+        ):
+            items_by_order[item['order_id']].append(item)
+        return items_by_order
+    
+    # Checkout
+    def checkout(self, order, order_items, cart_items, notification=None, sales_changes=()):
+        with self.transaction() as conn:
+            row = conn.execute('SELECT data FROM orders WHERE order_id = ?', (order['order_id'],)).fetchone()
+            if row:
+                return json.loads(row[0]), False
+            
+            for item in cart_items:
+                deleted = conn.execute(
+                    'DELETE FROM cart_items WHERE user_id = ? AND product_id = ? AND quantity = ?',
+                    (order['user_id'], item['product_id'], item['quantity'])
+                ).rowcount
+                if not deleted:
+                    raise ValueError("Your cart changed during checkout. Please review it and try again.")
+            
+            self._put_order(conn, order)
+            for order_item in order_items:
+                self._put_order_item(conn, order_item)
+            self._change_cart_summary(conn, order['user_id'], 0, None, None)
+            if notification:
+                conn.execute(
+                    'INSERT OR REPLACE INTO outbox (notification_id, lease_until, data) VALUES (?, ?, ?)',
+                    (notification['notification_id'], notification['lease_until'], self.dumps(notification))
+                )
+            self._apply_sales_changes(conn, sales_changes)
+        return order, True
+    
+    # Sales Stats
+    @staticmethod
+    def sales_stats_row(row):
+        stats = {'kind': row[0], 'bucket': row[1], 'revenue': row[2], 'orders': row[3], 'units': row[4]}
+        if row[5] is not None:
+            stats['label'] = row[5]
+        return stats
+    
+    def apply_sales_changes(self, changes):
+        with self.transaction() as conn:
+            self._apply_sales_changes(conn, changes)
+    
+    def _apply_sales_changes(self, conn, sales_changes):
+        # Orders and status changes call this inside their own transaction; SQLite
+        # serializes writers, so the shared rows never make them fail
+        conn.executemany(
+            'INSERT INTO sales_stats (kind, bucket, revenue, orders, units, label) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (kind, bucket) DO UPDATE SET revenue = revenue + excluded.revenue, '
+            'orders = orders + excluded.orders, units = units + excluded.units, label = COALESCE(excluded.label, label)',
+            [
+                (change['kind'], change['bucket'], change['revenue'], change['orders'], change['units'], change.get('label'))
+                for change in sales_changes
+            ]
+        )
+    
+    def get_sales_stats(self, kind, first=None, last=None):
+        rows = self.conn.execute(
+            'SELECT kind, bucket, revenue, orders, units, label FROM sales_stats '
+            'WHERE kind = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket',
+            (kind, first or '', last or '\uffff')
+        )
+        return [self.sales_stats_row(row) for row in rows]
+    
+    def get_top_sales(self, kind, limit):
+        rows = self.conn.execute(
+            'SELECT kind, bucket, revenue, orders, units, label FROM sales_stats '
+            'WHERE kind = ? ORDER BY revenue DESC LIMIT ?',
+            (kind, limit)
+        )
+        return [self.sales_stats_row(row) for row in rows]
+    
+    def replace_sales_stats(self, rows):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM sales_stats')
+            self._apply_sales_changes(conn, rows)
+    
+    # Notification Outbox
+    def claim_outbox_notification(self, notification_id, lease_seconds):
+        now = int(time.time())
+        with self.transaction() as conn:
+            return conn.execute(
+                'UPDATE outbox SET lease_until = ? WHERE notification_id = ? AND lease_until < ?',
+                (now + lease_seconds, notification_id, now)
+            ).rowcount == 1
+    
+    def get_expired_outbox_notifications(self):
+        rows = self.conn.execute(
+            'SELECT data, lease_until FROM outbox WHERE lease_until < ?', (int(time.time()),)
+        )
+        return [dict(json.loads(data), lease_until=lease_until) for data, lease_until in rows]
+    
+    def delete_outbox_notification(self, notification_id):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM outbox WHERE notification_id = ?', (notification_id,))
+
+# ==================== FACTORY ====================
+
+def create_backend(name, region=None, dynamodb_endpoint_url=None, sqlite_path='furnish_fusion.db',
+                   query_workers=8, max_connections=10, scan_segments=SCAN_SEGMENTS):
+    """Create the storage engine selected by name"""
+    if name == 'dynamodb':
+        return DynamoDBBackend(
+            region, endpoint_url=dynamodb_endpoint_url, query_workers=query_workers,
+            max_connections=max_connections, scan_segments=scan_segments
+        )
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown storage backend: {name}")
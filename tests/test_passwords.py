@@ -0,0 +1,111 @@
+"""
+Furnish Fusion - Password Hashing Tests
+Logins under normal concurrency must succeed, and the hashing limit must hold
+across processes, as it would across gunicorn workers.
+    python -m pytest tests
+"""
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, PasswordHashingBusy, HostSlots, hash_method
+
+TEST_PASSWORD = 'test-password'
+# Cheap enough to keep the tests quick
+TEST_METHOD = 'pbkdf2:sha256:1000'
+
+def hold_slot(path, ready):
+    """Take the only slot of path and keep it until killed"""
+    slots = HostSlots(path, 1)
+    slots.try_acquire()
+    ready.set()
+    time.sleep(60)
+
+class PasswordHasherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.slots_path = os.path.join(self.directory.name, 'slots')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sync_workers_may_all_wait(self):
+        # The sync default: one hash at a time, every other worker may wait for it
+        hasher = PasswordHasher(TEST_METHOD, 1, 3, 5, self.slots_path)
+        password_hash = hasher.hash(TEST_PASSWORD)
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda _: hasher.verify(password_hash, TEST_PASSWORD), range(4)))
+        self.assertEqual(results, [(True, None)] * 4)
+
+    def test_full_queue_is_refused(self):
+        hasher = PasswordHasher(TEST_METHOD, 1, 0, 5, self.slots_path)
+        slot = hasher.running.try_acquire()
+        with self.assertRaises(PasswordHashingBusy):
+            hasher.hash(TEST_PASSWORD)
+        hasher.running.release(slot)
+        self.assertEqual(hash_method(hasher.hash(TEST_PASSWORD)), TEST_METHOD)
+
+    def test_slots_are_shared_between_processes(self):
+        context = multiprocessing.get_context('spawn')
+        ready = context.Event()
+        holder = context.Process(target=hold_slot, args=(self.slots_path + '.running', ready))
+        holder.start()
+        try:
+            self.assertTrue(ready.wait(30))
+            hasher = PasswordHasher(TEST_METHOD, 1, 0, 5, self.slots_path)
+            with self.assertRaises(PasswordHashingBusy):
+                hasher.hash(TEST_PASSWORD)
+        finally:
+            holder.kill()
+            holder.join()
+        # The kernel frees the slot of a process that dies while holding it
+        self.assertEqual(hash_method(hasher.hash(TEST_PASSWORD)), TEST_METHOD)
+
+class LoginConcurrencyTest(unittest.TestCase):
+    """Simultaneous logins against the app with its default limits, as gevent workers
+    would send them; threads stand in for the greenlets"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ['STORAGE_BACKEND'] = 'memory'
+        os.environ['SERVING_MODE'] = 'async'
+        os.environ['PASSWORD_HASH_SLOTS_FILE'] = os.path.join(cls.directory.name, 'slots')
+        import aws_app
+        cls.app = aws_app.app
+        cls.app.config['TESTING'] = True
+        cls.emails = [f'user{number}@example.com' for number in range(8)]
+        password_hash = aws_app.hash_password(TEST_PASSWORD)
+        for email in cls.emails:
+            aws_app.create_user(email, email, password_hash)
+
+    @classmethod
+    def tearDownClass(cls):
+        aws_app = sys.modules['aws_app']
+        if aws_app.password_hasher.pool is not None:
+            aws_app.password_hasher.pool.shutdown()
+        cls.directory.cleanup()
+
+    def login(self, email):
+        with self.app.test_client() as client:
+            response = client.post('/login', data={'email': email, 'password': TEST_PASSWORD})
+            return response.status_code, response.headers.get('Location')
+
+    def test_simultaneous_logins_succeed(self):
+        with ThreadPoolExecutor(len(self.emails)) as pool:
+            results = list(pool.map(self.login, self.emails))
+        self.assertEqual(results, [(302, '/home')] * len(self.emails))
+
+if __name__ == '__main__':
+    unittest.main()